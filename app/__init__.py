@@ -1,27 +1,51 @@
 # Contenido para: app/__init__.py
 
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from .config import Config
+# La Base de Datos (db) y Migrate viven en app/extensiones.py. Se exponen
+# aquí (from app import db) pero se cargan recién al pedirlas: así
+# 'import app.engine' no arrastra Flask ni SQLAlchemy (modo librería).
 
-# Inicializamos la Base de Datos (db) y Migrate
-# Los declaramos aquí globalmente pero vacíos
-db = SQLAlchemy()
-migrate = Migrate()
+def __getattr__(nombre):
+    if nombre in ('db', 'migrate'):
+        from . import extensiones
+        return getattr(extensiones, nombre)
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
 
-def create_app(config_class=Config):
+def create_app(config_class=None):
     """Factory para crear la instancia de la aplicación Flask."""
-    
+    from flask import Flask
+    from .config import Config
+    from .extensiones import db, migrate
+
     app = Flask(__name__)
+    config_class = config_class or Config
     
     # Cargar la configuración desde la clase Config
     app.config.from_object(config_class)
 
+    # Con un pool de tamaño fijo (PostgreSQL) usamos el pool instrumentado,
+    # que mide la espera de checkout para /api/metrics/pool
+    opciones_bd = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    if 'pool_size' in opciones_bd:
+        from .pool import PoolInstrumentado
+        opciones_bd.setdefault('poolclass', PoolInstrumentado)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opciones_bd
+
     # Conectar nuestras instancias (db, migrate) con la app
     db.init_app(app)
     migrate.init_app(app, db)
 
+    # Backend compartido para el estado de las simulaciones (ver app/estado.py)
+    from .estado import crear_backend
+    app.extensions['estado_simulaciones'] = crear_backend(app.config)
+
+    # Cache de resultados de carreras repetidas (None si está desactivada)
+    from .cache_resultados import crear_cache
+    app.extensions['cache_resultados'] = crear_cache(app.config)
+
+    # Medición precisa de memoria por simulación (solo debug / MEMORIA_TRACEMALLOC)
+    from .memoria import iniciar_tracemalloc
+    iniciar_tracemalloc(app)
+
     # --- Registrar Blueprints (nuestras rutas/endpoints) ---
     # Importamos nuestro blueprint de rutas
     from .routes import api_bp
@@ -0,0 +1,94 @@
+# Contenido para: app/barrido.py
+
+import itertools
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from app.engine import ParametrosBalanceo
+from app.datos_carrera import cargar_desde_bd
+from app.lotes import inicializar_worker, simular_carrera
+
+# --- BARRIDOS DE PARÁMETROS DE BALANCEO ---
+# Evalúa muchos juegos de ParametrosBalanceo (una grilla o una muestra
+# aleatoria) en varios circuitos y semillas, repartiendo el trabajo en
+# procesos. Para cada juego devuelve métricas de "diversión":
+#  - tasa_dnf: abandonos / pilotos que largaron
+#  - adelantamientos_por_carrera
+#  - gap_medio_s: segundos entre ganador y último clasificado (dispersión)
+#  - pole_a_victoria: fracción de carreras que gana quien sale primero
+
+
+def grilla(espacio):
+    """{"mod_drs": [4, 8], "k_fuel_penalty": [0.01, 0.02]} -> lista de dicts (producto)."""
+    nombres = sorted(espacio)
+    return [dict(zip(nombres, valores)) for valores in itertools.product(*(espacio[n] for n in nombres))]
+
+
+def muestreo_aleatorio(rangos, n, semilla=None):
+    """{"mod_drs": (2, 12), ...} -> n dicts con valores uniformes en cada rango."""
+    rng = random.Random(semilla)
+    nombres = sorted(rangos)
+    return [{nombre: rng.uniform(*rangos[nombre]) for nombre in nombres} for _ in range(n)]
+
+
+def _evaluar(indice, overrides, datos, semillas, modo_sectores):
+    """Tarea de un worker: un juego de parámetros en un circuito (sus datos), varias semillas."""
+    params = ParametrosBalanceo.desde_dict(overrides)
+    parcial = {"carreras": 0, "pilotos": 0, "dnf": 0, "adelantamientos": 0,
+               "gap_total": 0.0, "con_gap": 0, "pole_gana": 0}
+    for semilla in semillas:
+        _, resumen = simular_carrera(datos, semilla=semilla, params=params, modo_sectores=modo_sectores)
+        parcial["carreras"] += 1
+        parcial["pilotos"] += resumen["pilotos"]
+        parcial["dnf"] += resumen["dnf"]
+        parcial["adelantamientos"] += resumen["adelantamientos"]
+        if resumen["gap_ganador_ultimo"] is not None:
+            parcial["gap_total"] += resumen["gap_ganador_ultimo"]
+            parcial["con_gap"] += 1
+        if resumen["parrilla"] and resumen["ganador_id"] == resumen["parrilla"][0]:
+            parcial["pole_gana"] += 1
+    return indice, parcial
+
+
+def _metricas(total):
+    carreras = total["carreras"] or 1
+    return {
+        "carreras": total["carreras"],
+        "tasa_dnf": total["dnf"] / total["pilotos"] if total["pilotos"] else 0.0,
+        "adelantamientos_por_carrera": total["adelantamientos"] / carreras,
+        "gap_medio_s": total["gap_total"] / total["con_gap"] if total["con_gap"] else None,
+        "pole_a_victoria": total["pole_gana"] / carreras,
+    }
+
+
+def ejecutar_barrido(configuraciones, circuitos, semillas, procesos=None, modo_sectores=False):
+    """
+    Evalúa cada dict de 'configuraciones' (overrides de ParametrosBalanceo)
+    en todos los 'circuitos' con todas las 'semillas', en 'procesos' procesos.
+    Los datos de cada circuito se cargan de la BD aquí, una sola vez.
+    Devuelve [{"parametros": {...}, "metricas": {...}}, ...] en el mismo orden.
+    """
+    # Validamos antes de lanzar procesos: un nombre mal escrito falla ya
+    for overrides in configuraciones:
+        ParametrosBalanceo.desde_dict(overrides)
+
+    datos = {circuito_id: cargar_desde_bd(circuito_id) for circuito_id in circuitos}
+
+    campos = ("carreras", "pilotos", "dnf", "adelantamientos", "gap_total", "con_gap", "pole_gana")
+    totales = [dict.fromkeys(campos, 0) for _ in configuraciones]
+
+    with ProcessPoolExecutor(max_workers=procesos, initializer=inicializar_worker) as pool:
+        futuros = [
+            pool.submit(_evaluar, i, overrides, datos[circuito_id], list(semillas), modo_sectores)
+            for i, overrides in enumerate(configuraciones)
+            for circuito_id in circuitos
+        ]
+        for futuro in futuros:
+            indice, parcial = futuro.result()
+            for campo in campos:
+                totales[indice][campo] += parcial[campo]
+
+    return [
+        {"parametros": overrides, "metricas": _metricas(total)}
+        for overrides, total in zip(configuraciones, totales)
+    ]
@@ -0,0 +1,141 @@
+# Contenido para: app/cache_http.py
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, has_app_context, make_response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models import Equipo, Piloto, Coche, Staff, Circuito
+
+# --- CACHÉ HTTP DE DATOS DE REFERENCIA ---
+# Equipos, pilotos, coches, staff y circuitos casi nunca cambian. Cada
+# respuesta de la API de lectura lleva un ETag derivado de la "versión de
+# datos" (guardada en el backend de estado compartido) y de la URL pedida:
+#  - Si el cliente manda If-None-Match con ese ETag -> 304, sin tocar la BD.
+#  - Si no, se sirve desde una caché en memoria del worker mientras la
+#    versión no cambie; solo el primer pedido de cada URL consulta la BD.
+# La versión se incrementa al hacer commit de cualquier cambio en esas tablas.
+#
+# Límite: solo ven ese incremento los workers que comparten el backend de
+# estado (sqlite/redis) y solo para commits hechos desde la app. Con el
+# backend 'memoria' y varios workers, o con cambios hechos por fuera
+# (seed.py, 'flask importar' en otra máquina, psql), la versión no cambia.
+# Por eso el ETag y la caché también cambian cada CACHE_TTL_REFERENCIA
+# segundos (ventanas de tiempo iguales en todos los workers): un dato
+# cambiado por fuera se ve, como mucho, ese tiempo tarde.
+
+MODELOS_REFERENCIA = (Equipo, Piloto, Coche, Staff, Circuito)
+MAX_RESPUESTAS_CACHEADAS = 256
+
+_cache_respuestas = OrderedDict() # {clave: cuerpo (bytes)}
+_lock_cache = threading.Lock()
+
+
+def _obtener_backend():
+    return current_app.extensions['estado_simulaciones']
+
+
+# --- Detección de cambios (eventos de SQLAlchemy) ---
+
+@event.listens_for(Session, 'after_flush')
+def _marcar_cambios_referencia(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, MODELOS_REFERENCIA):
+            session.info['referencia_modificada'] = True
+            return
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _marcar_cambios_masivos(orm_execute_state):
+    # query(...).delete() / update() y los insert masivos no pasan por el flush
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, MODELOS_REFERENCIA):
+        orm_execute_state.session.info['referencia_modificada'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _incrementar_version(session):
+    if session.info.pop('referencia_modificada', False) and has_app_context():
+        _obtener_backend().incrementar_version_datos()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_cambios(session):
+    session.info.pop('referencia_modificada', None)
+
+
+# --- Decorador para las vistas de lectura ---
+
+def respuesta_cacheable(vista):
+    """
+    Envuelve una vista GET de datos de referencia con ETag, Cache-Control
+    y caché de respuestas por versión de datos.
+    """
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        version = _obtener_backend().obtener_version_datos()
+        ttl = current_app.config.get('CACHE_TTL_REFERENCIA', 0)
+        ventana = int(time.time() // ttl) if ttl else 0
+        clave = f"{version}:{ventana}:{request.full_path}"
+        etag = hashlib.sha1(clave.encode()).hexdigest()
+        max_age = current_app.config.get('CACHE_MAX_AGE_REFERENCIA', 60)
+
+        if etag in request.if_none_match:
+            respuesta = make_response('', 304)
+        else:
+            with _lock_cache:
+                cuerpo = _cache_respuestas.get(clave)
+                if cuerpo is not None:
+                    _cache_respuestas.move_to_end(clave)
+
+            if cuerpo is None:
+                respuesta = make_response(vista(*args, **kwargs))
+                if respuesta.status_code != 200:
+                    return respuesta # Los errores no se cachean
+                _guardar_respuesta(clave, respuesta.get_data())
+            else:
+                respuesta = make_response(cuerpo, 200)
+                respuesta.mimetype = 'application/json'
+
+        respuesta.set_etag(etag)
+        respuesta.headers['Cache-Control'] = f"public, max-age={max_age}"
+        return respuesta
+    return envoltura
+
+
+def _guardar_respuesta(clave, cuerpo):
+    with _lock_cache:
+        _cache_respuestas[clave] = cuerpo
+        _cache_respuestas.move_to_end(clave)
+        while len(_cache_respuestas) > MAX_RESPUESTAS_CACHEADAS:
+            _cache_respuestas.popitem(last=False) # Sale la menos usada
+
+
+# --- Helpers de paginación y filtrado de campos ---
+
+def leer_paginacion(por_defecto=20, maximo=100):
+    """Lee ?page=&per_page= (page empieza en 1). Devuelve (page, per_page)."""
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', por_defecto, type=int), 1), maximo)
+    return page, per_page
+
+
+def leer_campos():
+    """Lee ?fields=a,b,c. Devuelve un set, o None si se piden todos."""
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    return {f.strip() for f in fields.split(',') if f.strip()}
+
+
+def filtrar_campos(datos, campos):
+    if campos is None:
+        return datos
+    return {k: v for k, v in datos.items() if k in campos or k == 'id'}
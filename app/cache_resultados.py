@@ -0,0 +1,207 @@
+# Contenido para: app/cache_resultados.py
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# --- CACHE DE RESULTADOS DE CARRERAS ---
+# El motor es determinista: mismos datos (circuito, pilotos, coches), misma
+# semilla, mismas órdenes y mismos parámetros => misma carrera. Así que el
+# resultado se guarda bajo un hash de esas entradas (direccionado por
+# contenido) y una petición repetida no vuelve a correr la carrera.
+#  - Nivel 1: en memoria, LRU acotado por bytes (CACHE_RESULTADOS_MB).
+#  - Nivel 2 (opcional): en disco, un archivo por clave en
+#    CACHE_RESULTADOS_DIR, acotado por CACHE_RESULTADOS_DISCO_MB (se borran
+#    los usados hace más tiempo). Lo comparten todos los workers de la máquina.
+# La clave usa la huella de los datos cargados (SimulationEngine.huella_datos),
+# no un número de versión: si cambia un stat, cambia la clave, y las entradas
+# viejas simplemente dejan de usarse hasta que se desalojan.
+
+# Cada cuántas escrituras se vuelve a medir el disco de verdad (lo que
+# escriben otros workers no entra en el total que lleva este proceso)
+RECUENTO_DISCO_ESCRITURAS = 256
+
+# Súbelo si cambia el motor de forma que la misma entrada dé otra carrera
+VERSION_MOTOR = 3
+
+
+def clave_carrera(engine, tipo, comandos=None, **extra):
+    """
+    Clave (sha256 hex) de una carrera aún no corrida. 'tipo' separa los
+    distintos valores que se guardan de la misma carrera (estado final,
+    registro de lote...); 'extra' suma opciones que cambian ese valor.
+    """
+    entradas = {
+        "version": VERSION_MOTOR,
+        "tipo": tipo,
+        "datos": engine.huella_datos(),
+        "semilla": engine.semilla,
+        "comandos": sorted([list(c) for c in comandos or []], key=repr),
+        "params": engine.params.a_dict(),
+        "modo_sectores": engine.modo_sectores,
+        "extra": extra,
+    }
+    return hashlib.sha256(json.dumps(entradas, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class CacheResultados:
+    """Cache de dos niveles (memoria LRU + disco) de valores en bytes."""
+
+    def __init__(self, max_bytes_memoria, directorio=None, max_bytes_disco=0):
+        self.max_bytes_memoria = max_bytes_memoria
+        self.directorio = directorio
+        self.max_bytes_disco = max_bytes_disco
+        self._memoria = OrderedDict() # clave -> bytes, del menos al más usado
+        self._bytes_memoria = 0
+        self._lock = threading.Lock()
+        self._bytes_disco = None # Total estimado en disco (None = sin medir aún)
+        self._escrituras_disco = 0
+        self.aciertos = 0
+        self.fallos = 0
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+    # --- Memoria ---
+
+    def _guardar_en_memoria(self, clave, datos):
+        if len(datos) > self.max_bytes_memoria:
+            return # No entra: que no desaloje todo lo demás
+        anterior = self._memoria.pop(clave, None)
+        if anterior is not None:
+            self._bytes_memoria -= len(anterior)
+        self._memoria[clave] = datos
+        self._bytes_memoria += len(datos)
+        while self._bytes_memoria > self.max_bytes_memoria:
+            _, desalojado = self._memoria.popitem(last=False)
+            self._bytes_memoria -= len(desalojado)
+
+    # --- Disco ---
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave[:2], clave)
+
+    def _leer_de_disco(self, clave):
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, 'rb') as f:
+                datos = f.read()
+            os.utime(ruta) # Para el LRU del disco
+            return datos
+        except OSError:
+            return None
+
+    def _guardar_en_disco(self, clave, datos):
+        ruta = self._ruta(clave)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        # Escritura atómica: otro worker nunca ve un archivo a medias
+        descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta))
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(datos)
+            os.replace(temporal, ruta)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal) # Falló antes del replace: no dejar basura
+        self._contar_escritura(len(datos))
+
+    def _contar_escritura(self, tamano):
+        """
+        Lleva el total en disco sin recorrer el directorio en cada escritura:
+        solo se recorre (y se recorta) al pasar el límite o cada
+        RECUENTO_DISCO_ESCRITURAS escrituras.
+        """
+        if not self.max_bytes_disco:
+            return
+        with self._lock:
+            self._escrituras_disco += 1
+            if self._bytes_disco is not None:
+                self._bytes_disco += tamano
+            medir = (self._bytes_disco is None or self._bytes_disco > self.max_bytes_disco
+                     or self._escrituras_disco % RECUENTO_DISCO_ESCRITURAS == 0)
+        if medir:
+            total = self._recortar_disco()
+            with self._lock:
+                self._bytes_disco = total
+
+    def _recortar_disco(self):
+        """
+        Borra los archivos usados hace más tiempo hasta entrar en el límite.
+        Devuelve los bytes que quedan en disco.
+        """
+        archivos = []
+        for raiz, _, nombres in os.walk(self.directorio):
+            for nombre in nombres:
+                try:
+                    info = os.stat(os.path.join(raiz, nombre))
+                except OSError:
+                    continue # Lo borró otro worker
+                archivos.append((info.st_mtime, info.st_size, os.path.join(raiz, nombre)))
+        total = sum(tamano for _, tamano, _ in archivos)
+        for _, tamano, ruta in sorted(archivos):
+            if total <= self.max_bytes_disco:
+                break
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+            total -= tamano
+        return total
+
+    # --- API ---
+
+    def obtener(self, clave):
+        """Valor guardado (bytes) o None. Lo encontrado en disco sube a memoria."""
+        with self._lock:
+            datos = self._memoria.get(clave)
+            if datos is not None:
+                self._memoria.move_to_end(clave)
+                self.aciertos += 1
+                return datos
+
+        datos = self._leer_de_disco(clave) if self.directorio else None
+        with self._lock:
+            if datos is None:
+                self.fallos += 1
+                return None
+            self._guardar_en_memoria(clave, datos)
+            self.aciertos += 1
+        return datos
+
+    def guardar(self, clave, datos):
+        with self._lock:
+            self._guardar_en_memoria(clave, datos)
+        if self.directorio:
+            self._guardar_en_disco(clave, datos)
+
+    def obtener_json(self, clave):
+        datos = self.obtener(clave)
+        return json.loads(datos) if datos is not None else None
+
+    def guardar_json(self, clave, valor):
+        self.guardar(clave, json.dumps(valor, ensure_ascii=False).encode())
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "entradas_memoria": len(self._memoria),
+                "bytes_memoria": self._bytes_memoria,
+                "max_bytes_memoria": self.max_bytes_memoria,
+                "directorio": self.directorio,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+            }
+
+
+def crear_cache(config):
+    """Cache según la config; None si CACHE_RESULTADOS_MB es 0 (desactivada)."""
+    mb = config.get('CACHE_RESULTADOS_MB', 0)
+    if not mb:
+        return None
+    return CacheResultados(
+        int(mb * 1024 * 1024),
+        config.get('CACHE_RESULTADOS_DIR'),
+        int(config.get('CACHE_RESULTADOS_DISCO_MB', 0) * 1024 * 1024),
+    )
@@ -0,0 +1,170 @@
+# Contenido para: app/carga_masiva.py
+
+import csv
+import io
+import json
+import os
+from sqlalchemy import Boolean, Float, Integer, func, insert, text
+from app import db
+from app.models import Equipo, Piloto, Coche, Staff, Circuito
+
+# --- CARGA MASIVA DE DATOS ---
+# Importa filas en streaming (CSV o JSONL) por lotes:
+#  - PostgreSQL (psycopg2): COPY ... FROM STDIN, lo más rápido que hay.
+#  - Otras bases: INSERT con executemany.
+# Cada lote se confirma con su propio commit, así la memoria no crece con
+# el tamaño del archivo y un error solo pierde el lote en curso.
+
+# Tablas importables, en orden de dependencias (claves foráneas)
+MODELOS_POR_TABLA = {
+    'equipos': Equipo,
+    'coches': Coche,
+    'pilotos': Piloto,
+    'staff': Staff,
+    'circuitos': Circuito,
+}
+
+TAM_LOTE_POR_DEFECTO = 5000
+
+
+FORMATOS = ('.csv', '.jsonl')
+
+
+def leer_filas(ruta):
+    """
+    Lee un archivo .csv o .jsonl fila a fila (dicts), sin cargarlo entero.
+    El formato sale de la extensión (sin distinguir mayúsculas); otra
+    extensión es un ValueError, antes de empezar a leer.
+    """
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension not in FORMATOS:
+        raise ValueError(f"Formato no soportado: '{extension}' (usar {' o '.join(FORMATOS)})")
+    return _leer_filas(ruta, extension)
+
+
+def _leer_filas(ruta, extension):
+    with open(ruta, newline='', encoding='utf-8') as f:
+        if extension == '.csv':
+            for fila in csv.DictReader(f):
+                yield fila
+        else:
+            for linea in f:
+                if linea.strip():
+                    yield json.loads(linea)
+
+
+def _conversores(modelo):
+    """Convierte los valores de texto del CSV al tipo de cada columna."""
+    conversores = {}
+    for columna in modelo.__table__.columns:
+        if isinstance(columna.type, Integer):
+            conversores[columna.name] = int
+        elif isinstance(columna.type, Float):
+            conversores[columna.name] = float
+        elif isinstance(columna.type, Boolean):
+            conversores[columna.name] = lambda v: str(v).lower() in ('1', 'true', 't', 'si')
+    return conversores
+
+
+def _normalizar(fila, columnas, conversores):
+    normalizada = {}
+    for clave, valor in fila.items():
+        if clave not in columnas:
+            continue # Ignoramos columnas que el modelo no tiene
+        if valor == '' or valor is None:
+            valor = None
+        elif clave in conversores and isinstance(valor, str):
+            valor = conversores[clave](valor)
+        normalizada[clave] = valor
+    return normalizada
+
+
+def importar(modelo, filas, tam_lote=TAM_LOTE_POR_DEFECTO):
+    """
+    Inserta un iterable de filas (dicts) en la tabla de 'modelo', por lotes.
+    Devuelve cuántas filas se insertaron. Necesita un app_context.
+    """
+    columnas = {c.name for c in modelo.__table__.columns}
+    conversores = _conversores(modelo)
+    usar_copy = _soporta_copy()
+
+    total = 0
+    con_ids = False
+    lote = []
+    for fila in filas:
+        lote.append(_normalizar(fila, columnas, conversores))
+        con_ids = con_ids or lote[-1].get('id') is not None
+        if len(lote) >= tam_lote:
+            total += _insertar_lote(modelo, lote, usar_copy)
+            lote = []
+    if lote:
+        total += _insertar_lote(modelo, lote, usar_copy)
+
+    # Con ids explícitos (COPY o INSERT), la secuencia de PostgreSQL no avanza sola
+    if con_ids and db.engine.dialect.name == 'postgresql':
+        _sincronizar_secuencia(modelo)
+    return total
+
+
+def _soporta_copy():
+    return db.engine.dialect.name == 'postgresql' and db.engine.dialect.driver == 'psycopg2'
+
+
+def _insertar_lote(modelo, lote, usar_copy):
+    try:
+        if usar_copy:
+            _copy_lote(modelo, lote)
+        else:
+            db.session.execute(insert(modelo), lote)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(lote)
+
+
+def _copy_lote(modelo, lote):
+    """
+    COPY de un lote (PostgreSQL). COPY no pasa por SQLAlchemy: a una fila sin
+    una columna se le pone el default del modelo, igual que por el ORM (y no
+    un NULL). Las que igual faltan (sin default escalar) van en otro COPY sin
+    esa columna, para que la base aplique su server_default.
+    """
+    defaults = {
+        c.name: c.default.arg for c in modelo.__table__.columns
+        if c.default is not None and c.default.is_scalar
+    }
+    grupos = {}
+    for fila in lote:
+        fila = {**{k: v for k, v in defaults.items() if k not in fila}, **fila}
+        grupos.setdefault(tuple(sorted(fila)), []).append(fila)
+
+    cursor = db.session.connection().connection.cursor()
+    for columnas, filas in grupos.items():
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        for fila in filas:
+            # En formato CSV de COPY, un campo vacío sin comillas es NULL
+            escritor.writerow(['' if fila[c] is None else fila[c] for c in columnas])
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY {modelo.__tablename__} ({', '.join(columnas)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    # COPY no pasa por el ORM: avisamos a la caché HTTP de que hubo cambios
+    db.session.info['referencia_modificada'] = True
+
+
+def _sincronizar_secuencia(modelo):
+    """Tras insertar ids explícitos, avanza la secuencia de 'id' de PostgreSQL."""
+    tabla = modelo.__tablename__
+    db.session.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{tabla}', 'id'), "
+        f"COALESCE((SELECT MAX(id) FROM {tabla}), 1))"
+    ))
+    db.session.commit()
+
+
+def siguiente_id(modelo):
+    """Primer id libre de una tabla (para generar filas con ids explícitos)."""
+    return (db.session.query(func.max(modelo.id)).scalar() or 0) + 1
@@ -0,0 +1,97 @@
+# Contenido para: app/codificacion.py
+
+import gzip
+import json
+
+from flask import Response, current_app, request
+
+# --- CODIFICACIÓN NEGOCIADA DE RESPUESTAS GRANDES ---
+# El estado de una carrera repite las mismas claves largas para cada piloto.
+# Según el header Accept, se responde en:
+#  - application/json (por defecto): exactamente los bytes de jsonify.
+#  - application/vnd.f1.compacto+json: JSON posicional. La lista de pilotos
+#    va como arrays, con los nombres de los campos una sola vez en
+#    "campos_piloto", y los decimales redondeados a milésimas.
+#  - application/msgpack: MessagePack del JSON normal (paquete opcional
+#    'msgpack'; si no está instalado, no se ofrece).
+# Y según Accept-Encoding, si el cuerpo pasa de COMPRESION_MIN_BYTES, se
+# comprime con brotli (paquete opcional 'brotli') o gzip.
+
+try:
+    import msgpack
+except ImportError: # Opcional
+    msgpack = None
+
+try:
+    import brotli
+except ImportError: # Opcional
+    brotli = None
+
+TIPO_JSON = 'application/json'
+TIPO_COMPACTO = 'application/vnd.f1.compacto+json'
+TIPO_MSGPACK = 'application/msgpack'
+
+DECIMALES_COMPACTO = 3
+
+
+def tipos_disponibles():
+    """Tipos que se pueden ofrecer, en orden de preferencia ante un empate."""
+    tipos = [TIPO_JSON, TIPO_COMPACTO]
+    if msgpack is not None:
+        tipos.append(TIPO_MSGPACK)
+    return tipos
+
+
+def _redondear(valor):
+    return round(valor, DECIMALES_COMPACTO) if isinstance(valor, float) else valor
+
+
+def a_compacto(datos):
+    """
+    Pasa cada lista de dicts homogéneos (p. ej. "pilotos") a arrays
+    posicionales, con sus claves en "campos_<nombre>" (p. ej. "campos_piloto").
+    """
+    resultado = {}
+    for clave, valor in datos.items():
+        if isinstance(valor, list) and valor and all(isinstance(v, dict) for v in valor):
+            campos = list(valor[0])
+            resultado[f"campos_{clave.rstrip('s')}"] = campos
+            resultado[clave] = [[_redondear(fila.get(c)) for c in campos] for fila in valor]
+        else:
+            resultado[clave] = _redondear(valor)
+    return resultado
+
+
+def _codificar(datos, tipo):
+    if tipo == TIPO_MSGPACK:
+        return msgpack.packb(datos, use_bin_type=True)
+    if tipo == TIPO_COMPACTO:
+        return json.dumps(a_compacto(datos), ensure_ascii=False, separators=(',', ':')).encode()
+    # El JSON de siempre (mismo proveedor que jsonify): no cambia para los clientes existentes
+    return current_app.json.response(datos).get_data()
+
+
+def _comprimir(cuerpo):
+    """(cuerpo, Content-Encoding o None) según Accept-Encoding y el tamaño."""
+    if len(cuerpo) < current_app.config.get('COMPRESION_MIN_BYTES', 1024):
+        return cuerpo, None
+    ofrecidas = (['br'] if brotli is not None else []) + ['gzip']
+    codificacion = request.accept_encodings.best_match(ofrecidas)
+    if codificacion == 'br':
+        return brotli.compress(cuerpo, quality=5), 'br'
+    if codificacion == 'gzip':
+        return gzip.compress(cuerpo, compresslevel=6), 'gzip'
+    return cuerpo, None
+
+
+def respuesta_negociada(datos, status=200):
+    """Response con 'datos' en el formato y la compresión que pidió el cliente."""
+    tipo = request.accept_mimetypes.best_match(tipos_disponibles(), default=TIPO_JSON)
+    cuerpo, codificacion = _comprimir(_codificar(datos, tipo))
+
+    respuesta = Response(cuerpo, status=status, content_type=tipo)
+    if codificacion:
+        respuesta.headers['Content-Encoding'] = codificacion
+    respuesta.vary.add('Accept')
+    respuesta.vary.add('Accept-Encoding')
+    return respuesta
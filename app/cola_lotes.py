@@ -0,0 +1,384 @@
+# Contenido para: app/cola_lotes.py
+
+import functools
+import json
+import os
+import socket
+import time
+
+from sqlalchemy import and_, or_, update
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.datos_carrera import cargar_desde_bd
+from app.lotes import simular_carrera
+from app.models import TrabajoLote, ChunkLote
+
+# --- COLA DURABLE DE LOTES DE SIMULACIÓN ---
+# Un lote (TrabajoLote) de muchas carreras se parte en chunks (ChunkLote):
+# un circuito y un rango de semillas cada uno. Los chunks viven en la BD
+# (SQLite o PostgreSQL, sin servicios externos) y cualquier cantidad de
+# workers ('flask worker-lotes', en esta u otras máquinas) los toman así:
+#  1. Reclamar: UPDATE ... WHERE id = :candidato AND (sigue libre). Si el
+#     UPDATE tocó una fila, el chunk es nuestro; si no, otro ganó: siguiente.
+#     Funciona igual en SQLite y PostgreSQL, sin SELECT ... FOR UPDATE SKIP LOCKED.
+#  2. Lease: el chunk es del worker hasta 'lease_hasta'; se renueva entre
+#     carreras, una vez por tercio de lease (no tras cada carrera: con muchos
+#     workers sobre SQLite, una escritura por carrera se pelea el lock de la
+#     base). Si el worker muere, el lease vence y otro worker lo retoma.
+#  3. Completar: en UNA transacción se marca el chunk como hecho (solo si el
+#     lease sigue siendo nuestro) y se suma su agregado parcial al del
+#     trabajo, bloqueando la fila del trabajo (with_for_update; en SQLite,
+#     el UPDATE del chunk ya tomó el lock de escritura de la base). Así un
+#     chunk nunca se cuenta dos veces, aunque se haya corrido dos veces.
+#  4. Un chunk que falla vuelve a la cola hasta LOTES_MAX_INTENTOS; después
+#     queda 'fallido' y el trabajo termina 'terminado_con_errores'.
+# Los leases usan el reloj de los workers (epoch): las máquinas tienen que
+# tener la hora sincronizada (NTP), con un margen mucho menor que el lease.
+# En SQLite, una escritura puede encontrar la base bloqueada por otro worker
+# más allá del busy timeout ("database is locked"): las transacciones de la
+# cola se reintentan con backoff (todas son seguras de repetir: cada UPDATE
+# vuelve a comprobar que el chunk siga libre o siga siendo nuestro).
+
+REINTENTOS_BLOQUEO = 5
+ESPERA_BLOQUEO_BASE = 0.1 # Segundos; se duplica en cada reintento
+
+
+def _reintentar_si_bloqueada(funcion):
+    """Repite la transacción si la base está bloqueada (SQLite con varios workers)."""
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        for intento in range(REINTENTOS_BLOQUEO + 1):
+            try:
+                return funcion(*args, **kwargs)
+            except OperationalError as e:
+                db.session.rollback()
+                if 'locked' not in str(e).lower() or intento == REINTENTOS_BLOQUEO:
+                    raise
+                time.sleep(ESPERA_BLOQUEO_BASE * 2 ** intento)
+    return envoltura
+
+
+def nombre_worker():
+    """Identificador de este proceso worker: host:pid."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# --- Agregados parciales ---
+
+def agregado_vacio():
+    return {"carreras": 0, "adelantamientos": 0, "dnf": 0, "pilotos": {}}
+
+
+def sumar_carrera(agregado, resumen):
+    """Suma el resumen de una carrera (lotes.resumir_carrera) al agregado."""
+    agregado["carreras"] += 1
+    agregado["adelantamientos"] += resumen["adelantamientos"]
+    agregado["dnf"] += resumen["dnf"]
+    clasificados = resumen["pilotos"] - resumen["dnf"]
+    for posicion, piloto_id in enumerate(resumen["clasificacion"], start=1):
+        datos = agregado["pilotos"].setdefault(
+            str(piloto_id), {"carreras": 0, "victorias": 0, "podios": 0, "dnf": 0, "suma_posiciones": 0})
+        datos["carreras"] += 1
+        if posicion > clasificados:
+            datos["dnf"] += 1 # Los abandonos quedan al final de la clasificación
+            continue
+        datos["suma_posiciones"] += posicion
+        datos["victorias"] += posicion == 1
+        datos["podios"] += posicion <= 3
+
+
+def combinar_agregados(total, parcial):
+    """Suma 'parcial' dentro de 'total' (los dos con el formato de agregado_vacio)."""
+    for campo in ("carreras", "adelantamientos", "dnf"):
+        total[campo] += parcial[campo]
+    for piloto_id, datos in parcial["pilotos"].items():
+        acumulado = total["pilotos"].setdefault(piloto_id, dict.fromkeys(datos, 0))
+        for campo, valor in datos.items():
+            acumulado[campo] += valor
+    return total
+
+
+def metricas_agregado(agregado):
+    """Probabilidades por piloto a partir de los conteos del agregado."""
+    pilotos = []
+    for piloto_id, datos in agregado["pilotos"].items():
+        n = datos["carreras"]
+        terminadas = n - datos["dnf"]
+        pilotos.append({
+            "piloto_id": int(piloto_id),
+            "carreras": n,
+            "prob_victoria": datos["victorias"] / n,
+            "prob_podio": datos["podios"] / n,
+            "prob_dnf": datos["dnf"] / n,
+            "posicion_media": datos["suma_posiciones"] / terminadas if terminadas else None,
+        })
+    pilotos.sort(key=lambda p: p["prob_victoria"], reverse=True)
+    carreras = agregado["carreras"] or 1
+    return {
+        "carreras": agregado["carreras"],
+        "adelantamientos_por_carrera": agregado["adelantamientos"] / carreras,
+        "dnf_por_carrera": agregado["dnf"] / carreras,
+        "pilotos": pilotos,
+    }
+
+
+# --- Encolar ---
+
+def crear_trabajo(circuitos, carreras, tam_chunk, lista_id=None, params=None, modo_sectores=False,
+                  semilla_inicial=0):
+    """
+    Crea el trabajo y sus chunks: 'carreras' semillas por circuito, partidas
+    en chunks de 'tam_chunk' carreras. Devuelve el TrabajoLote (ya guardado).
+    """
+    parametros = {
+        "circuitos": list(circuitos), "carreras": carreras, "semilla_inicial": semilla_inicial,
+        "lista_id": lista_id, "params": params or {}, "modo_sectores": modo_sectores,
+    }
+    trabajo = TrabajoLote(parametros=json.dumps(parametros), agregado=json.dumps(agregado_vacio()),
+                          carreras_total=len(parametros["circuitos"]) * carreras)
+    db.session.add(trabajo)
+    db.session.flush() # Para tener trabajo.id
+
+    chunks = [
+        {"trabajo_id": trabajo.id, "circuito_id": circuito_id, "semilla_desde": desde,
+         "semilla_hasta": min(desde + tam_chunk, semilla_inicial + carreras),
+         "estado": 'pendiente', "intentos": 0}
+        for circuito_id in parametros["circuitos"]
+        for desde in range(semilla_inicial, semilla_inicial + carreras, tam_chunk)
+    ]
+    db.session.execute(ChunkLote.__table__.insert(), chunks)
+    trabajo.chunks_total = len(chunks)
+    db.session.commit()
+    return trabajo
+
+
+# --- Worker ---
+
+def _disponible(ahora, max_intentos):
+    """Condición de un chunk libre: pendiente, o en curso con el lease vencido."""
+    return and_(
+        ChunkLote.intentos < max_intentos,
+        or_(ChunkLote.estado == 'pendiente',
+            and_(ChunkLote.estado == 'en_curso', ChunkLote.lease_hasta < ahora)),
+    )
+
+
+def _descartar_abandonados(ahora, max_intentos):
+    """
+    Chunks cuyo worker murió en el último intento: lease vencido y sin
+    intentos. Se dan por fallidos para que su trabajo pueda terminar.
+    """
+    abandonados = db.session.query(ChunkLote.id, ChunkLote.trabajo_id).filter(
+        ChunkLote.estado == 'en_curso', ChunkLote.lease_hasta < ahora,
+        ChunkLote.intentos >= max_intentos).all()
+    for chunk_id, trabajo_id in abandonados:
+        resultado = db.session.execute(
+            update(ChunkLote)
+            .where(ChunkLote.id == chunk_id, ChunkLote.estado == 'en_curso', ChunkLote.lease_hasta < ahora)
+            .values(estado='fallido', lease_hasta=None,
+                    error=f"El worker no terminó el chunk en {max_intentos} intentos")
+        )
+        if resultado.rowcount == 1:
+            trabajo = db.session.query(TrabajoLote).filter_by(id=trabajo_id) \
+                .with_for_update().populate_existing().one()
+            trabajo.chunks_fallidos += 1
+            _cerrar_trabajo_si_corresponde(trabajo)
+        db.session.commit()
+
+
+@_reintentar_si_bloqueada
+def reclamar_chunk(worker, lease_segundos, max_intentos, candidatos=10):
+    """
+    Toma un chunk libre para 'worker' con un lease de 'lease_segundos'.
+    Devuelve el ChunkLote reclamado o None si no hay trabajo.
+    """
+    _descartar_abandonados(time.time(), max_intentos)
+    while True:
+        ahora = time.time()
+        ids = [fila[0] for fila in db.session.query(ChunkLote.id)
+               .filter(_disponible(ahora, max_intentos))
+               .order_by(ChunkLote.id).limit(candidatos)]
+        if not ids:
+            db.session.rollback()
+            return None
+        for chunk_id in ids:
+            resultado = db.session.execute(
+                update(ChunkLote)
+                .where(ChunkLote.id == chunk_id, _disponible(ahora, max_intentos))
+                .values(estado='en_curso', worker=worker, lease_hasta=ahora + lease_segundos,
+                        intentos=ChunkLote.intentos + 1)
+            )
+            db.session.commit()
+            if resultado.rowcount == 1:
+                return db.session.get(ChunkLote, chunk_id)
+        # Otros workers se llevaron todos los candidatos: buscamos más
+
+
+@_reintentar_si_bloqueada
+def renovar_lease(chunk_id, worker, lease_segundos):
+    """Extiende el lease. False si ya no es nuestro (venció y lo tomó otro)."""
+    resultado = db.session.execute(
+        update(ChunkLote)
+        .where(ChunkLote.id == chunk_id, ChunkLote.worker == worker, ChunkLote.estado == 'en_curso')
+        .values(lease_hasta=time.time() + lease_segundos)
+    )
+    db.session.commit()
+    return resultado.rowcount == 1
+
+
+def _cerrar_trabajo_si_corresponde(trabajo):
+    if trabajo.chunks_hechos + trabajo.chunks_fallidos >= trabajo.chunks_total:
+        trabajo.estado = 'terminado' if not trabajo.chunks_fallidos else 'terminado_con_errores'
+        trabajo.terminado_en = db.func.now()
+    else:
+        trabajo.estado = 'en_curso'
+
+
+@_reintentar_si_bloqueada
+def _marcar_en_curso(trabajo_id):
+    db.session.execute(
+        update(TrabajoLote)
+        .where(TrabajoLote.id == trabajo_id, TrabajoLote.estado == 'pendiente')
+        .values(estado='en_curso')
+    )
+    db.session.commit()
+
+
+@_reintentar_si_bloqueada
+def completar_chunk(chunk_id, worker, parcial):
+    """
+    Marca el chunk como hecho y suma 'parcial' al agregado del trabajo, en
+    una transacción. False si el lease ya no era nuestro (no se suma nada).
+    """
+    resultado = db.session.execute(
+        update(ChunkLote)
+        .where(ChunkLote.id == chunk_id, ChunkLote.worker == worker, ChunkLote.estado == 'en_curso')
+        .values(estado='hecho', lease_hasta=None, error=None)
+    )
+    if resultado.rowcount != 1:
+        db.session.rollback()
+        return False
+
+    trabajo_id = db.session.query(ChunkLote.trabajo_id).filter(ChunkLote.id == chunk_id).scalar()
+    # Bloquea la fila del trabajo hasta el commit: las fusiones no se pisan
+    trabajo = db.session.query(TrabajoLote).filter_by(id=trabajo_id).with_for_update().populate_existing().one()
+    trabajo.agregado = json.dumps(combinar_agregados(json.loads(trabajo.agregado), parcial))
+    trabajo.chunks_hechos += 1
+    trabajo.carreras_hechas += parcial["carreras"]
+    _cerrar_trabajo_si_corresponde(trabajo)
+    db.session.commit()
+    return True
+
+
+@_reintentar_si_bloqueada
+def fallar_chunk(chunk_id, worker, error, max_intentos):
+    """Devuelve el chunk a la cola, o lo da por fallido si agotó los intentos."""
+    db.session.rollback() # Descarta lo que haya quedado a medias
+    chunk = db.session.query(ChunkLote).filter_by(id=chunk_id, worker=worker, estado='en_curso').first()
+    if chunk is None:
+        db.session.rollback()
+        return
+    chunk.error = error
+    chunk.lease_hasta = None
+    if chunk.intentos < max_intentos:
+        chunk.estado = 'pendiente'
+    else:
+        chunk.estado = 'fallido'
+        trabajo = db.session.query(TrabajoLote).filter_by(id=chunk.trabajo_id) \
+            .with_for_update().populate_existing().one()
+        trabajo.chunks_fallidos += 1
+        _cerrar_trabajo_si_corresponde(trabajo)
+    db.session.commit()
+
+
+def procesar_chunk(chunk, worker, lease_segundos):
+    """
+    Corre las carreras del chunk y devuelve su agregado parcial, o None si
+    perdimos el lease a mitad de camino (el chunk ya es de otro worker).
+    """
+    chunk_id, circuito_id = chunk.id, chunk.circuito_id
+    parametros = json.loads(db.session.get(TrabajoLote, chunk.trabajo_id).parametros)
+    _marcar_en_curso(chunk.trabajo_id)
+
+    # Los datos se cargan una vez por chunk; las carreras ya no tocan la BD
+    datos = cargar_desde_bd(circuito_id, parametros["lista_id"])
+    semillas = range(chunk.semilla_desde, chunk.semilla_hasta)
+    parcial = agregado_vacio()
+    renovar_en = time.time() + lease_segundos / 3
+    for semilla in semillas:
+        _, resumen = simular_carrera(datos, semilla=semilla, lista_id=parametros["lista_id"],
+                                     params=parametros["params"], modo_sectores=parametros["modo_sectores"])
+        sumar_carrera(parcial, resumen)
+        # completar_chunk vuelve a comprobar el lease: basta renovarlo a tiempo
+        if time.time() >= renovar_en:
+            if not renovar_lease(chunk_id, worker, lease_segundos):
+                return None
+            renovar_en = time.time() + lease_segundos / 3
+    return parcial
+
+
+def worker_en_proceso(max_chunks=None, esperar=True, intervalo=2.0):
+    """Tarea de ProcessPoolExecutor (con lotes.inicializar_worker_bd): un worker por proceso."""
+    from flask import current_app
+    return bucle_worker(current_app.config, max_chunks, esperar, intervalo)
+
+
+def bucle_worker(config, max_chunks=None, esperar=True, intervalo=2.0, log=print):
+    """
+    Toma y procesa chunks hasta agotar la cola (o 'max_chunks'). Con
+    'esperar', al quedarse sin trabajo duerme 'intervalo' segundos y sigue.
+    Devuelve cuántos chunks completó.
+    """
+    worker = nombre_worker()
+    lease = config['LOTES_LEASE_SEGUNDOS']
+    max_intentos = config['LOTES_MAX_INTENTOS']
+    hechos = 0
+    while max_chunks is None or hechos < max_chunks:
+        chunk = reclamar_chunk(worker, lease, max_intentos)
+        if chunk is None:
+            if not esperar:
+                break
+            time.sleep(intervalo)
+            continue
+
+        chunk_id = chunk.id
+        try:
+            parcial = procesar_chunk(chunk, worker, lease)
+        except Exception as e:
+            log(f"Chunk {chunk_id} falló: {e}")
+            fallar_chunk(chunk_id, worker, str(e), max_intentos)
+            continue
+
+        if parcial is not None and completar_chunk(chunk_id, worker, parcial):
+            hechos += 1
+            log(f"Chunk {chunk_id} hecho ({parcial['carreras']} carreras).")
+        else:
+            log(f"Chunk {chunk_id}: el lease venció y lo tomó otro worker, se descarta.")
+    return hechos
+
+
+# --- Consulta ---
+
+def progreso_trabajo(trabajo):
+    """Estado, avance y resultados (parciales mientras corre) de un trabajo."""
+    conteo = dict(db.session.query(ChunkLote.estado, db.func.count(ChunkLote.id))
+                  .filter(ChunkLote.trabajo_id == trabajo.id).group_by(ChunkLote.estado).all())
+    return {
+        "trabajo_id": trabajo.id,
+        "estado": trabajo.estado,
+        "parametros": json.loads(trabajo.parametros),
+        "progreso": trabajo.carreras_hechas / trabajo.carreras_total if trabajo.carreras_total else 1.0,
+        "carreras_hechas": trabajo.carreras_hechas,
+        "carreras_total": trabajo.carreras_total,
+        "chunks": {
+            "total": trabajo.chunks_total,
+            "hechos": trabajo.chunks_hechos,
+            "fallidos": trabajo.chunks_fallidos,
+            "en_curso": conteo.get('en_curso', 0),
+            "pendientes": conteo.get('pendiente', 0),
+        },
+        "creado_en": trabajo.creado_en.isoformat() if trabajo.creado_en else None,
+        "terminado_en": trabajo.terminado_en.isoformat() if trabajo.terminado_en else None,
+        "resultados": metricas_agregado(json.loads(trabajo.agregado)),
+    }
@@ -6,10 +6,87 @@ from dotenv import load_dotenv
 # Cargar las variables del archivo .env
 load_dotenv()
 
+def _opciones_pool(url):
+    """
+    Opciones del engine de SQLAlchemy (pool de conexiones).
+    El tamaño del pool solo aplica a bases con QueuePool (PostgreSQL);
+    SQLite usa sus propios pools y no acepta pool_size/max_overflow.
+    """
+    opciones = {
+        # Comprueba la conexión antes de usarla (evita errores tras un corte)
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        # Recicla conexiones viejas (segundos) antes de que las corte el servidor
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+    if url and not url.startswith('sqlite'):
+        opciones.update({
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+            'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        })
+    return opciones
+
+
 class Config:
     """Configuración base de la app."""
     # Desactiva una función de SQLAlchemy que no usaremos y consume recursos
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
     # Lee la URL de la base de datos desde el archivo .env
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
\ No newline at end of file
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
+
+    # Pool de conexiones (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    # DB_POOL_RECYCLE, DB_POOL_PRE_PING en el .env)
+    SQLALCHEMY_ENGINE_OPTIONS = _opciones_pool(SQLALCHEMY_DATABASE_URI)
+
+    # Dónde se guarda el estado de las simulaciones activas (snapshots y órdenes).
+    # 'memoria' (un solo worker), 'sqlite' (varios workers en una máquina) o
+    # 'redis' (varias máquinas). La URL es la ruta del archivo o la URL de Redis.
+    ESTADO_BACKEND = os.environ.get('ESTADO_BACKEND', 'memoria')
+    ESTADO_BACKEND_URL = os.environ.get('ESTADO_BACKEND_URL')
+    # Segundos sin actualizarse tras los que se borra el estado de una
+    # simulación (snapshot, órdenes y replay) del backend (0 = nunca)
+    ESTADO_TTL_SEGUNDOS = int(os.environ.get('ESTADO_TTL_SEGUNDOS', 24 * 3600))
+
+    # Segundos que los clientes pueden reutilizar las respuestas de la API de
+    # lectura (equipos, pilotos, coches, circuitos) sin volver a preguntar.
+    CACHE_MAX_AGE_REFERENCIA = int(os.environ.get('CACHE_MAX_AGE_REFERENCIA', 60))
+    # Vida máxima (segundos) de un ETag / respuesta cacheada de esa API aunque
+    # la versión de datos no cambie: cubre cambios hechos fuera de este
+    # worker (otro worker con backend 'memoria', seed.py, psql...). 0 = sin límite.
+    CACHE_TTL_REFERENCIA = int(os.environ.get('CACHE_TTL_REFERENCIA', 300))
+
+    # Perfilado bajo demanda (POST /api/admin/profile). Desactivado por defecto.
+    PERFILADO_HABILITADO = os.environ.get('PERFILADO_HABILITADO', 'false').lower() == 'true'
+
+    # Máximo de segundos que /simulation/status puede retener un pedido
+    # con ?wait_for_lap= (long-poll) antes de responder igual.
+    LONG_POLL_MAX_SEGUNDOS = int(os.environ.get('LONG_POLL_MAX_SEGUNDOS', 30))
+
+    # Presupuesto de memoria por proceso para las simulaciones (MB; 0 = sin
+    # límite). Al superarlo se desalojan carreras terminadas y, si no alcanza,
+    # se rechazan carreras y forks nuevos con un 503.
+    MEMORIA_MAX_MB_POR_PROCESO = float(os.environ.get('MEMORIA_MAX_MB_POR_PROCESO', 0))
+
+    # Medición precisa de memoria (tracemalloc + recorrido de objetos). Se
+    # activa sola en debug; es cara, no usar en producción.
+    MEMORIA_TRACEMALLOC = os.environ.get('MEMORIA_TRACEMALLOC', 'false').lower() == 'true'
+
+    # Cache de resultados de carreras deterministas (ver app/cache_resultados.py):
+    # MB en memoria por proceso (0 = desactivada) y, opcional, un directorio
+    # compartido en disco con su propio límite en MB.
+    CACHE_RESULTADOS_MB = float(os.environ.get('CACHE_RESULTADOS_MB', 64))
+    CACHE_RESULTADOS_DIR = os.environ.get('CACHE_RESULTADOS_DIR')
+    CACHE_RESULTADOS_DISCO_MB = float(os.environ.get('CACHE_RESULTADOS_DISCO_MB', 1024))
+
+    # Cola de lotes (app/cola_lotes.py): carreras por chunk, segundos de
+    # lease de un chunk (se renueva tras cada carrera), intentos antes de
+    # darlo por fallido y máximo de carreras por trabajo.
+    LOTES_TAM_CHUNK = int(os.environ.get('LOTES_TAM_CHUNK', 25))
+    LOTES_LEASE_SEGUNDOS = int(os.environ.get('LOTES_LEASE_SEGUNDOS', 120))
+    LOTES_MAX_INTENTOS = int(os.environ.get('LOTES_MAX_INTENTOS', 3))
+    LOTES_MAX_CARRERAS = int(os.environ.get('LOTES_MAX_CARRERAS', 100000))
+
+    # Tamaño (bytes) a partir del cual /simulation/status y los replays se
+    # comprimen con gzip/brotli, si el cliente lo acepta (Accept-Encoding).
+    COMPRESION_MIN_BYTES = int(os.environ.get('COMPRESION_MIN_BYTES', 1024))
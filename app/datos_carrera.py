@@ -0,0 +1,140 @@
+# Contenido para: app/datos_carrera.py
+
+from dataclasses import dataclass, fields, replace
+
+# --- DATOS ESTÁTICOS DE UNA CARRERA ---
+# Registros livianos con lo que el motor lee del circuito, los pilotos y los
+# coches. El motor trabaja siempre con estos registros, nunca con objetos
+# del ORM: así corre igual con datos de la BD (cargar_desde_bd), con dicts
+# armados a mano (tests, benchmarks) o en procesos worker sin BD ni Flask.
+# Este módulo no importa Flask ni SQLAlchemy; la BD solo se toca dentro de
+# cargar_desde_bd. Los valores por defecto son los de app/models.py.
+
+# Rol del Staff cuya habilidad y moral definen las paradas en boxes del equipo
+ROL_MECANICO = "Mecánico Jefe"
+
+
+class _Registro:
+    """Construcción desde un dict o desde cualquier objeto con esos atributos."""
+
+    @classmethod
+    def desde(cls, origen):
+        if isinstance(origen, cls):
+            return origen
+        nombres = [f.name for f in fields(cls)]
+        if isinstance(origen, dict):
+            desconocidos = set(origen) - set(nombres)
+            if desconocidos:
+                raise ValueError(f"Campos desconocidos para {cls.__name__}: {sorted(desconocidos)}")
+            return cls(**origen)
+        return cls(**{nombre: getattr(origen, nombre) for nombre in nombres if hasattr(origen, nombre)})
+
+
+@dataclass(frozen=True)
+class DatosCircuito(_Registro):
+    id: int = None
+    nombre: str = None
+    vueltas: int = 50
+    potencia_influencia: float = 0.33
+    aero_influencia: float = 0.33
+    manejo_influencia: float = 0.33
+    desgaste_neumaticos: float = 0.5
+    prob_safety_car: float = 0.1
+    prob_lluvia: float = 0.05
+
+
+@dataclass(frozen=True)
+class DatosPiloto(_Registro):
+    id: int = None
+    nombre: str = None
+    equipo_id: int = None
+    velocidad: float = 70.0
+    consistencia: float = 70.0
+    riesgo: float = 30.0
+    experiencia: float = 50.0
+
+
+@dataclass(frozen=True)
+class DatosCoche(_Registro):
+    id: int = None
+    equipo_id: int = None
+    motor: float = 50.0
+    aerodinamica: float = 50.0
+    chasis: float = 50.0
+    fiabilidad: float = 50.0
+    # Mecánicos del equipo (Staff con rol ROL_MECANICO): definen sus paradas
+    habilidad_mecanicos: float = 50.0
+    moral_mecanicos: float = 70.0
+
+
+def normalizar_participantes(participantes):
+    """
+    [(piloto, coche), ...] o [{"piloto": ..., "coche": ...}, ...], con dicts
+    u objetos, -> tupla de (DatosPiloto, DatosCoche).
+    """
+    normalizados = []
+    for participante in participantes:
+        if isinstance(participante, dict):
+            piloto, coche = participante["piloto"], participante["coche"]
+        else:
+            piloto, coche = participante
+        normalizados.append((DatosPiloto.desde(piloto), DatosCoche.desde(coche)))
+    return tuple(normalizados)
+
+
+def cargar_desde_bd(circuito_id, lista_id=None):
+    """
+    Fábrica desde la BD: (DatosCircuito, participantes) de una carrera.
+    Los inscritos y sus coches salen de UNA sola query (pilotos JOIN coches
+    por equipo), usando los índices de inscripciones.lista_id,
+    pilotos.equipo_id y coches.equipo_id; los mecánicos de esos equipos, de
+    otra (índice de staff.equipo_id). Necesita un app_context.
+    """
+    from app import db
+    from app.models import Piloto, Coche, Circuito, Inscripcion, ListaInscritos, Staff
+
+    circuito = db.session.get(Circuito, circuito_id)
+    if not circuito:
+        raise LookupError(f"Circuito con id {circuito_id} no encontrado")
+
+    # Lista de inscritos opcional: sin ella corren todos los pilotos con equipo
+    if lista_id is not None:
+        lista = db.session.get(ListaInscritos, lista_id)
+        if not lista:
+            raise LookupError(f"Lista de inscritos con id {lista_id} no encontrada")
+        # Una lista hecha para un circuito no corre en otro (sin circuito, sirve para todos)
+        if lista.circuito_id is not None and lista.circuito_id != circuito_id:
+            raise ValueError(f"La lista de inscritos {lista_id} es del circuito {lista.circuito_id}, "
+                             f"no del {circuito_id}")
+
+    query = db.session.query(Piloto, Coche) \
+        .outerjoin(Coche, Coche.equipo_id == Piloto.equipo_id)
+    if lista_id is not None:
+        query = query.join(Inscripcion, Inscripcion.piloto_id == Piloto.id) \
+            .filter(Inscripcion.lista_id == lista_id)
+    else:
+        query = query.filter(Piloto.equipo_id.isnot(None))
+
+    # Orden fijo por id: con la misma semilla, la misma carrera
+    filas = query.order_by(Piloto.id).all()
+
+    # Mecánico jefe de cada equipo (el de menor id si hay varios); sin él,
+    # el coche queda con los valores por defecto de DatosCoche
+    mecanicos = {}
+    equipos = {coche.equipo_id for _, coche in filas if coche}
+    if equipos:
+        staff = db.session.query(Staff) \
+            .filter(Staff.rol == ROL_MECANICO, Staff.equipo_id.in_(equipos)) \
+            .order_by(Staff.id)
+        for s in staff:
+            mecanicos.setdefault(s.equipo_id, {"habilidad_mecanicos": s.habilidad, "moral_mecanicos": s.moral})
+
+    participantes = []
+    for p, coche in filas:
+        if coche:
+            datos_coche = replace(DatosCoche.desde(coche), **mecanicos.get(coche.equipo_id, {}))
+            participantes.append((DatosPiloto.desde(p), datos_coche))
+        else:
+            print(f"Advertencia: Piloto {p.nombre} no tiene coche asignado.")
+
+    return DatosCircuito.desde(circuito), tuple(participantes)
@@ -1,9 +1,14 @@
 # Contenido para: app/engine.py
 
+import hashlib
 import random
+import sys
+import threading
 import time
-from app.models import Piloto, Coche, Circuito
-from app import db
+from array import array
+from dataclasses import astuple, dataclass, fields
+from operator import attrgetter
+from app.datos_carrera import DatosCircuito, DatosPiloto, DatosCoche, cargar_desde_bd, normalizar_participantes
 
 # --- Constantes de Balanceo del Juego ---
 # Estas son las "perillas" que ajustaremos para hacer el juego divertido.
@@ -27,6 +32,64 @@ K_NEUMATICO_PENALTY = 0.05 # Multiplicador de penalización por desgaste (cuadr
 PROB_ERROR_PILOTO_BASE = 0.01 # Probabilidad base de error por vuelta
 PROB_FALLO_MECANICO_BASE = 0.005 # Probabilidad base de fallo por vuelta
 TIEMPO_BASE_PIT_STOP = 22.0 # Segundos (incluye entrada y salida)
+TIEMPO_CAMBIO_GOMAS = (2.5, 4.5) # Segundos: mecánicos perfectos .. los peores posibles
+DISPERSION_CAMBIO_GOMAS = 0.3 # ± segundos (uniforme) alrededor del tiempo del equipo
+PROB_ERROR_PIT_BASE = 0.04 # Probabilidad de error por parada (se ajusta por los mecánicos)
+TIEMPO_ERROR_PIT = 10.0 # Segundos que suma un error en la parada (tuerca trabada, etc.)
+UMBRAL_DESGASTE_PIT = 70 # % de desgaste a partir del cual la IA para
+FACTOR_PS_ERROR = 0.8 # Con un error de piloto, el PS de esa vuelta queda al 80%
+
+# Tráfico (distancias en segundos con el coche de adelante)
+DISTANCIA_DRS = 1.0 # Por debajo de esto hay DRS
+DISTANCIA_AIRE_SUCIO = 1.5 # Por debajo de esto (y sin DRS) hay aire sucio
+VUELTA_ACTIVACION_DRS = 3 # Como en el reglamento: sin DRS en las dos primeras vueltas
+
+# Modo sectores: solo los coches "en pelea" se resuelven sector a sector
+RANGO_BATALLA = 2.0 # Segundos: más lejos que esto, el coche va por el camino rápido
+NUM_SECTORES = 3
+SECTORES_DRS = (0, 2) # Sectores (0-indexados) con zona de DRS
+
+
+@dataclass(frozen=True)
+class ParametrosBalanceo:
+    """
+    Juego de "perillas" de balanceo que usa UNA simulación.
+    Por defecto son las constantes de arriba; para probar otros valores se
+    crea un juego nuevo, p. ej. ParametrosBalanceo(mod_drs=10.0), y se pasa
+    al motor, sin tocar el módulo (ver app/barrido.py).
+    """
+    w_qually_coche: float = W_QUALLY_COCHE
+    w_qually_piloto: float = W_QUALLY_PILOTO
+    w_piloto_velocidad: float = W_PILOTO_VELOCIDAD
+    w_piloto_consistencia: float = W_PILOTO_CONSISTENCIA
+    w_piloto_experiencia: float = W_PILOTO_EXPERIENCIA
+    mod_ritmo_ataque: float = MOD_RITMO_ATAQUE
+    mod_ritmo_conservador: float = MOD_RITMO_CONSERVADOR
+    mod_drs: float = MOD_DRS
+    mod_aire_sucio: float = MOD_AIRE_SUCIO
+    k_fuel_penalty: float = K_FUEL_PENALTY
+    k_neumatico_penalty: float = K_NEUMATICO_PENALTY
+    prob_error_piloto_base: float = PROB_ERROR_PILOTO_BASE
+    prob_fallo_mecanico_base: float = PROB_FALLO_MECANICO_BASE
+    tiempo_base_pit_stop: float = TIEMPO_BASE_PIT_STOP
+    prob_error_pit_base: float = PROB_ERROR_PIT_BASE
+    tiempo_error_pit: float = TIEMPO_ERROR_PIT
+    distancia_drs: float = DISTANCIA_DRS
+    distancia_aire_sucio: float = DISTANCIA_AIRE_SUCIO
+    vuelta_activacion_drs: float = VUELTA_ACTIVACION_DRS
+    rango_batalla: float = RANGO_BATALLA
+
+    @classmethod
+    def desde_dict(cls, valores):
+        """Crea un juego desde un dict, validando los nombres."""
+        validos = {f.name for f in fields(cls)}
+        desconocidos = set(valores) - validos
+        if desconocidos:
+            raise ValueError(f"Parámetros de balanceo desconocidos: {sorted(desconocidos)}")
+        return cls(**{k: float(v) for k, v in valores.items()})
+
+    def a_dict(self):
+        return {f.name: getattr(self, f.name) for f in fields(self)}
 
 
 class PilotoEnCarrera:
@@ -34,9 +97,9 @@ class PilotoEnCarrera:
     Clase interna para manejar el ESTADO VIVO de un piloto durante la simulación.
     No se guarda en la BD, vive solo en el motor.
     """
-    def __init__(self, piloto_db: Piloto, coche_db: Coche):
-        self.piloto_db = piloto_db  # El objeto Piloto de la BD (datos estáticos)
-        self.coche_db = coche_db    # El objeto Coche de la BD (datos estáticos)
+    def __init__(self, piloto_db: DatosPiloto, coche_db: DatosCoche):
+        self.piloto_db = piloto_db  # Datos del piloto (estáticos, ver app/datos_carrera.py)
+        self.coche_db = coche_db    # Datos del coche (estáticos)
 
         # --- Estado Dinámico (cambia cada vuelta) ---
         self.ps_base = 0.0          # Performance Score Ideal (calculado en Qually)
@@ -54,11 +117,38 @@ class PilotoEnCarrera:
         self.neumatico_compuesto = "Medio"
         self.neumatico_desgaste = 0.0   # %
         self.neumatico_vueltas = 0      # Vueltas con este compuesto
+        self.ultimo_tiempo_vuelta = 0.0 # Segundos de la última vuelta (o parada)
 
         # Estrategia
         self.ritmo_actual = "Normal" # Normal, Ataque, Conservador
         self.solicitar_pit_stop = False
 
+    # Campos dinámicos que se guardan en cada checkpoint (ver SimulationEngine)
+    CAMPOS_ESTADO = (
+        "ps_base", "tiempo_total_carrera", "vuelta_actual", "posicion_actual",
+        "esta_en_pista", "esta_en_pit_lane", "combustible_actual", "bateria_ers",
+        "neumatico_compuesto", "neumatico_desgaste", "neumatico_vueltas",
+        "ritmo_actual", "solicitar_pit_stop", "ultimo_tiempo_vuelta",
+    )
+
+    def snapshot(self):
+        """Devuelve el estado dinámico como tupla inmutable (barata de guardar)."""
+        return _leer_estado_piloto(self)
+
+    def restaurar(self, estado):
+        """Restaura el estado dinámico desde una tupla de snapshot()."""
+        for campo, valor in zip(self.CAMPOS_ESTADO, estado):
+            setattr(self, campo, valor)
+
+    def clonar(self):
+        """
+        Copia para un fork: los datos estáticos (piloto_db, coche_db) se
+        comparten, solo se duplica el estado dinámico.
+        """
+        copia = PilotoEnCarrera(self.piloto_db, self.coche_db)
+        copia.restaurar(self.snapshot())
+        return copia
+
     def actualizar_desgaste(self, factor_desgaste_circuito):
         """Actualiza el desgaste del neumático"""
         # El desgaste base se multiplica por el factor del circuito
@@ -81,42 +171,125 @@ class PilotoEnCarrera:
             self.bateria_ers = min(100, self.bateria_ers + 2) # Carga leve
 
 
+def _empaquetar_rng(estado):
+    """
+    Estado del Mersenne Twister (625 enteros de 32 bits) como bytes:
+    ~2.5 KB por checkpoint en vez de ~24 KB de una tupla de ints de Python.
+    """
+    version, interno, gauss = estado
+    return (version, array('I', interno).tobytes(), gauss)
+
+
+def _desempaquetar_rng(estado):
+    version, interno, gauss = estado
+    return (version, tuple(array('I', interno)), gauss)
+
+
+def _tamano_anidado(obj, niveles):
+    """sys.getsizeof de obj y de sus elementos, hasta 'niveles' de tuplas/listas/dicts."""
+    tamano = sys.getsizeof(obj)
+    if niveles > 0:
+        if isinstance(obj, dict):
+            tamano += sum(_tamano_anidado(v, niveles - 1) for v in obj.values())
+        elif isinstance(obj, (tuple, list)):
+            tamano += sum(_tamano_anidado(v, niveles - 1) for v in obj)
+    return tamano
+
+
+# Lee todos los CAMPOS_ESTADO de una vez (mucho más rápido que un getattr por campo)
+_leer_estado_piloto = attrgetter(*PilotoEnCarrera.CAMPOS_ESTADO)
+
+
 class SimulationEngine:
     """
     El Cerebro. Orquesta toda la simulación de una carrera.
     """
-    def __init__(self, circuito_id):
-        self.circuito = db.session.get(Circuito, circuito_id)
-        if not self.circuito:
-            raise Exception(f"Circuito con id {circuito_id} no encontrado")
+    def __init__(self, circuito_id, semilla=None, lista_id=None, modo_sectores=False, params=None):
+        """
+        Carrera con los datos de la BD (necesita un app_context). Para correr
+        sin BD, con datos propios, ver SimulationEngine.desde_datos.
+        """
+        circuito, participantes = cargar_desde_bd(circuito_id, lista_id)
+        self._configurar(circuito, participantes, semilla, lista_id, modo_sectores, params)
+
+    @classmethod
+    def desde_datos(cls, circuito, participantes, semilla=None, modo_sectores=False, params=None, lista_id=None):
+        """
+        Carrera con datos propios, sin BD ni Flask: 'circuito' es un dict o
+        registro con los campos de DatosCircuito y 'participantes' una lista
+        de (piloto, coche) o de {"piloto": ..., "coche": ...} (dicts o registros).
+        """
+        engine = cls.__new__(cls)
+        engine._configurar(DatosCircuito.desde(circuito), normalizar_participantes(participantes),
+                           semilla, lista_id, modo_sectores, params)
+        return engine
+
+    def _configurar(self, circuito, participantes, semilla, lista_id, modo_sectores, params):
+        self.circuito = circuito
+        self.lista_id = lista_id
 
+        # Modo sectores: DRS y aire sucio resueltos por sector para los coches en pelea
+        self.modo_sectores = modo_sectores
+        # Perillas de balanceo de esta simulación
+        self.params = params or ParametrosBalanceo()
+
+        self._inicializar_estado(semilla)
+
+        # Estado vivo de cada piloto, en el orden fijo de 'participantes'
+        self.pilotos_en_carrera = [PilotoEnCarrera(piloto, coche) for piloto, coche in participantes]
+        self.boxes = self._preparar_boxes()
+
+    def datos(self):
+        """(circuito, participantes) de esta carrera: sirven para desde_datos (p. ej. en otro proceso)."""
+        return self.circuito, tuple((p.piloto_db, p.coche_db) for p in self.pilotos_en_carrera)
+
+    def _inicializar_estado(self, semilla):
+        """Estado de carrera común a una simulación nueva y a un fork."""
         self.vuelta_actual = 0
         self.vueltas_totales = self.circuito.vueltas
         self.log_eventos = []
         self.terminada = False
         self.estado_pista = "Seco" # Seco, Lluvia, SafetyCar
-
-        # Cargamos los pilotos y coches
-        self.pilotos_en_carrera = self._cargar_participantes()
         self.orden_pilotos = [] # Lista de IDs ordenados por posición
 
-    def _cargar_participantes(self):
-        """Carga todos los pilotos y sus coches desde la BD"""
-        pilotos_db = db.session.query(Piloto).filter(Piloto.equipo_id.isnot(None)).all()
-        coches_db = db.session.query(Coche).all()
-        
-        # Mapeo de coche por equipo_id para fácil acceso
-        coches_map = {c.equipo_id: c for c in coches_db}
-        
-        lista_pilotos = []
-        for p in pilotos_db:
-            coche = coches_map.get(p.equipo_id)
-            if coche:
-                lista_pilotos.append(PilotoEnCarrera(p, coche))
-            else:
-                print(f"Advertencia: Piloto {p.nombre} no tiene coche asignado.")
-        
-        return lista_pilotos
+        # Métricas de la carrera (para balanceo, ver app/barrido.py)
+        self.parrilla = [] # IDs de piloto en orden de salida
+        self.adelantamientos = 0
+
+        # RNG propio de la carrera: permite reproducirla (semilla) y
+        # guardar/restaurar su estado en los checkpoints.
+        self.semilla = semilla
+        self.rng = random.Random(semilla)
+
+        # Checkpoints por vuelta: {vuelta: (estado_pista, rng_state, len_log, orden, adelantamientos)}
+        # donde 'orden' es una tupla de (indice_piloto, snapshot) en orden de posición.
+        # Son inmutables, así que un fork comparte los de vueltas anteriores.
+        self.checkpoints = {}
+
+        # Órdenes programadas (what-if): {vuelta: [(piloto_id, accion), ...]}
+        self.comandos_programados = {}
+        self.ordenes_en_vivo = 0 # Órdenes del jugador durante la carrera
+
+        # Boxes ocupados por equipo en la vuelta en curso (doble parada):
+        # {equipo_id: (vuelta, tiempo de carrera en que queda libre)}
+        self._boxes_ocupados = {}
+
+        # Funciones f(engine) llamadas al terminar cada vuelta (y la Qually).
+        # Las usa la API para publicar el estado y leer órdenes pendientes.
+        self.observadores_vuelta = []
+
+        # Para esperar vueltas sin sondear (long-poll): se notifica al terminar cada vuelta
+        self.ultima_vuelta_completada = -1 # 0 = Qually
+        self._cond_vuelta = threading.Condition()
+        self._fin_ultima_vuelta = None # time.time() al terminar la última vuelta
+        self._duracion_media_vuelta = None # Segundos reales por vuelta (media móvil)
+
+        # Contabilidad de memoria (ver estimar_memoria): se mide incrementalmente
+        self._bytes_log = 0
+        self._log_medido = 0
+        self._lock_memoria = threading.Lock()
+        self._bytes_por_piloto = None
+        self._bytes_por_checkpoint = None
 
     def simular_clasificacion(self):
         """
@@ -126,27 +299,10 @@ class SimulationEngine:
         resultados_qually = []
 
         for p in self.pilotos_en_carrera:
-            # 1. Factor Coche (Adaptado al Circuito)
-            c = p.coche_db
-            adaptacion_coche = (c.motor * self.circuito.potencia_influencia) + \
-                               (c.aerodinamica * self.circuito.aero_influencia) + \
-                               (c.chasis * self.circuito.manejo_influencia)
-            
-            # 2. Factor Piloto (Habilidad Pura)
-            pil = p.piloto_db
-            rendimiento_piloto = (pil.velocidad * W_PILOTO_VELOCIDAD) + \
-                                 (pil.consistencia * W_PILOTO_CONSISTENCIA) + \
-                                 (pil.experiencia * W_PILOTO_EXPERIENCIA)
-
-            # 3. PS de Clasificación (Final)
-            ps_qually = (adaptacion_coche * W_QUALLY_COCHE) + \
-                        (rendimiento_piloto * W_QUALLY_PILOTO)
-            
+            ps_qually, rango_variabilidad = self._ps_clasificacion(p)
+
             # 4. Variabilidad (RNG)
-            # Un piloto inconsistente (baja consistencia) y arriesgado (alto riesgo)
-            # tendrá una variabilidad mucho mayor.
-            rango_variabilidad = (1 - (pil.consistencia / 100)) + (pil.riesgo / 100)
-            rng_factor = random.uniform(-rango_variabilidad, rango_variabilidad)
+            rng_factor = self.rng.uniform(-rango_variabilidad, rango_variabilidad)
             
             ps_qually_final = ps_qually + (ps_qually * (rng_factor / 10)) # Dividimos por 10 para que no sea tan extremo
             
@@ -161,10 +317,41 @@ class SimulationEngine:
         for i, (piloto, _) in enumerate(resultados_qually):
             piloto.posicion_actual = i + 1
             self.orden_pilotos.append(piloto) # Ya queda ordenado para la carrera
+        self.parrilla = [p.piloto_db.id for p in self.orden_pilotos]
             
         self.log_eventos.append("Clasificación terminada. Parrilla establecida.")
+        self._guardar_checkpoint() # Checkpoint de la vuelta 0 (parrilla)
+        self._notificar_vuelta()
         print("Clasificación terminada.")
 
+    def _ps_clasificacion(self, p: PilotoEnCarrera):
+        """
+        PS de clasificación sin la parte aleatoria, y el rango de esa
+        variabilidad (el PS final es ps * (1 + U(-rango, rango) / 10)).
+        """
+        params = self.params
+
+        # 1. Factor Coche (Adaptado al Circuito)
+        c = p.coche_db
+        adaptacion_coche = (c.motor * self.circuito.potencia_influencia) + \
+                           (c.aerodinamica * self.circuito.aero_influencia) + \
+                           (c.chasis * self.circuito.manejo_influencia)
+
+        # 2. Factor Piloto (Habilidad Pura)
+        pil = p.piloto_db
+        rendimiento_piloto = (pil.velocidad * params.w_piloto_velocidad) + \
+                             (pil.consistencia * params.w_piloto_consistencia) + \
+                             (pil.experiencia * params.w_piloto_experiencia)
+
+        # 3. PS de Clasificación (Final)
+        ps_qually = (adaptacion_coche * params.w_qually_coche) + \
+                    (rendimiento_piloto * params.w_qually_piloto)
+
+        # Un piloto inconsistente (baja consistencia) y arriesgado (alto riesgo)
+        # tendrá una variabilidad mucho mayor.
+        rango_variabilidad = (1 - (pil.consistencia / 100)) + (pil.riesgo / 100)
+        return ps_qually, rango_variabilidad
+
     def run_simulation(self):
         """
         FASE 2: El bucle principal de la carrera.
@@ -174,9 +361,15 @@ class SimulationEngine:
 
         print(f"Iniciando simulación de Carrera ({self.vueltas_totales} vueltas)...")
 
-        for i in range(self.vueltas_totales):
+        # Empezamos desde la vuelta actual: 0 en una carrera nueva,
+        # la vuelta del checkpoint en un fork.
+        for i in range(self.vuelta_actual, self.vueltas_totales):
             self.vuelta_actual = i + 1
             self.log_eventos.append(f"--- INICIO VUELTA {self.vuelta_actual} ---")
+
+            # 0. Órdenes programadas para esta vuelta (what-if)
+            for piloto_id, accion in self.comandos_programados.get(self.vuelta_actual, []):
+                self.update_piloto_strategy(piloto_id, accion, programada=True)
             
             # 1. Manejar eventos globales (SC, Lluvia)
             self._manejar_eventos_globales()
@@ -199,8 +392,13 @@ class SimulationEngine:
             # 5. Reordenar posiciones basado en el tiempo total acumulado
             self._actualizar_posiciones()
 
+            # 6. Checkpoint de fin de vuelta
+            self._guardar_checkpoint()
+            self._notificar_vuelta()
+
         self.terminada = True
         self.log_eventos.append("¡CARRERA TERMINADA!")
+        self._notificar_vuelta()
         print("Simulación completada.")
 
     def _simular_vuelta_para_piloto(self, piloto: PilotoEnCarrera, posicion_actual):
@@ -217,15 +415,23 @@ class SimulationEngine:
         mod_combustible = self._calcular_mod_combustible(piloto)
         mod_ritmo_ers = self._calcular_mod_ritmo(piloto)
         
-        # 3. Modificador Tráfico/DRS (simplificado)
+        # 3. Modificador Tráfico/DRS
         mod_trafico_drs = 0
         if posicion_actual > 0: # Si no es el líder
             coche_delante = self.orden_pilotos[posicion_actual - 1]
-            distancia = coche_delante.tiempo_total_carrera - piloto.tiempo_total_carrera
-            if distancia < 1.0:
-                mod_trafico_drs = MOD_DRS # Bono DRS
-            elif distancia < 1.5:
-                mod_trafico_drs = MOD_AIRE_SUCIO # Penalización aire sucio
+            distancia = self._distancia_con_delantero(piloto, coche_delante)
+            # En la largada todos salen con tiempo 0 (distancia 0): sin esto,
+            # todos menos el líder tendrían DRS desde la vuelta 1
+            drs_habilitado = self.vuelta_actual >= self.params.vuelta_activacion_drs
+            if self.modo_sectores and distancia < self.params.rango_batalla:
+                # En pelea: resolvemos la vuelta sector a sector
+                ps_sin_trafico = ps_base + mod_neumaticos + mod_combustible + mod_ritmo_ers
+                mod_trafico_drs = self._mod_trafico_por_sectores(ps_sin_trafico, coche_delante, distancia,
+                                                                 drs_habilitado)
+            elif drs_habilitado and distancia < self.params.distancia_drs:
+                mod_trafico_drs = self.params.mod_drs # Bono DRS
+            elif distancia < self.params.distancia_aire_sucio:
+                mod_trafico_drs = self.params.mod_aire_sucio # Penalización aire sucio
 
         # 4. Sumar todo
         ps_vuelta_actual = ps_base + mod_neumaticos + mod_combustible + \
@@ -239,6 +445,7 @@ class SimulationEngine:
         # 6. Convertir PS a tiempo y sumar
         tiempo_vuelta = self._convertir_ps_a_tiempo(ps_final_vuelta)
         piloto.tiempo_total_carrera += tiempo_vuelta
+        piloto.ultimo_tiempo_vuelta = tiempo_vuelta
         
         # 7. Actualizar estado del piloto
         piloto.actualizar_desgaste(self.circuito.desgaste_neumaticos)
@@ -250,7 +457,7 @@ class SimulationEngine:
         """Decide si el piloto debe parar o cambiar de ritmo"""
         
         # Estrategia de IA simple: parar si el desgaste es muy alto
-        if not piloto.solicitar_pit_stop and piloto.neumatico_desgaste > 70:
+        if not piloto.solicitar_pit_stop and piloto.neumatico_desgaste > UMBRAL_DESGASTE_PIT:
             print(f"IA: {piloto.piloto_db.nombre} parará por desgaste.")
             piloto.solicitar_pit_stop = True
 
@@ -260,15 +467,51 @@ class SimulationEngine:
             piloto.solicitar_pit_stop = False # Reseteamos la solicitud
             self.log_eventos.append(f"V{self.vuelta_actual}: {piloto.piloto_db.nombre} entra a boxes.")
 
+    def _preparar_boxes(self):
+        """
+        {piloto_id: (tiempo medio de cambio de gomas, prob. de error)} según
+        los mecánicos de cada equipo. Se calcula una vez por carrera: la
+        parada solo lee este dict.
+        """
+        minimo, maximo = TIEMPO_CAMBIO_GOMAS
+        boxes = {}
+        for p in self.pilotos_en_carrera:
+            # Calidad de 0 a 1: pesa más la habilidad que la moral
+            calidad = (0.75 * p.coche_db.habilidad_mecanicos + 0.25 * p.coche_db.moral_mecanicos) / 100
+            calidad = min(max(calidad, 0.0), 1.0)
+            boxes[p.piloto_db.id] = (maximo - (maximo - minimo) * calidad,
+                                     self.params.prob_error_pit_base * (1.5 - calidad))
+        return boxes
+
     def _simular_parada_en_boxes(self, piloto: PilotoEnCarrera):
         """Añade el tiempo de la parada en boxes"""
-        
-        # Aquí iría la lógica de habilidad de mecánicos
-        tiempo_cambio_gomas = random.uniform(2.5, 4.5) 
-        
-        tiempo_total_pit = TIEMPO_BASE_PIT_STOP + tiempo_cambio_gomas
-        
+
+        # Cambio de gomas según los mecánicos del equipo (ver _preparar_boxes)
+        tiempo_medio, prob_error = self.boxes[piloto.piloto_db.id]
+        tiempo_cambio_gomas = tiempo_medio + self.rng.uniform(-DISPERSION_CAMBIO_GOMAS, DISPERSION_CAMBIO_GOMAS)
+        if self.rng.random() < prob_error:
+            tiempo_cambio_gomas += self.params.tiempo_error_pit
+            self.log_eventos.append(f"V{self.vuelta_actual}: ¡Error en la parada de {piloto.piloto_db.nombre}!")
+
+        # Doble parada: si el compañero entró antes en esta vuelta y los
+        # mecánicos siguen con él, espera a que terminen (los pilotos se
+        # procesan en orden de posición, así que el de adelante llega primero)
+        espera = 0.0
+        equipo_id = piloto.piloto_db.equipo_id
+        if equipo_id is not None:
+            llegada = piloto.tiempo_total_carrera
+            vuelta, libre = self._boxes_ocupados.get(equipo_id, (None, 0.0))
+            if vuelta == self.vuelta_actual and libre > llegada:
+                espera = libre - llegada
+                self.log_eventos.append(
+                    f"V{self.vuelta_actual}: {piloto.piloto_db.nombre} espera {espera:.1f}s en boxes (doble parada).")
+            self._boxes_ocupados[equipo_id] = (self.vuelta_actual, llegada + espera + tiempo_cambio_gomas)
+
+        tiempo_total_pit = self.params.tiempo_base_pit_stop + espera + tiempo_cambio_gomas
+
         piloto.tiempo_total_carrera += tiempo_total_pit
+        piloto.ultimo_tiempo_vuelta = tiempo_total_pit
+        piloto.vuelta_actual = self.vuelta_actual
         
         # Reseteamos neumáticos
         piloto.neumatico_desgaste = 0.0
@@ -285,63 +528,233 @@ class SimulationEngine:
         dnf = [p for p in self.orden_pilotos if not p.esta_en_pista]
         
         # Ordenamos a los que siguen en pista
+        indice_anterior = {id(p): i for i, p in enumerate(en_pista)}
         en_pista.sort(key=lambda p: p.tiempo_total_carrera)
+
+        # Adelantamientos: coches en pista que ganaron lugares entre los que siguen
+        # en pista (los abandonos no cuentan; las paradas en boxes sí, es aproximado)
+        self.adelantamientos += sum(1 for i, p in enumerate(en_pista) if i < indice_anterior[id(p)])
         
         # Reasignamos posiciones
         self.orden_pilotos = en_pista + dnf
         for i, piloto in enumerate(self.orden_pilotos):
             piloto.posicion_actual = i + 1
 
+    def _notificar_vuelta(self):
+        for observador in self.observadores_vuelta:
+            observador(self)
+
+        # Despertamos a quien esté esperando esta vuelta (esperar_vuelta)
+        with self._cond_vuelta:
+            ahora = time.time()
+            if self._fin_ultima_vuelta is not None and self.vuelta_actual > 0:
+                duracion = ahora - self._fin_ultima_vuelta
+                media = self._duracion_media_vuelta
+                self._duracion_media_vuelta = duracion if media is None else 0.8 * media + 0.2 * duracion
+            self._fin_ultima_vuelta = ahora
+            self._cond_vuelta.notify_all()
+
+    def esperar_vuelta(self, vuelta, timeout):
+        """
+        Bloquea hasta que se complete la vuelta indicada (o termine la carrera)
+        o pase 'timeout' segundos. Devuelve True si la vuelta ya está completa.
+        """
+        with self._cond_vuelta:
+            return self._cond_vuelta.wait_for(
+                lambda: self.ultima_vuelta_completada >= vuelta or self.terminada, timeout
+            )
+
+    def proxima_vuelta_estimada(self):
+        """Momento estimado (epoch, segundos) en que terminará la próxima vuelta."""
+        if self.terminada or self._fin_ultima_vuelta is None or self._duracion_media_vuelta is None:
+            return None
+        return self._fin_ultima_vuelta + self._duracion_media_vuelta
+
+    # --- Checkpoints y Forks (what-if) ---
+
+    def _guardar_checkpoint(self):
+        """Guarda el estado al final de la vuelta actual (O(pilotos), sin copias profundas)."""
+        indices = {id(p): i for i, p in enumerate(self.pilotos_en_carrera)}
+        orden = tuple((indices[id(p)], p.snapshot()) for p in self.orden_pilotos)
+        self.checkpoints[self.vuelta_actual] = (
+            self.estado_pista,
+            _empaquetar_rng(self.rng.getstate()),
+            len(self.log_eventos),
+            orden,
+            self.adelantamientos,
+        )
+        self.ultima_vuelta_completada = self.vuelta_actual
+
+    def programar_comandos(self, comandos):
+        """Agenda órdenes (vuelta, piloto_id, accion) para aplicarlas al empezar esa vuelta."""
+        for (v, piloto_id, accion) in (comandos or []):
+            self.comandos_programados.setdefault(v, []).append((piloto_id, accion))
+
+    def huella_datos(self):
+        """
+        Hash (hex) de los datos estáticos cargados: el circuito y cada piloto
+        con su coche, campo por campo y en el orden de la carrera. Dos
+        motores con la misma huella, semilla, órdenes y parámetros corren
+        exactamente la misma carrera (ver app/cache_resultados.py).
+        """
+        datos = [astuple(self.circuito)]
+        datos.extend(astuple(p.piloto_db) + astuple(p.coche_db) for p in self.pilotos_en_carrera)
+        return hashlib.sha256(repr(datos).encode()).hexdigest()
+
+    def fork(self, vuelta, comandos=None, semilla=None):
+        """
+        Crea una nueva simulación a partir del checkpoint de 'vuelta', con
+        órdenes alteradas. 'comandos' es una lista de (vuelta, piloto_id, accion).
+
+        Los datos estáticos (circuito, pilotos y coches de la BD) y los
+        checkpoints hasta 'vuelta' se comparten con esta simulación; solo se
+        copia el estado dinámico. No toca la BD, así que cuesta únicamente
+        las vueltas restantes.
+
+        Si se pasa 'semilla', el RNG del fork se resiembra (otra "realidad");
+        si no, continúa con el mismo estado que tenía el original en esa vuelta.
+        """
+        if vuelta not in self.checkpoints:
+            raise ValueError(f"No hay checkpoint para la vuelta {vuelta}")
+
+        estado_pista, rng_state, len_log, orden, adelantamientos = self.checkpoints[vuelta]
+
+        nuevo = SimulationEngine.__new__(SimulationEngine)
+        nuevo.circuito = self.circuito
+        nuevo.lista_id = self.lista_id
+        nuevo.modo_sectores = self.modo_sectores
+        nuevo.params = self.params
+        nuevo.boxes = self.boxes
+        nuevo._inicializar_estado(self.semilla)
+        nuevo.vuelta_actual = vuelta
+        nuevo.ultima_vuelta_completada = vuelta
+        nuevo.estado_pista = estado_pista
+        nuevo.parrilla = self.parrilla
+        nuevo.adelantamientos = adelantamientos
+        if semilla is None:
+            nuevo.rng.setstate(_desempaquetar_rng(rng_state))
+        else:
+            nuevo.semilla = semilla
+            nuevo.rng.seed(semilla)
+        nuevo.log_eventos = self.log_eventos[:len_log]
+        # Por búsquedas y no iterando: el hilo del original puede estar agregando checkpoints
+        compartidos = ((v, self.checkpoints.get(v)) for v in range(vuelta + 1))
+        nuevo.checkpoints = {v: c for v, c in compartidos if c is not None}
+
+        # Mismo índice que el original, para que los checkpoints compartidos sigan valiendo
+        nuevo.pilotos_en_carrera = [p.clonar() for p in self.pilotos_en_carrera]
+        nuevo.orden_pilotos = []
+        for indice, estado in orden:
+            piloto = nuevo.pilotos_en_carrera[indice]
+            piloto.restaurar(estado)
+            nuevo.orden_pilotos.append(piloto)
+
+        nuevo.programar_comandos(comandos)
+
+        nuevo.log_eventos.append(f"Fork desde la vuelta {vuelta}.")
+        return nuevo
+
+    # --- Tráfico ---
+
+    def _distancia_con_delantero(self, piloto: PilotoEnCarrera, coche_delante: PilotoEnCarrera):
+        """
+        Segundos que 'piloto' va detrás de 'coche_delante' al INICIO de la vuelta.
+        El bucle va en orden de posición, así que el de adelante normalmente ya
+        sumó esta vuelta: se la descontamos para comparar tiempos de la misma vuelta.
+        """
+        if not coche_delante.esta_en_pista:
+            return float('inf') # Un coche parado no genera tráfico
+        tiempo_delante = coche_delante.tiempo_total_carrera
+        if coche_delante.vuelta_actual == self.vuelta_actual:
+            tiempo_delante -= coche_delante.ultimo_tiempo_vuelta
+        return piloto.tiempo_total_carrera - tiempo_delante
+
+    def _mod_trafico_por_sectores(self, ps_sin_trafico, coche_delante: PilotoEnCarrera, distancia,
+                                  drs_habilitado=True):
+        """
+        Resuelve DRS y aire sucio sector a sector para un coche en pelea.
+        La distancia evoluciona según el ritmo de cada coche en cada sector,
+        así el DRS solo ayuda mientras está a tiro, y tras pasar al de
+        adelante ya no sufre aire sucio. Devuelve el modificador medio de la
+        vuelta (en puntos de PS, igual que el camino por vuelta).
+        """
+        # Ritmo por sector del de adelante: su última vuelta (la de ahora si
+        # ya la corrió); en la vuelta 1 suponemos el mismo ritmo que el nuestro
+        tiempo_vuelta_delante = coche_delante.ultimo_tiempo_vuelta or self._ps_a_segundos(ps_sin_trafico)
+        tiempo_sector_delante = tiempo_vuelta_delante / NUM_SECTORES
+
+        params = self.params
+        mod_total = 0.0
+        for sector in range(NUM_SECTORES):
+            mod_sector = 0
+            if distancia >= 0: # Sigue detrás
+                if drs_habilitado and sector in SECTORES_DRS and distancia < params.distancia_drs:
+                    mod_sector = params.mod_drs
+                elif sector not in SECTORES_DRS and distancia < params.distancia_aire_sucio:
+                    mod_sector = params.mod_aire_sucio
+            mod_total += mod_sector
+
+            tiempo_sector = self._ps_a_segundos(ps_sin_trafico + mod_sector) / NUM_SECTORES
+            distancia += tiempo_sector - tiempo_sector_delante
+
+        return mod_total / NUM_SECTORES
+
     # --- Funciones de Modificadores y RNG ---
 
     def _calcular_mod_neumaticos(self, p: PilotoEnCarrera):
         # Penalización cuadrática por desgaste
-        penalizacion = (p.neumatico_desgaste ** 2) * K_NEUMATICO_PENALTY
+        penalizacion = (p.neumatico_desgaste ** 2) * self.params.k_neumatico_penalty
         # Aquí podríamos añadir bonos por compuesto (ej: Blando +5, Duro -2)
         return -penalizacion
 
     def _calcular_mod_combustible(self, p: PilotoEnCarrera):
-        penalizacion = p.combustible_actual * K_FUEL_PENALTY
+        penalizacion = p.combustible_actual * self.params.k_fuel_penalty
         return -penalizacion
 
     def _calcular_mod_ritmo(self, p: PilotoEnCarrera):
         if p.ritmo_actual == "Ataque":
             if p.bateria_ers > 10:
-                return MOD_RITMO_ATAQUE
+                return self.params.mod_ritmo_ataque
             else:
                 p.ritmo_actual = "Normal" # No puede atacar
                 return 0
         if p.ritmo_actual == "Conservador":
-            return MOD_RITMO_CONSERVADOR
+            return self.params.mod_ritmo_conservador
         return 0
 
     def _check_eventos_piloto(self, p: PilotoEnCarrera, ps_vuelta):
         """Chequea Errores de Piloto y Fallos Mecánicos"""
         
         # 1. Error de Piloto
-        # Pilotos inconsistentes y arriesgados erran más
-        prob_error = PROB_ERROR_PILOTO_BASE + \
-                     (1 - p.piloto_db.consistencia / 100) + \
-                     (p.piloto_db.riesgo / 100)
-        
-        if random.random() < (prob_error / 20): # /20 para balancear
-            ps_modificado = ps_vuelta * 0.8 # Pierde 20% de rendimiento
+        if self.rng.random() < self._prob_error_vuelta(p):
+            ps_modificado = ps_vuelta * FACTOR_PS_ERROR # Pierde 20% de rendimiento
             evento = f"V{self.vuelta_actual}: ¡Error de {p.piloto_db.nombre}! Pierde tiempo."
             return (ps_modificado, evento)
 
         # 2. Fallo Mecánico
-        prob_fallo = PROB_FALLO_MECANICO_BASE + (1 - p.coche_db.fiabilidad / 100)
-        
-        if random.random() < (prob_fallo / 50): # /50 para balancear
+        if self.rng.random() < self._prob_fallo_vuelta(p):
             p.esta_en_pista = False # DNF
             evento = f"V{self.vuelta_actual}: ¡FALLO MECÁNICO para {p.piloto_db.nombre}! ¡Está fuera!"
             return (0, evento) # PS Cero
 
         return (ps_vuelta, None) # Sin eventos
 
+    def _prob_error_vuelta(self, p: PilotoEnCarrera):
+        """Probabilidad de error del piloto en una vuelta."""
+        # Pilotos inconsistentes y arriesgados erran más
+        prob_error = self.params.prob_error_piloto_base + \
+                     (1 - p.piloto_db.consistencia / 100) + \
+                     (p.piloto_db.riesgo / 100)
+        return prob_error / 20 # /20 para balancear
+
+    def _prob_fallo_vuelta(self, p: PilotoEnCarrera):
+        """Probabilidad de fallo mecánico (DNF) en una vuelta sin error del piloto."""
+        prob_fallo = self.params.prob_fallo_mecanico_base + (1 - p.coche_db.fiabilidad / 100)
+        return prob_fallo / 50 # /50 para balancear
+
     def _manejar_eventos_globales(self):
         """Chequea si sale un Safety Car o empieza a llover"""
-        if random.random() < (self.circuito.prob_safety_car / 10): # /10 para balancear
+        if self.rng.random() < (self.circuito.prob_safety_car / 10): # /10 para balancear
             self.estado_pista = "SafetyCar"
             self.log_eventos.append(f"V{self.vuelta_actual}: ¡SAFETY CAR! ¡SAFETY CAR!")
             # Aquí iría la lógica de agrupar a los coches
@@ -352,18 +765,55 @@ class SimulationEngine:
         Esta es una fórmula de "mapeo" que podemos ajustar.
         Un PS más alto debe dar un tiempo de vuelta más bajo.
         """
+        tiempo = self._ps_a_segundos(ps)
+        
+        # Añadir pequeña variabilidad aleatoria
+        tiempo += self.rng.uniform(-0.05, 0.05)
+        
+        return max(tiempo, 60.0) # Evitar tiempos negativos o absurdos
+
+    def _ps_a_segundos(self, ps):
+        """Parte determinista de la conversión PS -> segundos (sin RNG)."""
         # Fórmula base: 100 segundos (base_time) - (PS * 0.1)
         # Esto es muy simple, pero funciona.
         # Asumimos que un PS de 200 nos da 80s, y un PS de 150 nos da 85s.
         base_time = 100.0 
         factor_conversion = 0.1
         
-        tiempo = base_time - (ps * factor_conversion)
-        
-        # Añadir pequeña variabilidad aleatoria
-        tiempo += random.uniform(-0.05, 0.05)
-        
-        return max(tiempo, 60.0) # Evitar tiempos negativos o absurdos
+        return base_time - (ps * factor_conversion)
+
+    # --- Memoria ---
+
+    def estimar_memoria(self):
+        """
+        Estimación barata (en bytes) de la memoria propia de esta simulación:
+        log de eventos, estado de pilotos (con sus objetos de la BD) y
+        checkpoints. El log se mide incrementalmente y pilotos/checkpoints
+        midiendo uno y multiplicando, así que cuesta casi nada llamarla en
+        cada /status. Para una medición exacta, ver app/memoria.py.
+        """
+        # Se llama desde los hilos de las peticiones mientras el motor sigue
+        # agregando eventos: sin el lock, dos llamadas contarían dos veces lo nuevo
+        with self._lock_memoria:
+            total = len(self.log_eventos)
+            self._bytes_log += sum(sys.getsizeof(m) for m in self.log_eventos[self._log_medido:total])
+            self._log_medido = total
+            bytes_log = self._bytes_log
+
+        if self._bytes_por_piloto is None and self.pilotos_en_carrera:
+            p = self.pilotos_en_carrera[0]
+            self._bytes_por_piloto = (
+                sys.getsizeof(p) + _tamano_anidado(vars(p), 1)
+                + _tamano_anidado(vars(p.piloto_db), 1) + _tamano_anidado(vars(p.coche_db), 1)
+            )
+        if self._bytes_por_checkpoint is None and self.checkpoints:
+            self._bytes_por_checkpoint = _tamano_anidado(next(iter(self.checkpoints.values())), 3)
+
+        return (
+            sys.getsizeof(self.log_eventos) + bytes_log
+            + len(self.pilotos_en_carrera) * (self._bytes_por_piloto or 0)
+            + sys.getsizeof(self.checkpoints) + len(self.checkpoints) * (self._bytes_por_checkpoint or 0)
+        )
 
     # --- Métodos Públicos (para la API) ---
 
@@ -387,16 +837,21 @@ class SimulationEngine:
 
         return {
             "vuelta_actual": self.vuelta_actual,
+            "ultima_vuelta_completada": self.ultima_vuelta_completada,
+            "proxima_vuelta_estimada": self.proxima_vuelta_estimada(),
             "vueltas_totales": self.vueltas_totales,
             "estado_pista": self.estado_pista,
             "terminada": self.terminada,
             "pilotos": pilotos_status,
+            "memoria_estimada_bytes": self.estimar_memoria(),
             "log_eventos": self.log_eventos[-10:] # Últimos 10 eventos
         }
 
-    def update_piloto_strategy(self, piloto_id, accion):
+    def update_piloto_strategy(self, piloto_id, accion, programada=False):
         """
         Permite al jugador (API) cambiar la estrategia de su piloto.
+        'programada' indica que viene de comandos_programados; las demás
+        cuentan como órdenes en vivo (la carrera ya no es reproducible).
         """
         piloto_a_actualizar = None
         for p in self.pilotos_en_carrera:
@@ -409,10 +864,12 @@ class SimulationEngine:
 
         if accion == "solicitar_pit_stop":
             piloto_a_actualizar.solicitar_pit_stop = True
+            self.ordenes_en_vivo += not programada
             return {"status": f"Pit stop solicitado para {piloto_a_actualizar.piloto_db.nombre}"}
         
         if accion in ["Normal", "Ataque", "Conservador"]:
             piloto_a_actualizar.ritmo_actual = accion
+            self.ordenes_en_vivo += not programada
             return {"status": f"Ritmo de {piloto_a_actualizar.piloto_db.nombre} fijado en {accion}"}
 
         return {"error": "Acción no reconocida"}
\ No newline at end of file
@@ -0,0 +1,328 @@
+# Contenido para: app/estado.py
+
+import json
+import sqlite3
+import threading
+import time
+
+# --- BACKENDS DE ESTADO COMPARTIDO ---
+# Guardan, por sim_id, el último snapshot de la carrera (lo que devuelve
+# get_status) y la cola de órdenes de estrategia pendientes.
+# El motor sigue viviendo en el worker que lo creó: publica su snapshot al
+# final de cada vuelta y consume las órdenes que otros workers encolaron.
+#
+# Todos los backends exponen la misma interfaz:
+#   guardar_snapshot(sim_id, snapshot)
+#   obtener_snapshot(sim_id)      -> dict o None
+#   encolar_comando(sim_id, comando)
+#   extraer_comandos(sim_id)      -> lista de comandos (y los borra)
+#   eliminar(sim_id)
+#   guardar_replay(sim_id, datos) / obtener_replay(sim_id) -> bytes o None
+#   obtener_version_datos()       -> int, versión de los datos de referencia
+#   incrementar_version_datos()   -> int, la nueva versión
+# y el atributo 'en_proceso': True si lo guardado ocupa la memoria de este
+# proceso (cuenta para el presupuesto de memoria, ver app/memoria.py).
+#
+# Lo guardado para una simulación expira 'ttl' segundos después de su última
+# actualización (ESTADO_TTL_SEGUNDOS; 0 = nunca): en memoria y SQLite con un
+# barrido cada INTERVALO_BARRIDO segundos como mucho, en Redis con EX.
+#
+# La versión de datos (equipos, pilotos, coches, staff, circuitos) sirve para
+# los ETag de la API de lectura: cambia cada vez que se hace commit de un
+# cambio en esas tablas (ver app/cache_http.py).
+
+
+# Segundos mínimos entre dos barridos de estado expirado (memoria y SQLite)
+INTERVALO_BARRIDO = 60
+
+
+class BackendEstadoMemoria:
+    """
+    Backend por defecto: un dict en memoria del proceso.
+    Solo sirve con un único worker (como antes).
+    """
+    en_proceso = True
+
+    def __init__(self, ttl=0):
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._comandos = {}
+        self._replays = {}
+        self.ttl = ttl
+        self._actualizado = {} # sim_id -> time.time() de la última escritura
+        self._ultimo_barrido = time.time()
+        # Empieza en el timestamp de arranque para no repetir ETags tras reiniciar
+        self._version_datos = int(time.time())
+
+    def _tocar(self, sim_id):
+        """Marca la escritura y, cada INTERVALO_BARRIDO, borra lo expirado (con el lock tomado)."""
+        ahora = time.time()
+        self._actualizado[sim_id] = ahora
+        if not self.ttl or ahora - self._ultimo_barrido < INTERVALO_BARRIDO:
+            return
+        self._ultimo_barrido = ahora
+        for viejo in [s for s, t in self._actualizado.items() if ahora - t > self.ttl]:
+            self._borrar(viejo)
+
+    def _borrar(self, sim_id):
+        self._snapshots.pop(sim_id, None)
+        self._comandos.pop(sim_id, None)
+        self._replays.pop(sim_id, None)
+        self._actualizado.pop(sim_id, None)
+
+    def guardar_snapshot(self, sim_id, snapshot):
+        with self._lock:
+            self._snapshots[sim_id] = snapshot
+            self._tocar(sim_id)
+
+    def obtener_snapshot(self, sim_id):
+        with self._lock:
+            return self._snapshots.get(sim_id)
+
+    def encolar_comando(self, sim_id, comando):
+        with self._lock:
+            self._comandos.setdefault(sim_id, []).append(comando)
+            self._tocar(sim_id)
+
+    def extraer_comandos(self, sim_id):
+        with self._lock:
+            return self._comandos.pop(sim_id, [])
+
+    def eliminar(self, sim_id):
+        with self._lock:
+            self._borrar(sim_id)
+
+    def guardar_replay(self, sim_id, datos):
+        with self._lock:
+            self._replays[sim_id] = datos
+            self._tocar(sim_id)
+
+    def obtener_replay(self, sim_id):
+        with self._lock:
+            return self._replays.get(sim_id)
+
+    def obtener_version_datos(self):
+        with self._lock:
+            return self._version_datos
+
+    def incrementar_version_datos(self):
+        with self._lock:
+            self._version_datos += 1
+            return self._version_datos
+
+
+class BackendEstadoSQLite:
+    """
+    Backend en un archivo SQLite compartido. Sirve para varios workers de
+    gunicorn en la misma máquina (o un volumen compartido) sin servicios extra.
+    """
+    en_proceso = False
+
+    def __init__(self, ruta, ttl=0):
+        self.ruta = ruta
+        self.ttl = ttl
+        self._ultimo_barrido = 0.0
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                " sim_id TEXT PRIMARY KEY, datos TEXT NOT NULL, actualizado REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS comandos ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, sim_id TEXT NOT NULL, datos TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_comandos_sim_id ON comandos (sim_id)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS replays (sim_id TEXT PRIMARY KEY, datos BLOB NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (clave, valor) VALUES ('version_datos', ?)",
+                (int(time.time()),)
+            )
+
+    def _conectar(self):
+        # Una conexión por operación: son baratas y evitan compartirlas entre hilos
+        conn = sqlite3.connect(self.ruta, timeout=10, isolation_level=None)
+        return _ConexionSQLite(conn)
+
+    def guardar_snapshot(self, sim_id, snapshot):
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots (sim_id, datos, actualizado) VALUES (?, ?, ?)",
+                (sim_id, json.dumps(snapshot), time.time())
+            )
+            self._barrer(conn)
+
+    def _barrer(self, conn):
+        """
+        Cada INTERVALO_BARRIDO (por proceso), borra las simulaciones cuyo
+        snapshot no se actualiza hace más de 'ttl' segundos, con sus órdenes
+        y su replay. Toda simulación publica un snapshot antes que lo demás.
+        """
+        ahora = time.time()
+        if not self.ttl or ahora - self._ultimo_barrido < INTERVALO_BARRIDO:
+            return
+        self._ultimo_barrido = ahora
+        limite = ahora - self.ttl
+        conn.execute("BEGIN IMMEDIATE")
+        for tabla in ("comandos", "replays"):
+            conn.execute(
+                f"DELETE FROM {tabla} WHERE sim_id IN (SELECT sim_id FROM snapshots WHERE actualizado < ?)",
+                (limite,)
+            )
+        conn.execute("DELETE FROM snapshots WHERE actualizado < ?", (limite,))
+        conn.execute("COMMIT")
+
+    def obtener_snapshot(self, sim_id):
+        with self._conectar() as conn:
+            fila = conn.execute(
+                "SELECT datos FROM snapshots WHERE sim_id = ?", (sim_id,)
+            ).fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def encolar_comando(self, sim_id, comando):
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT INTO comandos (sim_id, datos) VALUES (?, ?)",
+                (sim_id, json.dumps(comando))
+            )
+
+    def extraer_comandos(self, sim_id):
+        with self._conectar() as conn:
+            # BEGIN IMMEDIATE: nadie más puede escribir entre el SELECT y el DELETE
+            conn.execute("BEGIN IMMEDIATE")
+            filas = conn.execute(
+                "SELECT id, datos FROM comandos WHERE sim_id = ? ORDER BY id", (sim_id,)
+            ).fetchall()
+            if filas:
+                conn.execute("DELETE FROM comandos WHERE sim_id = ? AND id <= ?", (sim_id, filas[-1][0]))
+            conn.execute("COMMIT")
+        return [json.loads(datos) for _, datos in filas]
+
+    def eliminar(self, sim_id):
+        with self._conectar() as conn:
+            conn.execute("DELETE FROM snapshots WHERE sim_id = ?", (sim_id,))
+            conn.execute("DELETE FROM comandos WHERE sim_id = ?", (sim_id,))
+            conn.execute("DELETE FROM replays WHERE sim_id = ?", (sim_id,))
+
+    def guardar_replay(self, sim_id, datos):
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO replays (sim_id, datos) VALUES (?, ?)", (sim_id, datos)
+            )
+
+    def obtener_replay(self, sim_id):
+        with self._conectar() as conn:
+            fila = conn.execute("SELECT datos FROM replays WHERE sim_id = ?", (sim_id,)).fetchone()
+        return bytes(fila[0]) if fila else None
+
+    def obtener_version_datos(self):
+        with self._conectar() as conn:
+            return conn.execute("SELECT valor FROM meta WHERE clave = 'version_datos'").fetchone()[0]
+
+    def incrementar_version_datos(self):
+        with self._conectar() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE meta SET valor = valor + 1 WHERE clave = 'version_datos'")
+            version = conn.execute("SELECT valor FROM meta WHERE clave = 'version_datos'").fetchone()[0]
+            conn.execute("COMMIT")
+        return version
+
+
+class _ConexionSQLite:
+    """Context manager que cierra la conexión (sqlite3 solo cierra la transacción)."""
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, *exc):
+        self.conn.close()
+
+
+class BackendEstadoRedis:
+    """
+    Backend sobre cualquier servidor que hable el protocolo de Redis
+    (Redis, Valkey, KeyDB, o un sustituto local). Sirve entre varias máquinas.
+    Requiere el paquete opcional 'redis'.
+    """
+    en_proceso = False
+
+    def __init__(self, url, prefijo="f1", ttl=0):
+        try:
+            import redis
+        except ImportError:
+            raise Exception("El backend 'redis' necesita el paquete 'redis' (pip install redis)")
+        self.cliente = redis.Redis.from_url(url)
+        self.prefijo = prefijo
+        self.ttl = ttl or None # EX: None = sin expiración
+
+    def _clave(self, tipo, sim_id):
+        return f"{self.prefijo}:{tipo}:{sim_id}"
+
+    def guardar_snapshot(self, sim_id, snapshot):
+        self.cliente.set(self._clave("snapshot", sim_id), json.dumps(snapshot), ex=self.ttl)
+
+    def obtener_snapshot(self, sim_id):
+        datos = self.cliente.get(self._clave("snapshot", sim_id))
+        return json.loads(datos) if datos else None
+
+    def encolar_comando(self, sim_id, comando):
+        clave = self._clave("comandos", sim_id)
+        pipe = self.cliente.pipeline()
+        pipe.rpush(clave, json.dumps(comando))
+        if self.ttl:
+            pipe.expire(clave, self.ttl)
+        pipe.execute()
+
+    def extraer_comandos(self, sim_id):
+        # LRANGE + DELETE atómicos en una transacción
+        clave = self._clave("comandos", sim_id)
+        pipe = self.cliente.pipeline()
+        pipe.lrange(clave, 0, -1)
+        pipe.delete(clave)
+        datos, _ = pipe.execute()
+        return [json.loads(d) for d in datos]
+
+    def eliminar(self, sim_id):
+        self.cliente.delete(
+            self._clave("snapshot", sim_id), self._clave("comandos", sim_id), self._clave("replay", sim_id)
+        )
+
+    def guardar_replay(self, sim_id, datos):
+        self.cliente.set(self._clave("replay", sim_id), datos, ex=self.ttl)
+
+    def obtener_replay(self, sim_id):
+        return self.cliente.get(self._clave("replay", sim_id))
+
+    def obtener_version_datos(self):
+        clave = f"{self.prefijo}:version_datos"
+        # SETNX: solo la inicializa el primero que llega
+        self.cliente.setnx(clave, int(time.time()))
+        return int(self.cliente.get(clave))
+
+    def incrementar_version_datos(self):
+        clave = f"{self.prefijo}:version_datos"
+        self.cliente.setnx(clave, int(time.time()))
+        return int(self.cliente.incr(clave))
+
+
+def crear_backend(config):
+    """Crea el backend indicado en la configuración (ESTADO_BACKEND)."""
+    tipo = config.get('ESTADO_BACKEND', 'memoria')
+    url = config.get('ESTADO_BACKEND_URL')
+    ttl = config.get('ESTADO_TTL_SEGUNDOS', 0)
+
+    if tipo == 'memoria':
+        return BackendEstadoMemoria(ttl)
+    if tipo == 'sqlite':
+        return BackendEstadoSQLite(url or 'estado_simulaciones.db', ttl)
+    if tipo == 'redis':
+        return BackendEstadoRedis(url or 'redis://localhost:6379/0', ttl=ttl)
+
+    raise Exception(f"Backend de estado desconocido: {tipo}")
@@ -0,0 +1,10 @@
+# Contenido para: app/extensiones.py
+
+from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+
+# Instancias globales de la Base de Datos (db) y Migrate, vacías hasta
+# create_app. Viven aquí y no en app/__init__.py para que importar el motor
+# (app.engine, app.datos_carrera) no cargue Flask ni SQLAlchemy.
+db = SQLAlchemy()
+migrate = Migrate()
@@ -0,0 +1,166 @@
+# Contenido para: app/generador.py
+
+import json
+import os
+import random
+
+# --- GENERADOR DE LIGAS SINTÉTICAS ---
+# Produce equipos, coches, pilotos, staff y circuitos con distribuciones
+# realistas, a la escala que se pida, para probar el motor y la API con
+# volúmenes de producción. Todo son generadores de dicts (una fila por
+# registro) con ids explícitos, listos para app/carga_masiva.importar().
+#
+# Distribuciones (stats de 0 a 100, como en seed.py):
+#  - Cada equipo tiene un "nivel" (beta centrada en la media tabla).
+#  - Coche y staff rondan el nivel del equipo; los pilotos buenos tienden
+#    a estar en equipos buenos, pero con bastante dispersión.
+#  - Consistencia alta y riesgo medio en general; experiencia muy variable.
+
+ROLES_STAFF = ("Mecánico Jefe", "Estratega", "Ingeniero de Pista")
+
+
+def _stat(rng, media, desvio, minimo=20.0, maximo=100.0):
+    return round(min(max(rng.gauss(media, desvio), minimo), maximo), 1)
+
+
+def _nivel_equipo(rng):
+    # Beta(2.5, 2.5) entre 65 y 98: pocos equipos muy buenos o muy malos
+    return 65 + rng.betavariate(2.5, 2.5) * 33
+
+
+class GeneradorLiga:
+    """
+    Genera una liga sintética reproducible (misma semilla -> mismos datos).
+    Los ids empiezan en los valores de 'ids_iniciales' ({tabla: id}), así se
+    pueden añadir filas a una BD que ya tiene datos.
+    """
+    def __init__(self, equipos=10, pilotos_por_equipo=2, agentes_libres=0,
+                 circuitos=10, semilla=None, ids_iniciales=None):
+        self.n_equipos = equipos
+        self.pilotos_por_equipo = pilotos_por_equipo
+        self.agentes_libres = agentes_libres
+        self.n_circuitos = circuitos
+        self.semilla = semilla
+        self.ids = {'equipos': 1, 'coches': 1, 'pilotos': 1, 'staff': 1, 'circuitos': 1}
+        self.ids.update(ids_iniciales or {})
+
+        # Los niveles de los equipos se usan en varias tablas: los fijamos una vez
+        rng = random.Random(semilla)
+        self._niveles = [_nivel_equipo(rng) for _ in range(equipos)]
+
+    def _rng(self, tabla):
+        # Un RNG por tabla: cada tabla se puede generar por separado y en streaming
+        return random.Random(f"{self.semilla}:{tabla}")
+
+    def _equipo_id(self, i):
+        return self.ids['equipos'] + i
+
+    def equipos(self):
+        rng = self._rng('equipos')
+        for i, nivel in enumerate(self._niveles):
+            equipo_id = self._equipo_id(i)
+            yield {
+                "id": equipo_id,
+                "nombre": f"Equipo Sintético {equipo_id}",
+                "presupuesto": round(nivel ** 2 * 20000 * rng.uniform(0.8, 1.2), -5),
+                "reputacion": _stat(rng, nivel - 5, 8),
+            }
+
+    def coches(self):
+        rng = self._rng('coches')
+        for i, nivel in enumerate(self._niveles):
+            yield {
+                "id": self.ids['coches'] + i,
+                "motor": _stat(rng, nivel, 4),
+                "aerodinamica": _stat(rng, nivel, 4),
+                "chasis": _stat(rng, nivel, 4),
+                "fiabilidad": _stat(rng, nivel - 8, 7),
+                "equipo_id": self._equipo_id(i),
+            }
+
+    def pilotos(self):
+        rng = self._rng('pilotos')
+        piloto_id = self.ids['pilotos']
+        for i, nivel in enumerate(self._niveles):
+            for _ in range(self.pilotos_por_equipo):
+                yield self._piloto(rng, piloto_id, nivel, self._equipo_id(i))
+                piloto_id += 1
+        for _ in range(self.agentes_libres):
+            yield self._piloto(rng, piloto_id, 75, None)
+            piloto_id += 1
+
+    def _piloto(self, rng, piloto_id, nivel, equipo_id):
+        velocidad = _stat(rng, 0.5 * nivel + 42, 5)
+        return {
+            "id": piloto_id,
+            "nombre": f"Piloto {piloto_id}",
+            "edad": rng.randint(18, 40),
+            "nacionalidad": rng.choice(("ARG", "BRA", "ESP", "GBR", "GER", "ITA", "MEX", "NED", "FRA", "JPN")),
+            "velocidad": velocidad,
+            "consistencia": _stat(rng, 82, 7),
+            "riesgo": _stat(rng, 50, 13, minimo=5.0),
+            "experiencia": _stat(rng, 72, 14),
+            "feedback_tecnico": _stat(rng, 75, 9),
+            # El salario crece exponencialmente con la velocidad
+            "salario": round(1000000 * 1.15 ** max(velocidad - 75, 0), -4),
+            "equipo_id": equipo_id,
+        }
+
+    def staff(self):
+        rng = self._rng('staff')
+        staff_id = self.ids['staff']
+        for i, nivel in enumerate(self._niveles):
+            for rol in ROLES_STAFF:
+                yield {
+                    "id": staff_id,
+                    "nombre": f"Staff {staff_id}",
+                    "rol": rol,
+                    "habilidad": _stat(rng, nivel - 5, 8),
+                    "salario": round(rng.uniform(40000, 400000), -3),
+                    "moral": _stat(rng, 70, 10),
+                    "equipo_id": self._equipo_id(i),
+                }
+                staff_id += 1
+
+    def circuitos(self):
+        rng = self._rng('circuitos')
+        for i in range(self.n_circuitos):
+            circuito_id = self.ids['circuitos'] + i
+            # Influencias que suman 1 (Dirichlet con gammas)
+            pesos = [rng.gammavariate(3, 1) for _ in range(3)]
+            total = sum(pesos)
+            potencia, aero, manejo = (round(p / total, 2) for p in pesos)
+            yield {
+                "id": circuito_id,
+                "nombre": f"Circuito Sintético {circuito_id}",
+                "pais": "Sintético",
+                "vueltas": rng.randint(44, 78),
+                "potencia_influencia": potencia,
+                "aero_influencia": aero,
+                "manejo_influencia": manejo,
+                "desgaste_neumaticos": round(rng.uniform(0.2, 0.9), 2),
+                "prob_safety_car": round(rng.uniform(0.1, 1.0), 2),
+                "prob_lluvia": round(rng.uniform(0.0, 0.3), 2),
+            }
+
+    def tablas(self):
+        """(tabla, generador de filas) en orden de dependencias."""
+        return [
+            ('equipos', self.equipos()),
+            ('coches', self.coches()),
+            ('pilotos', self.pilotos()),
+            ('staff', self.staff()),
+            ('circuitos', self.circuitos()),
+        ]
+
+    def escribir_jsonl(self, directorio):
+        """Escribe un <tabla>.jsonl por tabla. Devuelve {tabla: filas escritas}."""
+        os.makedirs(directorio, exist_ok=True)
+        conteo = {}
+        for tabla, filas in self.tablas():
+            with open(os.path.join(directorio, f"{tabla}.jsonl"), 'w', encoding='utf-8') as f:
+                conteo[tabla] = 0
+                for fila in filas:
+                    f.write(json.dumps(fila, ensure_ascii=False) + "\n")
+                    conteo[tabla] += 1
+        return conteo
@@ -0,0 +1,181 @@
+# Contenido para: app/lotes.py
+
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.cache_resultados import clave_carrera, crear_cache
+from app.datos_carrera import cargar_desde_bd
+from app.engine import SimulationEngine, ParametrosBalanceo
+
+# --- EJECUCIÓN DE CARRERAS EN PROCESOS WORKER ---
+# Helpers comunes para correr muchas carreras fuera de la API (barridos de
+# parámetros, lotes). El proceso padre carga de la BD los datos de cada
+# circuito una sola vez (datos_de_circuitos) y los workers corren las
+# carreras con SimulationEngine.desde_datos: no crean app, no abren
+# conexiones y no importan Flask ni SQLAlchemy.
+
+_cache_worker = None
+
+
+def opciones_cache(config):
+    """Lo que necesita un worker para abrir su propia cache de resultados."""
+    return {clave: valor for clave, valor in config.items() if clave.startswith('CACHE_RESULTADOS_')}
+
+
+def inicializar_worker(opciones=None):
+    """Initializer de ProcessPoolExecutor: stdout a stderr y cache propia (opcional)."""
+    global _cache_worker
+    # Los prints del motor van a stderr: stdout es la salida JSONL del comando
+    sys.stdout = sys.stderr
+    _cache_worker = crear_cache(opciones) if opciones else None
+
+
+_contexto_worker = None
+
+
+def inicializar_worker_bd():
+    """
+    Initializer para workers que sí usan la BD (la cola de lotes reclama y
+    cierra chunks): app propia y app_context permanente.
+    """
+    global _contexto_worker
+    sys.stdout = sys.stderr
+    from app import create_app
+    _contexto_worker = create_app().app_context()
+    _contexto_worker.push()
+
+
+def datos_de_circuitos(circuitos, lista_id=None):
+    """
+    {circuito_id: (circuito, participantes)} cargados de la BD (necesita un
+    app_context). Un circuito que no carga queda con su mensaje de error.
+    """
+    datos = {}
+    for circuito_id in circuitos:
+        try:
+            datos[circuito_id] = cargar_desde_bd(circuito_id, lista_id)
+        except Exception as e:
+            datos[circuito_id] = str(e)
+    return datos
+
+
+def resumir_carrera(engine):
+    """Resultado compacto de una carrera terminada (serializable a JSON)."""
+    clasificados = [p for p in engine.orden_pilotos if p.esta_en_pista]
+    ganador = clasificados[0] if clasificados else None
+    return {
+        "circuito_id": engine.circuito.id,
+        "semilla": engine.semilla,
+        "clasificacion": [p.piloto_db.id for p in engine.orden_pilotos],
+        "parrilla": engine.parrilla,
+        "ganador_id": ganador.piloto_db.id if ganador else None,
+        "pilotos": len(engine.orden_pilotos),
+        "dnf": len(engine.orden_pilotos) - len(clasificados),
+        "adelantamientos": engine.adelantamientos,
+        # Segundos entre el ganador y el último clasificado
+        "gap_ganador_ultimo": (clasificados[-1].tiempo_total_carrera - ganador.tiempo_total_carrera)
+                              if ganador else None,
+    }
+
+
+def simular_carrera(datos, semilla=None, lista_id=None, params=None, modo_sectores=False):
+    """
+    Corre una carrera completa con 'datos' = (circuito, participantes) y
+    devuelve (engine, resumen). 'params' puede ser un ParametrosBalanceo o
+    un dict de overrides. No toca la BD.
+    """
+    if isinstance(params, dict):
+        params = ParametrosBalanceo.desde_dict(params)
+    circuito, participantes = datos
+    engine = SimulationEngine.desde_datos(circuito, participantes, semilla=semilla, lista_id=lista_id,
+                                          modo_sectores=modo_sectores, params=params)
+    engine.run_simulation()
+    return engine, resumir_carrera(engine)
+
+
+def registro_carrera(engine, duracion_s, eventos=True):
+    """
+    Registro completo de una carrera terminada, para exportar (una línea de
+    JSONL): el resumen, la clasificación con tiempos y el log de eventos.
+    """
+    registro = resumir_carrera(engine)
+    ganador = engine.orden_pilotos[0] if engine.orden_pilotos else None
+    registro.update({
+        "lista_id": engine.lista_id,
+        "modo_sectores": engine.modo_sectores,
+        "vueltas": engine.vueltas_totales,
+        "duracion_s": round(duracion_s, 4),
+        "resultados": [
+            {
+                "posicion": p.posicion_actual,
+                "piloto_id": p.piloto_db.id,
+                "nombre": p.piloto_db.nombre,
+                "equipo_id": p.piloto_db.equipo_id,
+                "vueltas": p.vuelta_actual,
+                "tiempo_total": round(p.tiempo_total_carrera, 3),
+                "gap": (round(p.tiempo_total_carrera - ganador.tiempo_total_carrera, 3)
+                        if p.esta_en_pista else None),
+                "dnf": not p.esta_en_pista,
+            }
+            for p in engine.orden_pilotos
+        ],
+    })
+    if eventos:
+        registro["eventos"] = engine.log_eventos
+    return registro
+
+
+def _correr_para_registro(datos, semilla, lista_id, params, modo_sectores, eventos):
+    """
+    Tarea de un worker: una carrera completa -> su registro. Con semilla y
+    la cache de resultados activa, una carrera ya corrida no se repite.
+    """
+    inicio = time.perf_counter()
+    circuito, participantes = datos
+    try:
+        engine = SimulationEngine.desde_datos(circuito, participantes, semilla=semilla, lista_id=lista_id,
+                                              modo_sectores=modo_sectores, params=params)
+
+        cache = _cache_worker if semilla is not None else None
+        clave = clave_carrera(engine, "registro", eventos=eventos) if cache else None
+        if cache:
+            registro = cache.obtener_json(clave)
+            if registro is not None:
+                registro["cache"] = True
+                return registro
+
+        engine.run_simulation()
+        registro = registro_carrera(engine, time.perf_counter() - inicio, eventos)
+        if cache:
+            cache.guardar_json(clave, registro)
+        return registro
+    except Exception as e:
+        # Una carrera que falla no corta el lote: queda registrada con su error
+        return {"circuito_id": circuito.id, "semilla": semilla, "error": str(e)}
+
+
+def ejecutar_lote(circuitos, semillas, lista_id=None, params=None, modo_sectores=False,
+                  eventos=True, procesos=None, cache=None):
+    """
+    Corre una carrera por cada (circuito, semilla) en 'procesos' procesos y
+    va devolviendo (generador) sus registros en ese mismo orden, a medida
+    que terminan: se puede escribir el JSONL sin esperar al lote entero.
+    Los datos se cargan de la BD aquí, una vez por circuito (necesita un
+    app_context); 'cache' son las opciones_cache de la config, o None.
+    """
+    datos = datos_de_circuitos(circuitos, lista_id)
+    with ProcessPoolExecutor(max_workers=procesos, initializer=inicializar_worker,
+                             initargs=(cache,)) as pool:
+        pendientes = []
+        for circuito_id in circuitos:
+            for semilla in semillas:
+                if isinstance(datos[circuito_id], str):
+                    # Un circuito que falla no corta el lote: queda registrado con su error
+                    pendientes.append({"circuito_id": circuito_id, "semilla": semilla,
+                                       "error": datos[circuito_id]})
+                else:
+                    pendientes.append(pool.submit(_correr_para_registro, datos[circuito_id], semilla,
+                                                  lista_id, params, modo_sectores, eventos))
+        for pendiente in pendientes:
+            yield pendiente if isinstance(pendiente, dict) else pendiente.result()
@@ -0,0 +1,150 @@
+# Contenido para: app/memoria.py
+
+import os
+import sys
+import tracemalloc
+from types import FunctionType, ModuleType
+
+# --- CONTABILIDAD DE MEMORIA DE LAS SIMULACIONES ---
+# Cada carrera viva ocupa memoria del worker: el log de eventos, los
+# PilotoEnCarrera (con sus objetos de la BD), los checkpoints de cada vuelta
+# y el replay grabado. Aquí se mide, por simulación y en total, y se aplica
+# el presupuesto MEMORIA_MAX_MB_POR_PROCESO:
+#  - En producción se usa SimulationEngine.estimar_memoria() (barata).
+#  - En debug (o con MEMORIA_TRACEMALLOC) se recorre el motor objeto por
+#    objeto y se informan los totales de tracemalloc del proceso.
+# El presupuesto se compara con lo contabilizado, no con el RSS: CPython
+# no devuelve la memoria al sistema al liberar, así que el RSS no baja
+# aunque se desalojen carreras.
+
+# Lo que no es "de la simulación": compartido con el resto del proceso
+_TIPOS_COMPARTIDOS = (type, ModuleType, FunctionType)
+
+
+def iniciar_tracemalloc(app):
+    """Arranca tracemalloc si la app está en debug o lo pide MEMORIA_TRACEMALLOC."""
+    if (app.debug or app.config.get('MEMORIA_TRACEMALLOC')) and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def medicion_precisa():
+    """Hay medición precisa (y cara) cuando tracemalloc está activo."""
+    return tracemalloc.is_tracing()
+
+
+def _elementos(contenedor):
+    """
+    Copia de los elementos de un dict (claves y valores) o de una colección.
+    El motor puede estar agregando (checkpoints, log) desde su hilo: si el
+    contenedor cambia mientras se copia, se reintenta.
+    """
+    while True:
+        try:
+            if isinstance(contenedor, dict):
+                return [x for par in list(contenedor.items()) for x in par]
+            return list(contenedor)
+        except RuntimeError: # "changed size during iteration"
+            continue
+
+
+def tamano_profundo(obj, excluir=()):
+    """
+    Bytes de 'obj' y de todo lo que alcanza (dicts, listas, atributos),
+    contando cada objeto una vez. No entra en clases, módulos, funciones,
+    en el estado interno de SQLAlchemy (sesión, engine), que son del
+    proceso, ni en los objetos de 'excluir'. Solo lee: sirve con el motor
+    corriendo.
+    """
+    vistos = {id(x) for x in excluir}
+    pendientes = [obj]
+    total = 0
+    while pendientes:
+        actual = pendientes.pop()
+        if id(actual) in vistos or isinstance(actual, _TIPOS_COMPARTIDOS):
+            continue
+        vistos.add(id(actual))
+        total += sys.getsizeof(actual)
+
+        if isinstance(actual, (dict, list, tuple, set, frozenset)):
+            pendientes.extend(_elementos(actual))
+        elif hasattr(actual, '__dict__'):
+            atributos = _elementos(vars(actual))
+            pendientes.extend(v for k, v in zip(atributos[::2], atributos[1::2])
+                              if k != '_sa_instance_state')
+        elif hasattr(actual, '__slots__'):
+            pendientes.extend(getattr(actual, s) for s in actual.__slots__ if hasattr(actual, s))
+    return total
+
+
+def bytes_simulacion(engine, grabador=None, precisa=False):
+    """Bytes del motor (estimados o medidos) más los del replay grabado."""
+    if isinstance(engine, dict):
+        bytes_motor = tamano_profundo(engine) # Error o estado final (acierto de cache)
+    elif precisa:
+        # Sin los observadores (el publicador cierra sobre el backend
+        # compartido), pero sin tocarlos: el hilo del motor los sigue llamando
+        bytes_motor = tamano_profundo(engine, excluir=(engine.observadores_vuelta,))
+    else:
+        bytes_motor = engine.estimar_memoria()
+    bytes_replay = sum(len(r) for r in grabador.registros) if grabador else 0
+    return {"motor": bytes_motor, "replay": bytes_replay, "total": bytes_motor + bytes_replay}
+
+
+def memoria_proceso():
+    """RSS del proceso (Linux) y, si está activo, lo trazado por tracemalloc."""
+    resultado = {"rss_bytes": None, "tracemalloc_actual_bytes": None, "tracemalloc_pico_bytes": None}
+    try:
+        with open('/proc/self/statm') as f:
+            resultado["rss_bytes"] = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass # Fuera de Linux no hay /proc
+    if tracemalloc.is_tracing():
+        actual, pico = tracemalloc.get_traced_memory()
+        resultado["tracemalloc_actual_bytes"] = actual
+        resultado["tracemalloc_pico_bytes"] = pico
+    return resultado
+
+
+def presupuesto_bytes(config):
+    """MEMORIA_MAX_MB_POR_PROCESO en bytes; None si no hay límite (0)."""
+    mb = config.get('MEMORIA_MAX_MB_POR_PROCESO', 0)
+    return int(mb * 1024 * 1024) if mb else None
+
+
+def uso_simulaciones(simulaciones, replays, precisa=False):
+    """{sim_id: {"motor", "replay", "total"}} de todas las simulaciones locales."""
+    return {
+        sim_id: bytes_simulacion(engine, replays.get(sim_id), precisa)
+        for sim_id, engine in list(simulaciones.items())
+    }
+
+
+def liberar_memoria(simulaciones, replays, presupuesto, backend=None):
+    """
+    Desaloja simulaciones terminadas (o con error), de la más vieja a la más
+    nueva, hasta que lo contabilizado quede por debajo del presupuesto.
+    Si el backend de estado vive en este proceso (backend en memoria), su
+    snapshot y su replay se borran también; en un backend compartido siguen
+    disponibles hasta que expiran.
+    Devuelve (ids desalojados, bytes en uso tras desalojar).
+    """
+    uso = uso_simulaciones(simulaciones, replays)
+    en_uso = sum(u["total"] for u in uso.values())
+    desalojados = []
+    # Los dicts mantienen el orden de inserción: primero las más viejas
+    for sim_id, engine in list(simulaciones.items()):
+        if en_uso < presupuesto:
+            break
+        if isinstance(engine, dict):
+            terminada = engine.get("error") is not None or bool(engine.get("terminada"))
+        else:
+            terminada = engine.terminada
+        if not terminada:
+            continue
+        simulaciones.pop(sim_id, None)
+        replays.pop(sim_id, None)
+        if backend is not None and backend.en_proceso:
+            backend.eliminar(sim_id)
+        en_uso -= uso[sim_id]["total"]
+        desalojados.append(sim_id)
+    return desalojados, en_uso
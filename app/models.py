@@ -35,7 +35,8 @@ class Piloto(db.Model):
     moral = db.Column(db.Float, default=70.0)
     
     # Clave foránea para la relación 1-a-N con Equipo
-    equipo_id = db.Column(db.Integer, db.ForeignKey('equipos.id'), nullable=True) # Nullable=True para agentes libres
+    # (indexada: el motor y la API filtran/agrupan pilotos por equipo)
+    equipo_id = db.Column(db.Integer, db.ForeignKey('equipos.id'), nullable=True, index=True) # Nullable=True para agentes libres
 
 class Coche(db.Model):
     __tablename__ = 'coches'
@@ -64,7 +65,7 @@ class Staff(db.Model):
     salario = db.Column(db.Float, default=50000.0)
     moral = db.Column(db.Float, default=70.0)
     
-    equipo_id = db.Column(db.Integer, db.ForeignKey('equipos.id'), nullable=True)
+    equipo_id = db.Column(db.Integer, db.ForeignKey('equipos.id'), nullable=True, index=True)
 
 # --- Entidades de Simulación ---
 
@@ -83,4 +84,62 @@ class Circuito(db.Model):
     # Características del circuito
     desgaste_neumaticos = db.Column(db.Float, default=0.5) # Factor de 0 a 1
     prob_safety_car = db.Column(db.Float, default=0.1)     # Probabilidad por vuelta
-    prob_lluvia = db.Column(db.Float, default=0.05)
\ No newline at end of file
+    prob_lluvia = db.Column(db.Float, default=0.05)
+
+# --- Listas de Inscritos (quién corre cada carrera o liga) ---
+
+class ListaInscritos(db.Model):
+    __tablename__ = 'listas_inscritos'
+    id = db.Column(db.Integer, primary_key=True)
+    nombre = db.Column(db.String(100), nullable=False)
+    # Opcional: la carrera (circuito) para la que se armó la lista.
+    # Sin circuito, es la lista de una liga y sirve para cualquier carrera.
+    circuito_id = db.Column(db.Integer, db.ForeignKey('circuitos.id'), nullable=True)
+
+    inscripciones = db.relationship('Inscripcion', backref='lista', lazy=True, cascade='all, delete-orphan')
+
+class Inscripcion(db.Model):
+    __tablename__ = 'inscripciones'
+    # La restricción única (lista_id, piloto_id) también es el índice con el
+    # que el motor busca los inscritos de una lista.
+    __table_args__ = (db.UniqueConstraint('lista_id', 'piloto_id', name='uq_inscripciones_lista_piloto'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    lista_id = db.Column(db.Integer, db.ForeignKey('listas_inscritos.id'), nullable=False)
+    piloto_id = db.Column(db.Integer, db.ForeignKey('pilotos.id'), nullable=False, index=True)
+
+# --- Cola de lotes de simulación (ver app/cola_lotes.py) ---
+
+class TrabajoLote(db.Model):
+    __tablename__ = 'trabajos_lote'
+    id = db.Column(db.Integer, primary_key=True)
+    # pendiente -> en_curso -> terminado (o terminado_con_errores)
+    estado = db.Column(db.String(30), nullable=False, default='pendiente')
+    parametros = db.Column(db.Text, nullable=False) # JSON: circuitos, carreras, lista, params...
+    chunks_total = db.Column(db.Integer, nullable=False, default=0)
+    chunks_hechos = db.Column(db.Integer, nullable=False, default=0)
+    chunks_fallidos = db.Column(db.Integer, nullable=False, default=0)
+    carreras_total = db.Column(db.Integer, nullable=False, default=0)
+    carreras_hechas = db.Column(db.Integer, nullable=False, default=0)
+    agregado = db.Column(db.Text) # JSON: suma de los agregados parciales de los chunks
+    creado_en = db.Column(db.DateTime, server_default=db.func.now())
+    terminado_en = db.Column(db.DateTime)
+
+    chunks = db.relationship('ChunkLote', backref='trabajo', lazy=True, cascade='all, delete-orphan')
+
+class ChunkLote(db.Model):
+    __tablename__ = 'chunks_lote'
+    # Los workers buscan chunks por estado y vencimiento del lease
+    __table_args__ = (db.Index('ix_chunks_lote_estado_lease', 'estado', 'lease_hasta'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    trabajo_id = db.Column(db.Integer, db.ForeignKey('trabajos_lote.id'), nullable=False, index=True)
+    circuito_id = db.Column(db.Integer, nullable=False)
+    semilla_desde = db.Column(db.Integer, nullable=False) # Semillas [desde, hasta)
+    semilla_hasta = db.Column(db.Integer, nullable=False)
+    # pendiente -> en_curso -> hecho (o fallido tras agotar los intentos)
+    estado = db.Column(db.String(20), nullable=False, default='pendiente')
+    worker = db.Column(db.String(100)) # Quién tiene el lease
+    lease_hasta = db.Column(db.Float) # Epoch (segundos): vencido, otro worker lo puede tomar
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
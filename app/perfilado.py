@@ -0,0 +1,114 @@
+# Contenido para: app/perfilado.py
+
+import cProfile
+import os
+import pstats
+import time
+from collections import defaultdict
+
+from app.engine import SimulationEngine
+import app.engine as modulo_engine
+
+# --- PERFILADO DE UNA CARRERA ---
+# Corre una carrera bajo cProfile y devuelve:
+#  - Las funciones del motor (app/engine.py) con más tiempo propio.
+#  - Pilas "colapsadas" (una línea "a;b;c microsegundos" por pila), el
+#    formato que aceptan flamegraph.pl, speedscope o inferno.
+# cProfile solo guarda pares llamador -> llamado, así que las pilas se
+# reconstruyen repartiendo el tiempo de cada función entre sus llamadores
+# en proporción al tiempo acumulado de cada llamada (aproximación estándar).
+#
+# Nada de esto se importa ni se ejecuta si no se pide: el motor no tiene
+# ganchos de perfilado, así que desactivado no cuesta nada.
+
+ARCHIVO_ENGINE = os.path.normcase(os.path.abspath(modulo_engine.__file__))
+PROFUNDIDAD_MAXIMA = 30
+
+
+def _es_del_motor(funcion):
+    archivo = funcion[0]
+    return archivo != '~' and os.path.normcase(os.path.abspath(archivo)) == ARCHIVO_ENGINE
+
+
+def _nombre(funcion):
+    archivo, linea, nombre = funcion
+    if archivo == '~':
+        return nombre # Builtins: "<built-in method ...>"
+    return f"{os.path.basename(archivo)}:{nombre}"
+
+
+def perfilar_carrera(circuito_id, semilla=None, lista_id=None, modo_sectores=False, top=20):
+    """
+    Crea y corre una carrera bajo cProfile. Necesita un app_context
+    (el motor carga los datos de la BD antes de empezar a perfilar).
+    """
+    engine = SimulationEngine(circuito_id, semilla=semilla, lista_id=lista_id, modo_sectores=modo_sectores)
+
+    perfil = cProfile.Profile()
+    inicio = time.perf_counter()
+    perfil.enable()
+    try:
+        engine.run_simulation()
+    finally:
+        perfil.disable()
+    duracion = time.perf_counter() - inicio
+
+    estadisticas = pstats.Stats(perfil).stats
+    return {
+        "circuito_id": circuito_id,
+        "semilla": semilla,
+        "pilotos": len(engine.pilotos_en_carrera),
+        "vueltas": engine.vueltas_totales,
+        "duracion_s": duracion,
+        "top_tiempo_propio": _top_funciones(estadisticas, top),
+        "pilas_colapsadas": _pilas_colapsadas(estadisticas),
+    }
+
+
+def _top_funciones(estadisticas, top):
+    """Funciones del motor ordenadas por tiempo propio (sin contar lo que llaman)."""
+    filas = [
+        {
+            "funcion": _nombre(funcion),
+            "llamadas": nc,
+            "tiempo_propio_ms": tt * 1000,
+            "tiempo_acumulado_ms": ct * 1000,
+        }
+        for funcion, (cc, nc, tt, ct, llamadores) in estadisticas.items()
+        if _es_del_motor(funcion)
+    ]
+    filas.sort(key=lambda f: f["tiempo_propio_ms"], reverse=True)
+    return filas[:top]
+
+
+def _pilas_colapsadas(estadisticas):
+    """Reconstruye las pilas desde run_simulation. Devuelve el texto colapsado."""
+    llamados = defaultdict(list) # llamador -> [(llamado, tiempo acumulado de esa llamada)]
+    raiz = None
+    for funcion, (cc, nc, tt, ct, llamadores) in estadisticas.items():
+        if _es_del_motor(funcion) and funcion[2] == 'run_simulation':
+            raiz = funcion
+        for llamador, datos_llamada in llamadores.items():
+            llamados[llamador].append((funcion, datos_llamada[3]))
+
+    if raiz is None:
+        return ""
+
+    pesos = defaultdict(float)
+
+    def recorrer(funcion, pila, fraccion):
+        tt, ct = estadisticas[funcion][2], estadisticas[funcion][3]
+        pesos[pila] += tt * fraccion
+        # Solo bajamos dentro del motor; lo demás (random, builtins) queda como hoja
+        if not _es_del_motor(funcion) or pila.count(';') >= PROFUNDIDAD_MAXIMA:
+            return
+        for llamado, ct_llamada in llamados[funcion]:
+            ct_llamado = estadisticas[llamado][3]
+            if ct_llamado <= 0 or f";{_nombre(llamado)};" in f";{pila};":
+                continue # Sin tiempo o recursión: no seguimos
+            recorrer(llamado, f"{pila};{_nombre(llamado)}", fraccion * ct_llamada / ct_llamado)
+
+    recorrer(raiz, _nombre(raiz), 1.0)
+
+    lineas = [f"{pila} {int(round(segundos * 1e6))}" for pila, segundos in pesos.items()]
+    return "\n".join(linea for linea in lineas if not linea.endswith(" 0"))
@@ -0,0 +1,70 @@
+# Contenido para: app/pool.py
+
+import threading
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class PoolInstrumentado(QueuePool):
+    """
+    QueuePool que además mide cuánto espera cada petición para obtener una
+    conexión (checkout) y cuántas veces se agotó el pool_timeout.
+    Se usa con PostgreSQL (ver create_app); las métricas se reinician si el
+    pool se recrea (engine.dispose()).
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock_metricas = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+
+    def connect(self):
+        inicio = time.perf_counter()
+        try:
+            conexion = super().connect()
+        except PoolTimeoutError:
+            with self._lock_metricas:
+                self.timeouts += 1
+            raise
+
+        espera = time.perf_counter() - inicio
+        with self._lock_metricas:
+            self.checkouts += 1
+            self.espera_total += espera
+            self.espera_max = max(self.espera_max, espera)
+        return conexion
+
+    def metricas_espera(self):
+        with self._lock_metricas:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "espera_media_ms": (self.espera_total / self.checkouts * 1000) if self.checkouts else 0.0,
+                "espera_max_ms": self.espera_max * 1000,
+            }
+
+
+def metricas_pool(engine):
+    """Estado del pool de conexiones de un engine de SQLAlchemy."""
+    pool = engine.pool
+    metricas = {"tipo": type(pool).__name__, "estado": pool.status()}
+
+    if isinstance(pool, QueuePool):
+        capacidad = pool.size() + max(pool._max_overflow, 0)
+        en_uso = pool.checkedout()
+        metricas.update({
+            "tamano": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "en_uso": en_uso,
+            "libres": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "utilizacion": (en_uso / capacidad) if capacidad > 0 else None,
+        })
+
+    if isinstance(pool, PoolInstrumentado):
+        metricas.update(pool.metricas_espera())
+
+    return metricas
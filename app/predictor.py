@@ -0,0 +1,245 @@
+# Contenido para: app/predictor.py
+
+import math
+import time
+
+from app.engine import (SimulationEngine, PilotoEnCarrera, ParametrosBalanceo,
+                        UMBRAL_DESGASTE_PIT, DISPERSION_CAMBIO_GOMAS, FACTOR_PS_ERROR)
+
+# --- PREDICTOR ANALÍTICO DE RESULTADOS ---
+# Probabilidades de posición final sin simular: se derivan de las mismas
+# fórmulas del motor (SimulationEngine._ps_clasificacion, los modificadores
+# de vuelta, _prob_error_vuelta, _prob_fallo_vuelta) en milisegundos.
+#
+# Para cada piloto, el tiempo total de carrera se aproxima por una normal:
+#  - PS base = ps * (1 + U(-r, r) / 10): media ps, varianza ps² r² / 300.
+#    Es el mismo para toda la carrera, así que su varianza pesa (0.1 L)².
+#  - Vueltas: el plan de desgaste, combustible y paradas de la IA es
+#    determinista (ritmo Normal), igual para todos los pilotos.
+#  - Errores: Bernoulli por vuelta; cada uno suma 0.1 (1 - 0.8) PS segundos.
+#  - Ruido: U(-0.05, 0.05) por vuelta.
+#  - Paradas: el cambio de gomas de los mecánicos de su equipo
+#    (SimulationEngine.boxes), ± DISPERSION_CAMBIO_GOMAS, más el error en
+#    boxes (Bernoulli por parada).
+# Un abandono es 1 - (1 - (1 - pe) pf)^vueltas (el fallo solo se chequea
+# si no hubo error en esa vuelta). P(j delante de i) sale de la diferencia
+# de normales. Fijado el tiempo de i, "j llega antes" son Bernoulli
+# independientes, y la posición de i sale de sumarlos (Poisson-binomial,
+# por programación dinámica), integrando sobre el tiempo de i.
+#
+# No modela el tráfico (DRS / aire sucio), el Safety Car, la espera de la
+# doble parada ni las órdenes en vivo: compararlo con Monte Carlo
+# (comparar_con_montecarlo) dice cuánto se equivoca para una parrilla y un
+# circuito dados. Con pocas carreras, el propio Monte Carlo tiene ruido:
+# el veredicto descuenta ese ruido, para que dependa del modelo y no de N.
+
+# Distancia de variación total media (0 a 1), descontado el ruido de
+# muestreo, a partir de la cual conviene volver a Monte Carlo
+UMBRAL_DISTANCIA_TV = 0.15
+# Desvíos estándar de muestreo que puede errar una probabilidad suelta
+# (hay ~n² probabilidades por comparación: 4σ casi nunca es azar)
+MAX_SIGMAS_ERROR = 4.0
+
+_VARIANZA_RUIDO_VUELTA = 0.1 ** 2 / 12 # U(-0.05, 0.05)
+_VARIANZA_CAMBIO_GOMAS = (2 * DISPERSION_CAMBIO_GOMAS) ** 2 / 12
+
+
+def _nodos_normal(n, limite=4.0):
+    """Cuadratura simple de la normal estándar: n puntos en [-limite, limite]."""
+    paso = 2 * limite / n
+    nodos = [-limite + (k + 0.5) * paso for k in range(n)]
+    pesos = [math.exp(-z * z / 2) for z in nodos]
+    total = sum(pesos)
+    return [(z, w / total) for z, w in zip(nodos, pesos)]
+
+
+_CUADRATURA = _nodos_normal(24)
+
+
+def plan_de_carrera(engine):
+    """
+    Vueltas en pista y paradas de un piloto que nunca cambia de ritmo,
+    con las mismas reglas de desgaste, combustible y paradas de la IA.
+    Devuelve (lista de modificadores de PS por vuelta en pista, n.º de paradas).
+    """
+    coche = PilotoEnCarrera(None, None) # Solo se usa su estado dinámico
+    modificadores = []
+    paradas = 0
+    for _ in range(engine.vueltas_totales):
+        if coche.neumatico_desgaste > UMBRAL_DESGASTE_PIT:
+            paradas += 1
+            coche.neumatico_desgaste = 0.0
+            coche.neumatico_vueltas = 0
+            continue
+        modificadores.append(engine._calcular_mod_neumaticos(coche) + engine._calcular_mod_combustible(coche))
+        coche.actualizar_desgaste(engine.circuito.desgaste_neumaticos)
+        coche.actualizar_combustible()
+    return modificadores, paradas
+
+
+def _distribucion_tiempo(engine, p, modificadores, paradas):
+    """(media, varianza, prob. de abandono) del tiempo total de un piloto."""
+    ps, rango = engine._ps_clasificacion(p)
+    varianza_ps = ps ** 2 * rango ** 2 / 300
+    vueltas = len(modificadores)
+
+    pe = engine._prob_error_vuelta(p)
+    pf = engine._prob_fallo_vuelta(p)
+    prob_dnf = 1 - (1 - (1 - pe) * pf) ** vueltas
+    # Sabiendo que termina, ninguna vuelta tuvo fallo: el error se condiciona a eso
+    pe_termina = min(pe / (1 - (1 - pe) * pf), 1.0)
+
+    media = 0.0
+    varianza = (0.1 * vueltas) ** 2 * varianza_ps + vueltas * _VARIANZA_RUIDO_VUELTA
+    for mod in modificadores:
+        ps_vuelta = ps + mod
+        perdida_error = 0.1 * (1 - FACTOR_PS_ERROR) * ps_vuelta
+        media += engine._ps_a_segundos(ps_vuelta) + pe_termina * perdida_error
+        varianza += pe_termina * (1 - pe_termina) * perdida_error ** 2
+
+    tiempo_cambio, prob_error_pit = engine.boxes[p.piloto_db.id]
+    perdida_pit = engine.params.tiempo_error_pit
+    media += paradas * (engine.params.tiempo_base_pit_stop + tiempo_cambio + prob_error_pit * perdida_pit)
+    varianza += paradas * (_VARIANZA_CAMBIO_GOMAS + prob_error_pit * (1 - prob_error_pit) * perdida_pit ** 2)
+    return media, varianza, prob_dnf
+
+
+def _poisson_binomial(probabilidades):
+    """Distribución de la suma de Bernoulli independientes: [P(suma = k)]."""
+    dp = [1.0]
+    for q in probabilidades:
+        siguiente = [0.0] * (len(dp) + 1)
+        for k, valor in enumerate(dp):
+            siguiente[k] += valor * (1 - q)
+            siguiente[k + 1] += valor * q
+        dp = siguiente
+    return dp
+
+
+def predecir(engine):
+    """
+    Predicción para un motor ya cargado (sin correr). Por piloto: tiempo
+    esperado, probabilidad de abandono y de cada posición final.
+    """
+    inicio = time.perf_counter()
+    modificadores, paradas = plan_de_carrera(engine)
+    pilotos = engine.pilotos_en_carrera
+    distribuciones = [_distribucion_tiempo(engine, p, modificadores, paradas) for p in pilotos]
+
+    # (media, desvío * raíz de 2, prob. de terminar) para evaluar Φ con erf directamente
+    rivales = [(media, math.sqrt(2 * var), 1 - dnf) for media, var, dnf in distribuciones]
+    erf = math.erf
+
+    resultado = []
+    for i, p in enumerate(pilotos):
+        media_i, var_i, dnf_i = distribuciones[i]
+        desvio_i = math.sqrt(var_i)
+        otros = rivales[:i] + rivales[i + 1:]
+        # Condicionando en el tiempo de i, "j llega antes" son eventos
+        # independientes: se integra sobre el tiempo de i por cuadratura
+        posiciones = [0.0] * len(pilotos)
+        for z, peso in _CUADRATURA:
+            t = media_i + z * desvio_i
+            delante = [termina * 0.5 * (1 + erf((t - media) / escala)) for media, escala, termina in otros]
+            for k, q in enumerate(_poisson_binomial(delante)):
+                posiciones[k] += peso * q
+        posiciones = [(1 - dnf_i) * q for q in posiciones]
+        resultado.append({
+            "piloto_id": p.piloto_db.id,
+            "nombre": p.piloto_db.nombre,
+            "equipo_id": p.piloto_db.equipo_id,
+            "tiempo_esperado": media_i,
+            "desvio_tiempo": desvio_i,
+            "prob_dnf": dnf_i,
+            "prob_victoria": posiciones[0],
+            "prob_podio": sum(posiciones[:3]),
+            # Posición esperada si termina la carrera
+            "posicion_esperada": (sum((k + 1) * q for k, q in enumerate(posiciones)) / (1 - dnf_i)
+                                  if dnf_i < 1 else None),
+            "prob_posiciones": posiciones,
+        })
+
+    resultado.sort(key=lambda r: (r["posicion_esperada"] is None, r["posicion_esperada"]))
+    return {
+        "circuito_id": engine.circuito.id,
+        "vueltas": engine.vueltas_totales,
+        "paradas_previstas": paradas,
+        "duracion_ms": (time.perf_counter() - inicio) * 1000,
+        "pilotos": resultado,
+    }
+
+
+def filtrar_pilotos(engine, piloto_ids):
+    """Deja en el motor solo los pilotos pedidos (alineación en edición)."""
+    if piloto_ids is None:
+        return engine
+    if not isinstance(piloto_ids, (list, tuple)) or not all(
+            isinstance(i, int) and not isinstance(i, bool) for i in piloto_ids):
+        raise ValueError("piloto_ids debe ser una lista de ids (enteros)")
+    ids = set(piloto_ids)
+    engine.pilotos_en_carrera = [p for p in engine.pilotos_en_carrera if p.piloto_db.id in ids]
+    return engine
+
+
+def comparar_con_montecarlo(prediccion, datos, carreras, lista_id=None, piloto_ids=None,
+                            params=None, semilla_inicial=0):
+    """
+    Corre 'carreras' simulaciones completas con las mismas entradas
+    ('datos' = (circuito, participantes), ver SimulationEngine.datos) y mide
+    el error de la predicción. No toca la BD.
+    """
+    if isinstance(params, dict):
+        params = ParametrosBalanceo.desde_dict(params)
+    circuito, participantes = datos
+    n = len(prediccion["pilotos"])
+    conteos = {r["piloto_id"]: [0] * (n + 1) for r in prediccion["pilotos"]} # [P1..Pn, DNF]
+
+    inicio = time.perf_counter()
+    for semilla in range(semilla_inicial, semilla_inicial + carreras):
+        engine = filtrar_pilotos(SimulationEngine.desde_datos(circuito, participantes, semilla=semilla,
+                                                              lista_id=lista_id, params=params), piloto_ids)
+        engine.run_simulation()
+        for p in engine.orden_pilotos:
+            conteos[p.piloto_db.id][p.posicion_actual - 1 if p.esta_en_pista else n] += 1
+    duracion = time.perf_counter() - inicio
+
+    error_victoria = error_dnf = distancia_tv = ruido_tv = error_posicion = sigmas_max = 0.0
+    con_posicion = 0
+    piso = 1 / max(carreras, 1) # Una probabilidad predicha de 0 igual admite un caso
+    for r in prediccion["pilotos"]:
+        empiricas = [c / carreras for c in conteos[r["piloto_id"]]]
+        predichas = r["prob_posiciones"] + [r["prob_dnf"]]
+        error_victoria = max(error_victoria, abs(predichas[0] - empiricas[0]))
+        error_dnf = max(error_dnf, abs(predichas[n] - empiricas[n]))
+        distancia_tv += 0.5 * sum(abs(a - b) for a, b in zip(predichas, empiricas))
+        for a, b in zip(predichas, empiricas):
+            q = min(max(a, piso), 1 - piso)
+            sigma = math.sqrt(q * (1 - q) / carreras)
+            sigmas_max = max(sigmas_max, abs(a - b) / sigma)
+            # Si el modelo fuera exacto, E|p̂ - p| = σ·sqrt(2/π) (aprox. normal)
+            ruido_tv += 0.5 * math.sqrt(2 / math.pi) * math.sqrt(a * (1 - a) / carreras)
+        terminadas = 1 - empiricas[n]
+        if terminadas > 0 and r["posicion_esperada"] is not None:
+            esperada = sum((k + 1) * q for k, q in enumerate(empiricas[:n])) / terminadas
+            error_posicion += abs(r["posicion_esperada"] - esperada)
+            con_posicion += 1
+
+    distancia_tv /= max(n, 1)
+    ruido_tv /= max(n, 1)
+    distancia_tv_corregida = max(distancia_tv - ruido_tv, 0.0)
+    return {
+        "carreras": carreras,
+        "duracion_montecarlo_ms": duracion * 1000,
+        "error_max_prob_victoria": error_victoria,
+        "error_max_prob_dnf": error_dnf,
+        "error_medio_posicion_esperada": error_posicion / con_posicion if con_posicion else None,
+        "distancia_tv_media": distancia_tv,
+        # Lo que daría la distancia TV solo por el ruido de N carreras, y la distancia sin él
+        "distancia_tv_ruido_esperado": ruido_tv,
+        "distancia_tv_corregida": distancia_tv_corregida,
+        # Mayor error de una probabilidad, en desvíos estándar de muestreo
+        "error_max_sigmas": sigmas_max,
+        # Ruido propio de Monte Carlo en una probabilidad (peor caso, p = 0.5)
+        "error_estandar_montecarlo": math.sqrt(0.25 / carreras) if carreras else None,
+        "fiable": distancia_tv_corregida <= UMBRAL_DISTANCIA_TV and sigmas_max <= MAX_SIGMAS_ERROR,
+    }
@@ -0,0 +1,212 @@
+# Contenido para: app/replay.py
+
+import json
+import struct
+
+# --- REPLAYS DE CARRERA (keyframes + deltas) ---
+# Cada vuelta se graba como un registro binario compacto:
+#  - Cada INTERVALO_KEYFRAME vueltas, un KEYFRAME con el estado completo.
+#  - El resto, un DELTA contra la vuelta anterior: por piloto, una máscara
+#    de qué cambió y solo esos valores.
+# Para ver la vuelta N se parte del keyframe anterior a N y se aplican como
+# mucho INTERVALO_KEYFRAME - 1 deltas: el costo de buscar es constante,
+# sin importar lo larga que sea la carrera.
+#
+# Los valores se guardan cuantizados (tiempo en ms, desgaste/combustible/
+# batería en décimas), y los deltas son diferencias de esos enteros, así la
+# reconstrucción es exacta (sin error acumulado).
+
+INTERVALO_KEYFRAME = 10
+
+# Cabecera de cada registro: vuelta, tipo (0 = keyframe, 1 = delta), estado de pista
+_CABECERA = struct.Struct('<HBB')
+# Keyframe, por piloto: posicion, flags, tiempo_ms, desgaste, combustible, bateria
+_KEYFRAME_PILOTO = struct.Struct('<HBIHhH')
+# Delta, por piloto: (formato, absoluto) de cada campo, en el mismo orden.
+# Posición y flags van en absoluto; el resto, como diferencia con la vuelta anterior.
+_CAMPOS_DELTA = (('H', True), ('B', True), ('i', False), ('h', False), ('h', False), ('h', False))
+
+ESTADOS_PISTA = ("Seco", "Lluvia", "SafetyCar")
+_FLAG_EN_PISTA = 1
+_FLAG_EN_PITS = 2
+
+_MAGIA = b'F1RP'
+_VERSION_FORMATO = 1
+
+
+def _cuantizar(p):
+    """Estado de un PilotoEnCarrera como tupla de enteros (mismo orden que _CAMPOS_DELTA)."""
+    flags = (_FLAG_EN_PISTA if p.esta_en_pista else 0) | (_FLAG_EN_PITS if p.esta_en_pit_lane else 0)
+    return (
+        p.posicion_actual,
+        flags,
+        int(round(p.tiempo_total_carrera * 1000)),
+        int(round(p.neumatico_desgaste * 10)),
+        int(round(p.combustible_actual * 10)),
+        int(round(p.bateria_ers * 10)),
+    )
+
+
+class GrabadorReplay:
+    """
+    Graba una carrera vuelta a vuelta. Se engancha al motor como observador
+    de vuelta (ver SimulationEngine.observadores_vuelta).
+    """
+    def __init__(self, pilotos):
+        # Datos estáticos, una sola vez: [{"id", "nombre", "equipo_id"}, ...]
+        # en el orden fijo de engine.pilotos_en_carrera
+        self.pilotos = pilotos
+        self.registros = [] # bytes por vuelta: registros[v] es la vuelta v (0 = parrilla)
+        self._ultimo_estado = None
+
+    @classmethod
+    def para_motor(cls, engine):
+        pilotos = [
+            {"id": p.piloto_db.id, "nombre": p.piloto_db.nombre, "equipo_id": p.piloto_db.equipo_id}
+            for p in engine.pilotos_en_carrera
+        ]
+        return cls(pilotos)
+
+    def __call__(self, engine):
+        """Observador de vuelta: graba la vuelta actual (una sola vez por vuelta)."""
+        if engine.vuelta_actual != len(self.registros):
+            return # La notificación final repite la última vuelta
+        estado = [_cuantizar(p) for p in engine.pilotos_en_carrera]
+        codigo_pista = ESTADOS_PISTA.index(engine.estado_pista) if engine.estado_pista in ESTADOS_PISTA else 0
+
+        if engine.vuelta_actual % INTERVALO_KEYFRAME == 0 or self._ultimo_estado is None:
+            registro = self._codificar_keyframe(engine.vuelta_actual, codigo_pista, estado)
+        else:
+            registro = self._codificar_delta(engine.vuelta_actual, codigo_pista, estado)
+
+        self.registros.append(registro)
+        self._ultimo_estado = estado
+
+    def fork(self, vuelta):
+        """Grabador para un fork desde 'vuelta': comparte los registros hasta ahí."""
+        nuevo = GrabadorReplay(self.pilotos)
+        nuevo.registros = self.registros[:vuelta + 1]
+        nuevo._ultimo_estado = self._reconstruir_estado(vuelta)
+        return nuevo
+
+    # --- Codificación ---
+
+    def _codificar_keyframe(self, vuelta, codigo_pista, estado):
+        partes = [_CABECERA.pack(vuelta, 0, codigo_pista)]
+        partes.extend(_KEYFRAME_PILOTO.pack(*valores) for valores in estado)
+        return b''.join(partes)
+
+    def _codificar_delta(self, vuelta, codigo_pista, estado):
+        partes = [_CABECERA.pack(vuelta, 1, codigo_pista)]
+        for anterior, actual in zip(self._ultimo_estado, estado):
+            mascara = 0
+            valores = []
+            formato = '<'
+            for i, (fmt, absoluto) in enumerate(_CAMPOS_DELTA):
+                if actual[i] != anterior[i]:
+                    mascara |= 1 << i
+                    valores.append(actual[i] if absoluto else actual[i] - anterior[i])
+                    formato += fmt
+            partes.append(bytes([mascara]))
+            if valores:
+                partes.append(struct.pack(formato, *valores))
+        return b''.join(partes)
+
+    # --- Decodificación ---
+
+    def _aplicar_delta(self, registro, estado):
+        offset = _CABECERA.size
+        nuevo = []
+        for anterior in estado:
+            mascara = registro[offset]
+            offset += 1
+            valores = list(anterior)
+            for i, (fmt, absoluto) in enumerate(_CAMPOS_DELTA):
+                if mascara & (1 << i):
+                    (valor,) = struct.unpack_from('<' + fmt, registro, offset)
+                    offset += struct.calcsize('<' + fmt)
+                    valores[i] = valor if absoluto else valores[i] + valor
+            nuevo.append(tuple(valores))
+        return nuevo
+
+    def _reconstruir_estado(self, vuelta):
+        """Estado cuantizado de la vuelta: keyframe más cercano + sus deltas."""
+        inicio = vuelta
+        while _CABECERA.unpack_from(self.registros[inicio])[1] != 0:
+            inicio -= 1 # Como mucho INTERVALO_KEYFRAME - 1 pasos
+        estado = [
+            _KEYFRAME_PILOTO.unpack_from(self.registros[inicio], _CABECERA.size + i * _KEYFRAME_PILOTO.size)
+            for i in range(len(self.pilotos))
+        ]
+        for v in range(inicio + 1, vuelta + 1):
+            estado = self._aplicar_delta(self.registros[v], estado)
+        return estado
+
+    @property
+    def vueltas_grabadas(self):
+        return len(self.registros) - 1
+
+    def clasificacion(self, vuelta):
+        """Clasificación completa en 'vuelta', con el mismo formato que get_status."""
+        if not 0 <= vuelta < len(self.registros):
+            raise ValueError(f"La vuelta {vuelta} no está grabada (0 a {self.vueltas_grabadas})")
+
+        estado = self._reconstruir_estado(vuelta)
+        codigo_pista = _CABECERA.unpack_from(self.registros[vuelta])[2]
+        pilotos = []
+        for datos, (posicion, flags, tiempo, desgaste, combustible, bateria) in zip(self.pilotos, estado):
+            pilotos.append({
+                "posicion": posicion,
+                "nombre": datos["nombre"],
+                "equipo_id": datos["equipo_id"],
+                "tiempo_total": tiempo / 1000,
+                "desgaste_neumatico": desgaste / 10,
+                "combustible": combustible / 10,
+                "bateria": bateria / 10,
+                "en_pista": bool(flags & _FLAG_EN_PISTA),
+                "en_pits": bool(flags & _FLAG_EN_PITS),
+            })
+        pilotos.sort(key=lambda p: p["posicion"])
+
+        return {
+            "vuelta": vuelta,
+            "vueltas_grabadas": self.vueltas_grabadas,
+            "estado_pista": ESTADOS_PISTA[codigo_pista],
+            "pilotos": pilotos,
+        }
+
+    def estadisticas(self):
+        """Bytes usados frente a guardar un snapshot JSON completo por vuelta (estimado)."""
+        bytes_replay = sum(len(r) for r in self.registros)
+        bytes_snapshots = 0
+        if self.registros:
+            ultima = self.clasificacion(self.vueltas_grabadas)["pilotos"]
+            bytes_snapshots = len(json.dumps(ultima)) * len(self.registros)
+        return {"bytes_replay": bytes_replay, "bytes_snapshots_estimados": bytes_snapshots}
+
+    # --- Serialización (para guardarlo en el backend de estado) ---
+
+    def a_bytes(self):
+        roster = json.dumps(self.pilotos).encode()
+        partes = [_MAGIA, struct.pack('<BII', _VERSION_FORMATO, len(roster), len(self.registros)), roster]
+        for registro in self.registros:
+            partes.append(struct.pack('<I', len(registro)))
+            partes.append(registro)
+        return b''.join(partes)
+
+    @classmethod
+    def desde_bytes(cls, datos):
+        if datos[:4] != _MAGIA:
+            raise ValueError("No es un replay válido")
+        version, largo_roster, n_registros = struct.unpack_from('<BII', datos, 4)
+        if version != _VERSION_FORMATO:
+            raise ValueError(f"Versión de replay no soportada: {version}")
+        offset = 4 + struct.calcsize('<BII')
+        grabador = cls(json.loads(datos[offset:offset + largo_roster]))
+        offset += largo_roster
+        for _ in range(n_registros):
+            (largo,) = struct.unpack_from('<I', datos, offset)
+            offset += 4
+            grabador.registros.append(datos[offset:offset + largo])
+            offset += largo
+        return grabador
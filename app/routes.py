@@ -1,23 +1,158 @@
 # Contenido para: app/routes.py
 
-from flask import Blueprint, request, jsonify
-from app import db, create_app
-from app.models import Circuito
-from app.engine import SimulationEngine
+from flask import Blueprint, request, jsonify, current_app
+from app import db
+from sqlalchemy.orm import joinedload, selectinload
+from app.models import Circuito, Equipo, Piloto, Coche, ListaInscritos, Inscripcion, TrabajoLote
+from app.cache_http import respuesta_cacheable, leer_paginacion, leer_campos, filtrar_campos
+from app.engine import SimulationEngine, ParametrosBalanceo
+from app.pool import metricas_pool
+from app.memoria import (presupuesto_bytes, uso_simulaciones, liberar_memoria,
+                         memoria_proceso, medicion_precisa)
+from app.replay import GrabadorReplay
+from app.cache_resultados import clave_carrera
+from app.predictor import predecir, filtrar_pilotos, comparar_con_montecarlo
+from app.cola_lotes import crear_trabajo, progreso_trabajo
+from app.codificacion import respuesta_negociada
+import base64
+import json
+import math
 import threading
 import time
+import uuid
 
 # Creamos un "Blueprint", que es un grupo de rutas para nuestra API
 api_bp = Blueprint('api', __name__)
 
-# --- GESTIÓN DE ESTADO (simple) ---
-# Usamos un diccionario global para guardar las simulaciones activas.
-# En una app "pro", usarías Redis para esto, pero esto es perfecto para empezar.
-# Guardará: {"sim_id_123": <objeto SimulationEngine>, "sim_id_456": ...}
+# --- GESTIÓN DE ESTADO ---
+# Los motores viven en el proceso (worker) que los creó, en este dict local:
+# {"sim_id_123": <objeto SimulationEngine>, "sim_id_456": ...}
+# Lo que tienen que ver los demás workers (snapshot de cada vuelta y órdenes
+# pendientes) va al backend compartido de app/estado.py.
 active_simulations = {}
 
+# Grabación de cada simulación local (sim_id -> GrabadorReplay). Al terminar
+# la carrera, el replay se guarda también en el backend compartido.
+replays_locales = {}
 
-def simulation_thread_target(app_context, circuito_id, sim_id):
+# Máximo de carreras Monte Carlo para validar una predicción en un pedido:
+# corren en el hilo de la petición (~9 ms cada una), así que se mantiene por
+# debajo del segundo. Para más carreras, la cola de lotes (POST /batch).
+MAX_CARRERAS_COMPARACION = 100
+
+# Acciones que acepta SimulationEngine.update_piloto_strategy
+ACCIONES_VALIDAS = ("solicitar_pit_stop", "Normal", "Ataque", "Conservador")
+
+
+def obtener_backend():
+    """Backend de estado compartido de la app actual."""
+    return current_app.extensions['estado_simulaciones']
+
+
+def publicador_estado(backend, sim_id, grabador):
+    """
+    Observador de vuelta: aplica las órdenes encoladas por otros workers
+    y publica el estado de la carrera (y al final, su replay) en el backend compartido.
+    """
+    def publicar(engine):
+        for comando in backend.extraer_comandos(sim_id):
+            resultado = engine.update_piloto_strategy(comando['piloto_id'], comando['accion'])
+            if "error" in resultado:
+                print(f"Orden ignorada en {sim_id}: {resultado['error']}")
+        backend.guardar_snapshot(sim_id, engine.get_status())
+        if engine.terminada:
+            backend.guardar_replay(sim_id, grabador.a_bytes())
+    return publicar
+
+
+def registrar_simulacion(backend, sim_id, engine, grabador=None):
+    """
+    Guarda el motor en este worker, le engancha el grabador de replay
+    y lo conecta al backend compartido.
+    """
+    grabador = grabador or GrabadorReplay.para_motor(engine)
+    active_simulations[sim_id] = engine
+    replays_locales[sim_id] = grabador
+    engine.observadores_vuelta.append(grabador)
+    engine.observadores_vuelta.append(publicador_estado(backend, sim_id, grabador))
+    backend.guardar_snapshot(sim_id, engine.get_status())
+
+
+def registrar_resultado(backend, sim_id, status, replay):
+    """
+    Como registrar_simulacion, para una carrera ya terminada (acierto de la
+    cache): sin motor, el estado final ocupa su lugar en active_simulations,
+    así /metrics/memoria la cuenta y el presupuesto la puede desalojar.
+    """
+    active_simulations[sim_id] = status
+    replays_locales[sim_id] = GrabadorReplay.desde_bytes(replay)
+    backend.guardar_replay(sim_id, replay)
+    backend.guardar_snapshot(sim_id, status)
+
+
+def obtener_cache():
+    """Cache de resultados de la app actual (None si está desactivada)."""
+    return current_app.extensions.get('cache_resultados')
+
+
+def leer_comandos(data):
+    """[{"vuelta", "piloto_id", "accion"}, ...] del body -> [(vuelta, piloto_id, accion)]."""
+    try:
+        return [(int(c['vuelta']), c['piloto_id'], c['accion']) for c in data.get('comandos', [])]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("comandos debe ser una lista de {vuelta, piloto_id, accion}")
+
+
+def guardar_en_cache(cache, clave, grabador):
+    """
+    Observador de vuelta: al terminar, guarda el estado final y el replay
+    en la cache de resultados. Si el jugador dio órdenes en vivo, la carrera
+    ya no depende solo de sus entradas y no se guarda.
+    """
+    def guardar(engine):
+        if engine.terminada and not engine.ordenes_en_vivo:
+            try:
+                cache.guardar(clave, codificar_resultado(engine.get_status(), grabador.a_bytes()))
+            except OSError as e:
+                # Corre en el hilo del motor: un disco lleno no debe marcar como fallida la carrera
+                print(f"Cache de resultados: no se pudo guardar {clave[:12]}: {e}")
+    return guardar
+
+
+def codificar_resultado(status, replay):
+    """Estado final + replay en un solo valor de cache (JSON, replay en base64)."""
+    return json.dumps({"status": status, "replay": base64.b64encode(replay).decode()}).encode()
+
+
+def decodificar_resultado(datos):
+    valor = json.loads(datos)
+    return valor["status"], base64.b64decode(valor["replay"])
+
+
+def reservar_memoria():
+    """
+    Aplica el presupuesto de memoria antes de crear una carrera o un fork:
+    desaloja carreras terminadas y, si aun así no hay lugar, devuelve la
+    respuesta de error (503). Sin presupuesto configurado, no hace nada.
+    """
+    presupuesto = presupuesto_bytes(current_app.config)
+    if presupuesto is None:
+        return None
+    desalojados, en_uso = liberar_memoria(active_simulations, replays_locales, presupuesto,
+                                          obtener_backend())
+    if desalojados:
+        print(f"Memoria: desalojadas {len(desalojados)} simulaciones terminadas ({', '.join(desalojados)})")
+    if en_uso >= presupuesto:
+        return jsonify({
+            "error": "Presupuesto de memoria agotado: hay demasiadas simulaciones en curso en este worker",
+            "memoria_en_uso_bytes": en_uso,
+            "presupuesto_bytes": presupuesto,
+        }), 503
+    return None
+
+
+def simulation_thread_target(app_context, backend, circuito_id, sim_id, semilla=None, lista_id=None,
+                             modo_sectores=False, comandos=None):
     """
     Esta es la función que se ejecutará en el hilo separado.
     Necesita el 'app_context' para poder hablar con la base de datos.
@@ -26,10 +161,12 @@ def simulation_thread_target(app_context, circuito_id, sim_id):
         print(f"Thread {sim_id}: Creando motor de simulación...")
         try:
             # 1. Crear el motor DENTRO del contexto del thread
-            engine = SimulationEngine(circuito_id=circuito_id)
+            engine = SimulationEngine(circuito_id=circuito_id, semilla=semilla, lista_id=lista_id,
+                                      modo_sectores=modo_sectores)
+            engine.programar_comandos(comandos)
             
-            # 2. Guardarlo en el dict global para que /status lo encuentre
-            active_simulations[sim_id] = engine
+            # 2. Guardarlo para que /status lo encuentre (en este y otros workers)
+            registrar_simulacion(backend, sim_id, engine)
             
             # 3. ¡Correr la simulación! (Esta es la parte que tarda)
             engine.run_simulation()
@@ -41,11 +178,141 @@ def simulation_thread_target(app_context, circuito_id, sim_id):
             # Si algo falla en el thread, guardamos el error
             print(f"ERROR en el thread de simulación {sim_id}: {e}")
             active_simulations[sim_id] = {"error": str(e)}
+            backend.guardar_snapshot(sim_id, {"error": str(e)})
+
+
+def motor_thread_target(backend, engine, sim_id):
+    """
+    Corre un motor ya creado: un fork (what-if) o una carrera cacheable.
+    No necesita app_context: no toca la BD, los datos ya están cargados.
+    """
+    try:
+        engine.run_simulation()
+        print(f"Thread {sim_id}: Simulación completada.")
+    except Exception as e:
+        print(f"ERROR en el thread de simulación {sim_id}: {e}")
+        active_simulations[sim_id] = {"error": str(e)}
+        backend.guardar_snapshot(sim_id, {"error": str(e)})
 
 
 # --- ENDPOINTS DE LA API ---
 
+# --- Serialización de datos de referencia ---
+
+def serializar_piloto(p):
+    return {
+        "id": p.id, "nombre": p.nombre, "edad": p.edad, "nacionalidad": p.nacionalidad,
+        "velocidad": p.velocidad, "consistencia": p.consistencia, "riesgo": p.riesgo,
+        "experiencia": p.experiencia, "feedback_tecnico": p.feedback_tecnico,
+        "moral": p.moral, "equipo_id": p.equipo_id,
+    }
+
+
+def serializar_coche(c):
+    return {
+        "id": c.id, "temporada": c.temporada, "motor": c.motor,
+        "aerodinamica": c.aerodinamica, "chasis": c.chasis,
+        "fiabilidad": c.fiabilidad, "equipo_id": c.equipo_id,
+    }
+
+
+def serializar_staff(s):
+    return {"id": s.id, "nombre": s.nombre, "rol": s.rol, "habilidad": s.habilidad, "moral": s.moral}
+
+
+def serializar_equipo(e, campos=None):
+    """Serializa un equipo. Las relaciones solo se tocan si se piden en 'campos'."""
+    datos = {
+        "id": e.id, "nombre": e.nombre, "presupuesto": e.presupuesto,
+        "reputacion": e.reputacion, "base_tecnica": e.base_tecnica,
+    }
+    if campos is None or "pilotos" in campos:
+        datos["pilotos"] = [serializar_piloto(p) for p in e.pilotos]
+    if campos is None or "staff" in campos:
+        datos["staff"] = [serializar_staff(s) for s in e.staff]
+    if campos is None or "coche" in campos:
+        datos["coche"] = serializar_coche(e.coche) if e.coche else None
+    return filtrar_campos(datos, campos)
+
+
+def consulta_equipos(campos):
+    """
+    Query de equipos con carga anticipada de las relaciones pedidas:
+    coche con JOIN (1-a-1) y pilotos/staff con selectinload (un IN por relación).
+    Siempre son como mucho 3 queries, sin importar cuántos equipos haya.
+    """
+    opciones = []
+    if campos is None or "coche" in campos:
+        opciones.append(joinedload(Equipo.coche))
+    if campos is None or "pilotos" in campos:
+        opciones.append(selectinload(Equipo.pilotos))
+    if campos is None or "staff" in campos:
+        opciones.append(selectinload(Equipo.staff))
+    return db.session.query(Equipo).options(*opciones).order_by(Equipo.id)
+
+
+def pagina(query, page, per_page):
+    """Devuelve (items, total) de una query paginada."""
+    total = query.order_by(None).count()
+    items = query.limit(per_page).offset((page - 1) * per_page).all()
+    return items, total
+
+
+@api_bp.route('/teams', methods=['GET'])
+@respuesta_cacheable
+def get_teams():
+    """Equipos con sus pilotos, staff y coche. Soporta ?page, ?per_page y ?fields."""
+    page, per_page = leer_paginacion()
+    campos = leer_campos()
+    equipos, total = pagina(consulta_equipos(campos), page, per_page)
+    return jsonify({
+        "items": [serializar_equipo(e, campos) for e in equipos],
+        "page": page, "per_page": per_page, "total": total
+    }), 200
+
+
+@api_bp.route('/teams/<int:equipo_id>', methods=['GET'])
+@respuesta_cacheable
+def get_team(equipo_id):
+    campos = leer_campos()
+    equipo = consulta_equipos(campos).filter(Equipo.id == equipo_id).first()
+    if not equipo:
+        return jsonify({"error": "Equipo no encontrado"}), 404
+    return jsonify(serializar_equipo(equipo, campos)), 200
+
+
+@api_bp.route('/drivers', methods=['GET'])
+@respuesta_cacheable
+def get_drivers():
+    """Pilotos (opcionalmente ?equipo_id=). Soporta ?page, ?per_page y ?fields."""
+    page, per_page = leer_paginacion()
+    campos = leer_campos()
+    query = db.session.query(Piloto).order_by(Piloto.id)
+    equipo_id = request.args.get('equipo_id', type=int)
+    if equipo_id is not None:
+        query = query.filter(Piloto.equipo_id == equipo_id)
+    pilotos, total = pagina(query, page, per_page)
+    return jsonify({
+        "items": [filtrar_campos(serializar_piloto(p), campos) for p in pilotos],
+        "page": page, "per_page": per_page, "total": total
+    }), 200
+
+
+@api_bp.route('/cars', methods=['GET'])
+@respuesta_cacheable
+def get_cars():
+    """Coches. Soporta ?page, ?per_page y ?fields."""
+    page, per_page = leer_paginacion()
+    campos = leer_campos()
+    coches, total = pagina(db.session.query(Coche).order_by(Coche.id), page, per_page)
+    return jsonify({
+        "items": [filtrar_campos(serializar_coche(c), campos) for c in coches],
+        "page": page, "per_page": per_page, "total": total
+    }), 200
+
+
 @api_bp.route('/circuits', methods=['GET'])
+@respuesta_cacheable
 def get_circuits():
     """Devuelve la lista de todos los circuitos disponibles."""
     try:
@@ -59,32 +326,273 @@ def get_circuits():
         return jsonify({"error": f"Error al leer circuitos: {str(e)}"}), 500
 
 
+@api_bp.route('/metrics/pool', methods=['GET'])
+def get_pool_metrics():
+    """Uso del pool de conexiones a la BD (tamaño, en uso, espera de checkout)."""
+    return jsonify(metricas_pool(db.engine)), 200
+
+
+@api_bp.route('/metrics/memoria', methods=['GET'])
+def get_memory_metrics():
+    """
+    Memoria de las simulaciones de este worker (motor + replay, en bytes),
+    el total contabilizado frente al presupuesto y la memoria del proceso.
+    En debug la medición por simulación es precisa; si no, estimada.
+    """
+    precisa = medicion_precisa()
+    uso = uso_simulaciones(active_simulations, replays_locales, precisa)
+    return jsonify({
+        "medicion": "precisa" if precisa else "estimada",
+        "simulaciones": uso,
+        "total_bytes": sum(u["total"] for u in uso.values()),
+        "presupuesto_bytes": presupuesto_bytes(current_app.config),
+        "cache_resultados": obtener_cache().estadisticas() if obtener_cache() else None,
+        "proceso": memoria_proceso(),
+    }), 200
+
+
+@api_bp.route('/entry-lists', methods=['POST'])
+def create_entry_list():
+    """
+    Crea una lista de inscritos para una carrera o liga.
+    Body: {"nombre": ..., "circuito_id": opcional, "piloto_ids": [1, 2, ...]}
+    """
+    data = request.json or {}
+    nombre = data.get('nombre')
+    piloto_ids = data.get('piloto_ids')
+    circuito_id = data.get('circuito_id')
+    if not nombre or not isinstance(piloto_ids, list) or not piloto_ids:
+        return jsonify({"error": "nombre y piloto_ids (lista no vacía) son requeridos"}), 400
+    if not all(isinstance(pid, int) and not isinstance(pid, bool) for pid in piloto_ids):
+        return jsonify({"error": "piloto_ids debe ser una lista de ids (enteros)"}), 400
+    if circuito_id is not None and (not isinstance(circuito_id, int) or isinstance(circuito_id, bool)
+                                    or not db.session.get(Circuito, circuito_id)):
+        return jsonify({"error": f"Circuito no encontrado: {circuito_id}"}), 400
+
+    piloto_ids = list(dict.fromkeys(piloto_ids)) # Sin duplicados, mismo orden
+    existentes = {pid for (pid,) in db.session.query(Piloto.id).filter(Piloto.id.in_(piloto_ids))}
+    faltantes = [pid for pid in piloto_ids if pid not in existentes]
+    if faltantes:
+        return jsonify({"error": f"Pilotos no encontrados: {faltantes}"}), 400
+
+    try:
+        lista = ListaInscritos(nombre=nombre, circuito_id=circuito_id)
+        db.session.add(lista)
+        db.session.flush() # Para obtener lista.id
+        db.session.execute(
+            Inscripcion.__table__.insert(),
+            [{"lista_id": lista.id, "piloto_id": pid} for pid in piloto_ids]
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Error al crear la lista: {str(e)}"}), 500
+
+    return jsonify({"id": lista.id, "nombre": nombre, "inscritos": len(piloto_ids)}), 201
+
+
+@api_bp.route('/entry-lists/<int:lista_id>', methods=['GET'])
+def get_entry_list(lista_id):
+    lista = db.session.get(ListaInscritos, lista_id)
+    if not lista:
+        return jsonify({"error": "Lista de inscritos no encontrada"}), 404
+    piloto_ids = [pid for (pid,) in db.session.query(Inscripcion.piloto_id)
+                  .filter(Inscripcion.lista_id == lista_id).order_by(Inscripcion.piloto_id)]
+    return jsonify({
+        "id": lista.id, "nombre": lista.nombre,
+        "circuito_id": lista.circuito_id, "piloto_ids": piloto_ids
+    }), 200
+
+
+@api_bp.route('/admin/profile', methods=['POST'])
+def profile_simulation():
+    """
+    Corre una carrera bajo el profiler y devuelve las funciones del motor con
+    más tiempo propio y las pilas colapsadas (para flamegraphs).
+    Con ?formato=colapsado devuelve solo las pilas, en texto plano.
+    Solo existe si PERFILADO_HABILITADO está activo.
+    """
+    if not current_app.config.get('PERFILADO_HABILITADO'):
+        return jsonify({"error": "No encontrado"}), 404
+
+    data = request.json or {}
+    circuito_id = data.get('circuito_id')
+    if not circuito_id:
+        return jsonify({"error": "circuito_id es requerido"}), 400
+
+    from app.perfilado import perfilar_carrera
+    try:
+        resultado = perfilar_carrera(
+            circuito_id,
+            semilla=data.get('semilla'),
+            lista_id=data.get('lista_id'),
+            modo_sectores=bool(data.get('modo_sectores', False)),
+            top=int(data.get('top', 20)),
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    if request.args.get('formato') == 'colapsado':
+        return current_app.response_class(resultado["pilas_colapsadas"], mimetype='text/plain')
+    return jsonify(resultado), 200
+
+
+@api_bp.route('/predict', methods=['POST'])
+def predict_race():
+    """
+    Probabilidades de resultado al instante, sin simular (ver app/predictor.py).
+    Body: {"circuito_id": 1, "lista_id": opcional, "piloto_ids": opcional,
+           "params": {overrides de balanceo}, "comparar": N carreras Monte Carlo (opcional)}
+    Con "comparar", también corre N carreras y devuelve el error de la predicción.
+    """
+    data = request.json or {}
+    circuito_id = data.get('circuito_id')
+    if not circuito_id:
+        return jsonify({"error": "circuito_id es requerido"}), 400
+    lista_id = data.get('lista_id')
+    piloto_ids = data.get('piloto_ids')
+    try:
+        comparar = int(data.get('comparar') or 0)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"comparar debe ser un entero: {e}"}), 400
+    if not 0 <= comparar <= MAX_CARRERAS_COMPARACION:
+        return jsonify({"error": f"comparar debe estar entre 0 y {MAX_CARRERAS_COMPARACION} "
+                                 "(para más carreras, usar POST /api/batch)"}), 400
+
+    try:
+        params = ParametrosBalanceo.desde_dict(data.get('params') or {})
+        engine = SimulationEngine(circuito_id, lista_id=lista_id, params=params)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 404
+
+    datos = engine.datos() # Antes de filtrar: Monte Carlo filtra cada carrera igual
+    try:
+        engine = filtrar_pilotos(engine, piloto_ids)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    prediccion = predecir(engine)
+    if comparar:
+        prediccion["comparacion"] = comparar_con_montecarlo(
+            prediccion, datos, comparar, lista_id=lista_id, piloto_ids=piloto_ids, params=params)
+    return jsonify(prediccion), 200
+
+
+@api_bp.route('/batch', methods=['POST'])
+def create_batch():
+    """
+    Encola un lote de carreras en la cola durable (la corren los procesos
+    'flask worker-lotes', ver app/cola_lotes.py).
+    Body: {"circuitos": [1, 2], "carreras": 1000 (por circuito), "semilla_inicial": 0,
+           "lista_id": opcional, "params": {overrides}, "modo_sectores": false,
+           "tam_chunk": opcional}
+    """
+    data = request.json or {}
+    circuitos = data.get('circuitos') or ([data['circuito_id']] if data.get('circuito_id') else [])
+    lista_id = data.get('lista_id')
+    if lista_id is not None and (not isinstance(lista_id, int) or isinstance(lista_id, bool)):
+        return jsonify({"error": "lista_id debe ser un entero"}), 400
+    try:
+        carreras = int(data.get('carreras', 0))
+        tam_chunk = int(data.get('tam_chunk') or current_app.config['LOTES_TAM_CHUNK'])
+        semilla_inicial = int(data.get('semilla_inicial', 0))
+        circuitos = [int(c) for c in circuitos]
+        ParametrosBalanceo.desde_dict(data.get('params') or {})
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not circuitos or carreras <= 0 or tam_chunk <= 0:
+        return jsonify({"error": "circuitos, carreras (> 0) y tam_chunk (> 0) son requeridos"}), 400
+    maximo = current_app.config['LOTES_MAX_CARRERAS']
+    if len(circuitos) * carreras > maximo:
+        return jsonify({"error": f"Un lote admite como mucho {maximo} carreras"}), 400
+
+    circuitos_existentes = {c.id for c in Circuito.query.filter(Circuito.id.in_(circuitos))}
+    faltantes = set(circuitos) - circuitos_existentes
+    if faltantes:
+        return jsonify({"error": f"Circuitos no encontrados: {sorted(faltantes)}"}), 404
+
+    # La lista se valida acá: si no, cada chunk fallaría en el worker hasta agotar intentos
+    if lista_id is not None:
+        lista = db.session.get(ListaInscritos, lista_id)
+        if lista is None:
+            return jsonify({"error": "Lista de inscritos no encontrada"}), 404
+        otros = sorted(set(circuitos) - {lista.circuito_id})
+        if lista.circuito_id is not None and otros:
+            return jsonify({"error": f"La lista de inscritos {lista_id} es del circuito {lista.circuito_id}, "
+                                     f"no de {otros}"}), 400
+
+    trabajo = crear_trabajo(circuitos, carreras, tam_chunk, lista_id=lista_id,
+                            params=data.get('params'), modo_sectores=bool(data.get('modo_sectores', False)),
+                            semilla_inicial=semilla_inicial)
+    return jsonify({
+        "message": "Lote encolado.",
+        "trabajo_id": trabajo.id,
+        "chunks": trabajo.chunks_total,
+        "carreras": trabajo.carreras_total,
+    }), 202
+
+
+@api_bp.route('/batch/<int:trabajo_id>', methods=['GET'])
+def get_batch(trabajo_id):
+    """Avance de un lote y sus resultados agregados (parciales mientras corre)."""
+    trabajo = db.session.get(TrabajoLote, trabajo_id)
+    if trabajo is None:
+        return jsonify({"error": "Lote no encontrado"}), 404
+    return jsonify(progreso_trabajo(trabajo)), 200
+
+
 @api_bp.route('/simulation/start', methods=['POST'])
 def start_simulation():
     """
     Inicia una nueva simulación en un hilo separado.
     Responde INMEDIATAMENTE con un ID de simulación.
+    Con "cache": true (y una semilla), si la misma carrera ya se corrió se
+    devuelve su resultado sin volver a simularla (ver app/cache_resultados.py).
     """
     data = request.json
     circuito_id = data.get('circuito_id')
+    semilla = data.get('semilla') # Opcional: hace la carrera reproducible
+    lista_id = data.get('lista_id') # Opcional: solo corren los inscritos de la lista
+    modo_sectores = bool(data.get('modo_sectores', False)) # Opcional: tráfico por sectores
+    usar_cache = bool(data.get('cache', False)) # Opcional: reutilizar resultados idénticos
     if not circuito_id:
         return jsonify({"error": "circuito_id es requerido"}), 400
+    if usar_cache and semilla is None:
+        return jsonify({"error": "cache requiere una semilla (sin semilla la carrera no se repite)"}), 400
+
+    try:
+        # Opcional: órdenes programadas [{"vuelta", "piloto_id", "accion"}]
+        comandos = leer_comandos(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cache = obtener_cache() if usar_cache else None
+    if cache is not None:
+        return start_simulation_cacheable(circuito_id, semilla, lista_id, modo_sectores, comandos, cache)
+
+    sin_memoria = reservar_memoria()
+    if sin_memoria:
+        return sin_memoria
 
     try:
-        # 1. Crear un ID único para esta simulación
-        sim_id = f"sim_{int(time.time())}"
+        # 1. Crear un ID único para esta simulación (único también entre workers)
+        sim_id = nuevo_sim_id()
+        backend = obtener_backend()
         
-        # 2. Obtener el contexto de la app para pasarlo al thread
-        app = create_app()
-        app_context = app.app_context()
+        # 2. Obtener un contexto de la app EN EJECUCIÓN para pasarlo al thread
+        # (reutiliza su configuración, blueprints y pool de conexiones)
+        app_context = current_app._get_current_object().app_context()
 
         # 3. Poner un "placeholder" para que el frontend sepa que está iniciando
         active_simulations[sim_id] = {"status": "Iniciando simulación..."}
+        backend.guardar_snapshot(sim_id, active_simulations[sim_id])
 
         # 4. Iniciar el thread!
         thread = threading.Thread(
             target=simulation_thread_target, 
-            args=(app_context, circuito_id, sim_id)
+            args=(app_context, backend, circuito_id, sim_id, semilla, lista_id, modo_sectores, comandos)
         )
         thread.start()
 
@@ -100,27 +608,141 @@ def start_simulation():
         return jsonify({"error": str(e)}), 500
 
 
+def nuevo_sim_id():
+    """ID único para una simulación (único también entre workers)."""
+    return f"sim_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+
+
+def start_simulation_cacheable(circuito_id, semilla, lista_id, modo_sectores, comandos, cache):
+    """
+    Variante de /simulation/start para carreras cacheables. El motor se crea
+    en el pedido (una query) para calcular la clave con los datos reales:
+    - Acierto: se publica el estado final y el replay guardados y se
+      responde 200 con la carrera ya terminada, sin simular nada.
+    - Fallo: se corre como siempre y al terminar se guarda en la cache.
+    """
+    try:
+        engine = SimulationEngine(circuito_id=circuito_id, semilla=semilla, lista_id=lista_id,
+                                  modo_sectores=modo_sectores)
+    except LookupError as e: # Circuito o lista inexistente
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e: # Lista de otro circuito, datos inválidos
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    engine.programar_comandos(comandos)
+    clave = clave_carrera(engine, "api", comandos)
+
+    # Un acierto también ocupa memoria (snapshot y replay): pasa por el presupuesto
+    sin_memoria = reservar_memoria()
+    if sin_memoria:
+        return sin_memoria
+
+    sim_id = nuevo_sim_id()
+    backend = obtener_backend()
+    datos = cache.obtener(clave)
+    if datos is not None:
+        status, replay = decodificar_resultado(datos)
+        registrar_resultado(backend, sim_id, status, replay)
+        return jsonify({"message": "Resultado en cache.", "sim_id": sim_id, "cache": True}), 200
+
+    grabador = GrabadorReplay.para_motor(engine)
+    registrar_simulacion(backend, sim_id, engine, grabador)
+    engine.observadores_vuelta.append(guardar_en_cache(cache, clave, grabador))
+    threading.Thread(target=motor_thread_target, args=(backend, engine, sim_id)).start()
+
+    return jsonify({"message": "Simulación iniciada.", "sim_id": sim_id, "cache": False}), 202
+
+
 @api_bp.route('/simulation/status', methods=['GET'])
 def get_simulation_status():
     """
     El frontend llamará a esta ruta 1 vez por segundo
     para obtener el estado "en vivo" de la carrera.
+
+    Long-poll: con ?wait_for_lap=N&timeout=S el pedido espera (sin sondear)
+    hasta que se complete la vuelta N o pasen S segundos, y recién ahí
+    responde. Toda respuesta trae 'proxima_vuelta_estimada' (epoch).
+
+    Formato según Accept (JSON, JSON compacto posicional o MessagePack) y
+    compresión según Accept-Encoding: ver app/codificacion.py.
     """
     sim_id = request.args.get('sim_id')
     if not sim_id:
         return jsonify({"error": "sim_id es requerido"}), 400
 
+    vuelta_esperada = request.args.get('wait_for_lap', type=int)
+    timeout = request.args.get('timeout', 10.0, type=float)
+    # nan / inf harían que la espera no termine nunca
+    if not math.isfinite(timeout):
+        return jsonify({"error": "timeout debe ser un número finito de segundos"}), 400
+    timeout = min(max(timeout, 0.0), current_app.config.get('LONG_POLL_MAX_SEGUNDOS', 30))
+
     sim_object = active_simulations.get(sim_id)
-    
-    if not sim_object:
+
+    # Si el motor corre en este worker, le pedimos el estado directamente
+    if sim_object is not None and not isinstance(sim_object, dict):
+        if vuelta_esperada is not None:
+            sim_object.esperar_vuelta(vuelta_esperada, timeout)
+        return respuesta_negociada(sim_object.get_status())
+
+    # Si no, usamos el último snapshot publicado en el backend compartido
+    # (también cubre el placeholder "Iniciando..." y los errores)
+    backend = obtener_backend()
+    snapshot = backend.obtener_snapshot(sim_id)
+    if vuelta_esperada is not None:
+        snapshot = _esperar_snapshot(backend, sim_id, snapshot, vuelta_esperada, timeout)
+    if not snapshot:
         return jsonify({"error": "Simulación no encontrada o ha caducado"}), 404
-    
-    # Si aún se está iniciando o dio error (es un dict)
-    if isinstance(sim_object, dict):
-        return jsonify(sim_object)
-    
-    # Si ya es un objeto SimulationEngine, le pedimos el estado
-    return jsonify(sim_object.get_status())
+
+    return respuesta_negociada(snapshot)
+
+
+def _esperar_snapshot(backend, sim_id, snapshot, vuelta, timeout):
+    """
+    Long-poll contra el backend (motor en otro worker): en vez de sondear,
+    dormimos hasta la hora estimada de la próxima vuelta que trae el snapshot.
+    """
+    limite = time.time() + timeout
+    while True:
+        if snapshot and ("error" in snapshot or snapshot.get("terminada")
+                         or snapshot.get("ultima_vuelta_completada", -1) >= vuelta):
+            return snapshot
+        ahora = time.time()
+        if ahora >= limite:
+            return snapshot
+        estimada = (snapshot or {}).get("proxima_vuelta_estimada")
+        # Sin estimación (p. ej. todavía iniciando), reintentamos en medio segundo
+        despertar = estimada if estimada and estimada > ahora else ahora + 0.5
+        time.sleep(min(max(despertar - ahora, 0.05), limite - ahora))
+        snapshot = backend.obtener_snapshot(sim_id)
+
+
+@api_bp.route('/simulation/<sim_id>/replay', methods=['GET'])
+def get_simulation_replay(sim_id):
+    """
+    Clasificación completa de una simulación en cualquier vuelta (?lap=N).
+    Sirve durante la carrera (hasta la vuelta actual) y después de terminada.
+    """
+    vuelta = request.args.get('lap', type=int)
+    if vuelta is None:
+        return jsonify({"error": "lap es requerido"}), 400
+
+    grabador = replays_locales.get(sim_id)
+    if grabador is None:
+        # Carrera de otro worker: solo está el replay final en el backend
+        datos = obtener_backend().obtener_replay(sim_id)
+        if datos is None:
+            return jsonify({"error": "Replay no encontrado"}), 404
+        grabador = GrabadorReplay.desde_bytes(datos)
+
+    try:
+        resultado = grabador.clasificacion(vuelta)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    resultado["almacenamiento"] = grabador.estadisticas()
+    return respuesta_negociada(resultado)
 
 
 @api_bp.route('/simulation/strategy', methods=['POST'])
@@ -135,16 +757,81 @@ def update_strategy():
         return jsonify({"error": "sim_id, piloto_id, y accion son requeridos"}), 400
 
     engine = active_simulations.get(sim_id)
-    if not engine or isinstance(engine, dict):
+    if engine is not None and not isinstance(engine, dict):
+        if engine.terminada:
+            return jsonify({"error": "La simulación ya ha terminado"}), 400
+
+        # El motor está en este worker: delegamos la acción directamente
+        result = engine.update_piloto_strategy(piloto_id, accion)
+
+        if "error" in result:
+            return jsonify(result), 400
+
+        return jsonify(result), 200
+
+    # El motor está en otro worker: encolamos la orden en el backend
+    # compartido y el motor la aplica al terminar su vuelta en curso.
+    backend = obtener_backend()
+    snapshot = backend.obtener_snapshot(sim_id)
+    if not snapshot or "terminada" not in snapshot:
         return jsonify({"error": "Simulación no está activa"}), 404
 
-    if engine.terminada:
+    if snapshot["terminada"]:
         return jsonify({"error": "La simulación ya ha terminado"}), 400
-    
-    # Delegamos la acción al motor
-    result = engine.update_piloto_strategy(piloto_id, accion)
-    
-    if "error" in result:
-        return jsonify(result), 400
-    
-    return jsonify(result), 200
\ No newline at end of file
+
+    if accion not in ACCIONES_VALIDAS:
+        return jsonify({"error": "Acción no reconocida"}), 400
+
+    backend.encolar_comando(sim_id, {"piloto_id": piloto_id, "accion": accion})
+    return jsonify({"status": f"Orden '{accion}' encolada para el piloto {piloto_id}"}), 202
+
+
+@api_bp.route('/simulation/fork', methods=['POST'])
+def fork_simulation():
+    """
+    Crea un "what-if" a partir del checkpoint de una vuelta de otra simulación.
+    Body: {"sim_id": ..., "vuelta": 30,
+           "comandos": [{"vuelta": 30, "piloto_id": 1, "accion": "solicitar_pit_stop"}],
+           "semilla": opcional}
+    """
+    data = request.json
+    sim_id = data.get('sim_id')
+    vuelta = data.get('vuelta')
+
+    if not sim_id or vuelta is None:
+        return jsonify({"error": "sim_id y vuelta son requeridos"}), 400
+
+    engine = active_simulations.get(sim_id)
+    if not engine or isinstance(engine, dict):
+        return jsonify({"error": "Simulación no está activa"}), 404
+
+    try:
+        comandos = leer_comandos(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Tomamos el grabador antes de aplicar el presupuesto: si la original ya
+    # terminó, puede ser desalojada, pero el fork sigue partiendo de ella
+    grabador_original = replays_locales.get(sim_id)
+    sin_memoria = reservar_memoria()
+    if sin_memoria:
+        return sin_memoria
+
+    try:
+        nuevo = engine.fork(int(vuelta), comandos, semilla=data.get('semilla'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    fork_id = f"{sim_id}_fork_{uuid.uuid4().hex[:8]}"
+    backend = obtener_backend()
+    # El replay del fork comparte las vueltas grabadas hasta el checkpoint
+    grabador = grabador_original.fork(int(vuelta)) if grabador_original else None
+    registrar_simulacion(backend, fork_id, nuevo, grabador)
+
+    thread = threading.Thread(target=motor_thread_target, args=(backend, nuevo, fork_id))
+    thread.start()
+
+    return jsonify({
+        "message": f"Fork creado desde la vuelta {vuelta}.",
+        "sim_id": fork_id
+    }), 202
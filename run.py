@@ -1,3 +1,4 @@
+import click
 from app import create_app, db
 from app.models import Equipo, Piloto, Coche, Staff, Circuito
 
@@ -17,6 +18,179 @@ def make_shell_context():
         'Circuito': Circuito
     }
 
+# --- Carreras sin la API ('flask simulate --help') ---
+
+@app.cli.command('simulate')
+@click.option('--circuito', 'circuitos', type=int, multiple=True, required=True,
+              help='Circuito a correr (se puede repetir).')
+@click.option('--semillas', default=1, show_default=True, help='Carreras por circuito.')
+@click.option('--semilla-inicial', default=0, show_default=True,
+              help='Primera semilla (se usan semilla-inicial .. semilla-inicial + semillas - 1).')
+@click.option('--lista', 'lista_id', type=int, default=None, help='Lista de inscritos.')
+@click.option('--sectores', is_flag=True, help='Activa el modo sectores.')
+@click.option('--param', 'params', multiple=True,
+              help='Override de balanceo, p. ej. --param mod_drs=6 (ver ParametrosBalanceo).')
+@click.option('--sin-eventos', is_flag=True, help='No incluir el log de eventos en cada registro.')
+@click.option('--procesos', type=int, default=None, help='Procesos en paralelo (por defecto, CPUs).')
+@click.option('--salida', type=click.File('w'), default='-', show_default=True,
+              help='Archivo JSONL de salida ("-" es stdout).')
+def simulate_command(circuitos, semillas, semilla_inicial, lista_id, sectores, params, sin_eventos,
+                     procesos, salida):
+    """Corre carreras en procesos worker y escribe un registro JSONL por carrera."""
+    import json
+    from app.engine import ParametrosBalanceo
+    from app.lotes import ejecutar_lote, opciones_cache
+
+    try:
+        overrides = ParametrosBalanceo.desde_dict(_parsear_pares(params, float)) if params else None
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--param')
+
+    rango_semillas = range(semilla_inicial, semilla_inicial + semillas)
+    errores = 0
+    for registro in ejecutar_lote(circuitos, rango_semillas, lista_id, overrides, sectores,
+                                  not sin_eventos, procesos, opciones_cache(app.config)):
+        errores += "error" in registro
+        salida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        salida.flush()
+    if errores:
+        click.echo(f"{errores} carreras fallaron (ver el campo 'error').", err=True)
+
+
+@app.cli.command('worker-lotes')
+@click.option('--procesos', default=1, show_default=True, help='Workers en paralelo en esta máquina.')
+@click.option('--max-chunks', type=int, default=None, help='Terminar tras completar N chunks (por worker).')
+@click.option('--sin-esperar', is_flag=True, help='Terminar cuando la cola quede vacía.')
+@click.option('--intervalo', default=2.0, show_default=True, help='Segundos entre consultas con la cola vacía.')
+def worker_lotes_command(procesos, max_chunks, sin_esperar, intervalo):
+    """Toma chunks de la cola de lotes (POST /api/batch) y los corre."""
+    from app.cola_lotes import bucle_worker, worker_en_proceso
+
+    if procesos <= 1:
+        hechos = bucle_worker(app.config, max_chunks, not sin_esperar, intervalo, log=click.echo)
+        click.echo(f"{hechos} chunks completados.")
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    from app.lotes import inicializar_worker_bd
+    with ProcessPoolExecutor(max_workers=procesos, initializer=inicializar_worker_bd) as pool:
+        futuros = [pool.submit(worker_en_proceso, max_chunks, not sin_esperar, intervalo)
+                   for _ in range(procesos)]
+        hechos = sum(futuro.result() for futuro in futuros)
+    click.echo(f"{hechos} chunks completados.")
+
+
+# --- Comandos de carga masiva ('flask <comando> --help' para ver opciones) ---
+
+@app.cli.command('importar')
+@click.argument('tabla', type=click.Choice(['equipos', 'coches', 'pilotos', 'staff', 'circuitos']))
+@click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--lote', default=5000, show_default=True, help='Filas por commit.')
+def importar_command(tabla, archivo, lote):
+    """Importa un CSV o JSONL en TABLA, en streaming y por lotes."""
+    from app.carga_masiva import MODELOS_POR_TABLA, importar, leer_filas
+    try:
+        filas = leer_filas(archivo)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='ARCHIVO')
+    total = importar(MODELOS_POR_TABLA[tabla], filas, tam_lote=lote)
+    click.echo(f"Se importaron {total} filas en '{tabla}'.")
+
+
+@app.cli.command('generar-liga')
+@click.option('--equipos', default=10, show_default=True)
+@click.option('--pilotos-por-equipo', default=2, show_default=True)
+@click.option('--agentes-libres', default=0, show_default=True)
+@click.option('--circuitos', default=10, show_default=True)
+@click.option('--semilla', type=int, default=None, help='Para generar siempre la misma liga.')
+@click.option('--salida', type=click.Path(file_okay=False), default=None,
+              help='Directorio donde escribir los JSONL en vez de insertar en la BD.')
+@click.option('--lote', default=5000, show_default=True, help='Filas por commit.')
+def generar_liga_command(equipos, pilotos_por_equipo, agentes_libres, circuitos, semilla, salida, lote):
+    """Genera una liga sintética (a escala) y la inserta en la BD o en JSONL."""
+    from app.carga_masiva import MODELOS_POR_TABLA, importar, siguiente_id
+    from app.generador import GeneradorLiga
+
+    if salida:
+        generador = GeneradorLiga(equipos, pilotos_por_equipo, agentes_libres, circuitos, semilla)
+        for tabla, n in generador.escribir_jsonl(salida).items():
+            click.echo(f"{tabla}: {n} filas -> {salida}/{tabla}.jsonl")
+        return
+
+    # Insertando en la BD: los ids siguen a los que ya existen
+    ids = {tabla: siguiente_id(modelo) for tabla, modelo in MODELOS_POR_TABLA.items()}
+    generador = GeneradorLiga(equipos, pilotos_por_equipo, agentes_libres, circuitos, semilla, ids)
+    for tabla, filas in generador.tablas():
+        total = importar(MODELOS_POR_TABLA[tabla], filas, tam_lote=lote)
+        click.echo(f"{tabla}: {total} filas insertadas.")
+
+
+@app.cli.command('perfilar')
+@click.option('--circuito', 'circuito_id', type=int, required=True)
+@click.option('--semilla', type=int, default=None)
+@click.option('--lista', 'lista_id', type=int, default=None, help='Lista de inscritos.')
+@click.option('--sectores', is_flag=True, help='Activa el modo sectores.')
+@click.option('--top', default=20, show_default=True)
+@click.option('--salida', type=click.Path(dir_okay=False), default=None,
+              help='Archivo donde escribir las pilas colapsadas (para flamegraph.pl).')
+def perfilar_command(circuito_id, semilla, lista_id, sectores, top, salida):
+    """Corre una carrera bajo el profiler y muestra las funciones más costosas."""
+    from app.perfilado import perfilar_carrera
+    resultado = perfilar_carrera(circuito_id, semilla, lista_id, sectores, top)
+
+    click.echo(f"{resultado['pilotos']} pilotos, {resultado['vueltas']} vueltas, "
+               f"{resultado['duracion_s']:.3f}s (con profiler)")
+    click.echo(f"{'propio ms':>10} {'acum. ms':>10} {'llamadas':>9}  funcion")
+    for fila in resultado["top_tiempo_propio"]:
+        click.echo(f"{fila['tiempo_propio_ms']:10.2f} {fila['tiempo_acumulado_ms']:10.2f} "
+                   f"{fila['llamadas']:9d}  {fila['funcion']}")
+
+    if salida:
+        with open(salida, 'w') as f:
+            f.write(resultado["pilas_colapsadas"] + "\n")
+        click.echo(f"Pilas colapsadas en {salida}")
+
+
+def _parsear_pares(valores, conversor):
+    """['mod_drs=4,8', ...] -> {'mod_drs': conversor('4,8')}"""
+    resultado = {}
+    for valor in valores:
+        nombre, _, datos = valor.partition('=')
+        if not datos:
+            raise click.BadParameter(f"Formato esperado nombre=valores: {valor}")
+        resultado[nombre.strip()] = conversor(datos)
+    return resultado
+
+
+@app.cli.command('barrido')
+@click.option('--grilla', 'grilla_valores', multiple=True,
+              help='Valores a probar, p. ej. --grilla mod_drs=4,8,12 (se combinan todos).')
+@click.option('--rango', 'rangos', multiple=True,
+              help='Rango para muestreo aleatorio, p. ej. --rango mod_drs=2:12.')
+@click.option('--muestras', default=20, show_default=True, help='Juegos a muestrear con --rango.')
+@click.option('--circuito', 'circuitos', type=int, multiple=True, required=True)
+@click.option('--semillas', default=20, show_default=True, help='Carreras por circuito y juego.')
+@click.option('--procesos', type=int, default=None, help='Procesos en paralelo (por defecto, CPUs).')
+@click.option('--sectores', is_flag=True, help='Activa el modo sectores.')
+def barrido_command(grilla_valores, rangos, muestras, circuitos, semillas, procesos, sectores):
+    """Barre parámetros de balanceo y muestra métricas por juego (JSONL)."""
+    import json
+    from app.barrido import ejecutar_barrido, grilla, muestreo_aleatorio
+
+    configuraciones = []
+    if grilla_valores:
+        espacio = _parsear_pares(grilla_valores, lambda d: [float(v) for v in d.split(',')])
+        configuraciones += grilla(espacio)
+    if rangos:
+        espacio = _parsear_pares(rangos, lambda d: tuple(float(v) for v in d.split(':')))
+        configuraciones += muestreo_aleatorio(espacio, muestras)
+    if not configuraciones:
+        configuraciones = [{}] # Solo los valores por defecto
+
+    for resultado in ejecutar_barrido(configuraciones, circuitos, range(semillas), procesos, sectores):
+        click.echo(json.dumps(resultado))
+
+
 if __name__ == '__main__':
     # (app.run() no se usa aquí, lo haremos con el comando 'flask run')
     pass
\ No newline at end of file
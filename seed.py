@@ -1,7 +1,7 @@
 # Contenido para: seed.py (Versión 2)
 
 from app import create_app, db
-from app.models import Circuito, Equipo, Piloto, Coche, Staff
+from app.models import Circuito, Equipo, Piloto, Coche, Staff, Inscripcion, ListaInscritos
 
 # Creamos una instancia de la app para tener el contexto
 app = create_app()
@@ -17,6 +17,8 @@ def seed_data():
         # --- 1. BORRADO DE DATOS ANTIGUOS ---
         # Borramos en orden inverso para respetar las 'foreign keys'
         print("Borrando datos antiguos...")
+        db.session.query(Inscripcion).delete() # Apunta a pilotos y listas
+        db.session.query(ListaInscritos).delete() # Apunta a circuitos
         db.session.query(Piloto).delete()
         db.session.query(Coche).delete()
         db.session.query(Staff).delete()
@@ -42,8 +44,8 @@ def seed_data():
         db.session.commit()
         print(f"Se crearon {len(circuitos)} circuitos.")
 
-        # --- 3. CREACIÓN DE EQUIPOS, COCHES Y PILOTOS ---
-        print("Creando equipos, pilotos y coches...")
+        # --- 3. CREACIÓN DE EQUIPOS, COCHES, MECÁNICOS Y PILOTOS ---
+        print("Creando equipos, pilotos, coches y mecánicos...")
         
         # Usamos un diccionario para definir los equipos y sus miembros
         # Las stats están de 0 a 100
@@ -51,6 +53,7 @@ def seed_data():
             {
                 "equipo": {"nombre": "Red Bull Racing", "presupuesto": 200000000, "reputacion": 95},
                 "coche": {"motor": 95, "aerodinamica": 98, "chasis": 90, "fiabilidad": 90},
+                "mecanicos": {"habilidad": 96, "moral": 88},
                 "pilotos": [
                     {"nombre": "Max Verstappen", "velocidad": 99, "consistencia": 98, "riesgo": 50, "experiencia": 85, "feedback_tecnico": 80, "salario": 55000000},
                     {"nombre": "Sergio Pérez", "velocidad": 88, "consistencia": 75, "riesgo": 40, "experiencia": 90, "feedback_tecnico": 70, "salario": 15000000}
@@ -59,6 +62,7 @@ def seed_data():
             {
                 "equipo": {"nombre": "Ferrari", "presupuesto": 190000000, "reputacion": 98},
                 "coche": {"motor": 96, "aerodinamica": 92, "chasis": 93, "fiabilidad": 80},
+                "mecanicos": {"habilidad": 85, "moral": 75},
                 "pilotos": [
                     {"nombre": "Charles Leclerc", "velocidad": 97, "consistencia": 85, "riesgo": 70, "experiencia": 75, "feedback_tecnico": 80, "salario": 35000000},
                     {"nombre": "Carlos Sainz", "velocidad": 90, "consistencia": 92, "riesgo": 30, "experiencia": 80, "feedback_tecnico": 85, "salario": 20000000}
@@ -67,6 +71,7 @@ def seed_data():
             {
                 "equipo": {"nombre": "McLaren", "presupuesto": 170000000, "reputacion": 90},
                 "coche": {"motor": 90, "aerodinamica": 94, "chasis": 90, "fiabilidad": 88},
+                "mecanicos": {"habilidad": 93, "moral": 90},
                 "pilotos": [
                     {"nombre": "Lando Norris", "velocidad": 96, "consistencia": 90, "riesgo": 50, "experiencia": 70, "feedback_tecnico": 82, "salario": 30000000},
                     {"nombre": "Oscar Piastri", "velocidad": 92, "consistencia": 88, "riesgo": 60, "experiencia": 60, "feedback_tecnico": 78, "salario": 10000000}
@@ -75,6 +80,7 @@ def seed_data():
             {
                 "equipo": {"nombre": "Mercedes", "presupuesto": 180000000, "reputacion": 92},
                 "coche": {"motor": 91, "aerodinamica": 90, "chasis": 94, "fiabilidad": 85},
+                "mecanicos": {"habilidad": 88, "moral": 80},
                 "pilotos": [
                     {"nombre": "Lewis Hamilton", "velocidad": 95, "consistencia": 95, "riesgo": 40, "experiencia": 99, "feedback_tecnico": 95, "salario": 45000000},
                     {"nombre": "George Russell", "velocidad": 91, "consistencia": 89, "riesgo": 65, "experiencia": 70, "feedback_tecnico": 85, "salario": 18000000}
@@ -83,6 +89,7 @@ def seed_data():
             {
                 "equipo": {"nombre": "Aston Martin", "presupuesto": 150000000, "reputacion": 85},
                 "coche": {"motor": 90, "aerodinamica": 88, "chasis": 87, "fiabilidad": 82},
+                "mecanicos": {"habilidad": 82, "moral": 78},
                 "pilotos": [
                     {"nombre": "Fernando Alonso", "velocidad": 94, "consistencia": 96, "riesgo": 40, "experiencia": 99, "feedback_tecnico": 98, "salario": 25000000},
                     {"nombre": "Lance Stroll", "velocidad": 82, "consistencia": 70, "riesgo": 60, "experiencia": 75, "feedback_tecnico": 65, "salario": 8000000}
@@ -92,6 +99,7 @@ def seed_data():
             {
                 "equipo": {"nombre": "Alpine", "presupuesto": 130000000, "reputacion": 75},
                 "coche": {"motor": 82, "aerodinamica": 80, "chasis": 81, "fiabilidad": 75},
+                "mecanicos": {"habilidad": 75, "moral": 65},
                 "pilotos": [
                     {"nombre": "Pierre Gasly", "velocidad": 87, "consistencia": 80, "riesgo": 55, "experiencia": 80, "feedback_tecnico": 70, "salario": 7000000},
                     {"nombre": "Esteban Ocon", "velocidad": 86, "consistencia": 82, "riesgo": 50, "experiencia": 81, "feedback_tecnico": 72, "salario": 7000000}
@@ -100,6 +108,7 @@ def seed_data():
             {
                 "equipo": {"nombre": "Williams", "presupuesto": 110000000, "reputacion": 80},
                 "coche": {"motor": 85, "aerodinamica": 78, "chasis": 80, "fiabilidad": 80},
+                "mecanicos": {"habilidad": 78, "moral": 72},
                 "pilotos": [
                     {"nombre": "Alex Albon", "velocidad": 89, "consistencia": 85, "riesgo": 50, "experiencia": 78, "feedback_tecnico": 85, "salario": 6000000},
                     {"nombre": "Logan Sargeant", "velocidad": 78, "consistencia": 65, "riesgo": 75, "experiencia": 50, "feedback_tecnico": 60, "salario": 1000000}
@@ -109,6 +118,7 @@ def seed_data():
             {
                 "equipo": {"nombre": "RB (Visa Cash App RB)", "presupuesto": 120000000, "reputacion": 70},
                 "coche": {"motor": 88, "aerodinamica": 81, "chasis": 82, "fiabilidad": 78},
+                "mecanicos": {"habilidad": 80, "moral": 75},
                 "pilotos": [
                     {"nombre": "Yuki Tsunoda", "velocidad": 86, "consistencia": 78, "riesgo": 70, "experiencia": 65, "feedback_tecnico": 70, "salario": 3000000},
                     {"nombre": "Daniel Ricciardo", "velocidad": 85, "consistencia": 80, "riesgo": 50, "experiencia": 90, "feedback_tecnico": 75, "salario": 5000000}
@@ -117,6 +127,7 @@ def seed_data():
             {
                 "equipo": {"nombre": "Sauber (Stake)", "presupuesto": 100000000, "reputacion": 65},
                 "coche": {"motor": 84, "aerodinamica": 76, "chasis": 78, "fiabilidad": 70},
+                "mecanicos": {"habilidad": 65, "moral": 60},
                 "pilotos": [
                     {"nombre": "Valtteri Bottas", "velocidad": 84, "consistencia": 88, "riesgo": 30, "experiencia": 92, "feedback_tecnico": 80, "salario": 4000000},
                     {"nombre": "Zhou Guanyu", "velocidad": 81, "consistencia": 80, "riesgo": 50, "experiencia": 60, "feedback_tecnico": 70, "salario": 2000000}
@@ -125,6 +136,7 @@ def seed_data():
             {
                 "equipo": {"nombre": "Haas F1 Team", "presupuesto": 90000000, "reputacion": 60},
                 "coche": {"motor": 84, "aerodinamica": 75, "chasis": 76, "fiabilidad": 65},
+                "mecanicos": {"habilidad": 70, "moral": 70},
                 "pilotos": [
                     {"nombre": "Kevin Magnussen", "velocidad": 83, "consistencia": 75, "riesgo": 75, "experiencia": 85, "feedback_tecnico": 70, "salario": 3000000},
                     {"nombre": "Nico Hülkenberg", "velocidad": 85, "consistencia": 86, "riesgo": 40, "experiencia": 90, "feedback_tecnico": 78, "salario": 3000000}
@@ -154,8 +166,17 @@ def seed_data():
                 equipo_id=nuevo_equipo.id # ¡Aquí está la relación!
             )
             db.session.add(nuevo_coche)
+
+            # 3. Crear el Mecánico Jefe (define los tiempos de sus paradas en boxes)
+            db.session.add(Staff(
+                nombre=f"Mecánicos {data['equipo']['nombre']}",
+                rol="Mecánico Jefe",
+                habilidad=data["mecanicos"]["habilidad"],
+                moral=data["mecanicos"]["moral"],
+                equipo_id=nuevo_equipo.id
+            ))
             
-            # 3. Crear los Pilotos, asignando el ID del equipo
+            # 4. Crear los Pilotos, asignando el ID del equipo
             for p_data in data["pilotos"]:
                 nuevo_piloto = Piloto(
                     nombre=p_data["nombre"],